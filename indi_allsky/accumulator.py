@@ -0,0 +1,325 @@
+import io
+import json
+import time
+import shutil
+from datetime import timedelta
+from pathlib import Path
+import logging
+
+from .keogram import KeogramGenerator
+from .starTrails import StarTrailGenerator
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyAccumulator(object):
+
+    checkpoint_interval = 20  # images
+
+
+    def __init__(self, config, bin_v, mask=None, shared_count_v=None):
+        self.config = config
+        self.bin_v = bin_v
+
+        self._mask = mask
+
+        # images accumulated by all image workers, the state is passed between workers in the checkpoint
+        self._shared_count_v = shared_count_v
+        self._shared_count = 0
+
+        self._key = None  # camera_id, dayDate, night
+        self._camera = None
+
+        self._kg = None
+        self._stg = None
+
+        self._image_id_list = list()
+        self._checkpoint_count = 0
+
+
+        if self.config.get('IMAGE_FOLDER'):
+            image_dir = Path(self.config['IMAGE_FOLDER']).absolute()
+        else:
+            image_dir = Path(__file__).parent.parent.joinpath('html', 'images').absolute()
+
+        self.accum_dir = image_dir.joinpath('accum')
+
+
+    def buildKeogramGenerator(self):
+        kg = KeogramGenerator(
+            self.config,
+        )
+        kg.angle = self.config['KEOGRAM_ANGLE']
+        kg.h_scale_factor = self.config['KEOGRAM_H_SCALE']
+        kg.v_scale_factor = self.config['KEOGRAM_V_SCALE']
+        kg.crop_top = self.config.get('KEOGRAM_CROP_TOP', 0)
+        kg.crop_bottom = self.config.get('KEOGRAM_CROP_BOTTOM', 0)
+
+        return kg
+
+
+    def buildStarTrailGenerator(self, camera, timelapse_dir=None):
+        stg = StarTrailGenerator(
+            self.config,
+            self.bin_v,
+            mask=self._mask,
+            timelapse_dir=timelapse_dir,
+        )
+        stg.max_adu = self.config['STARTRAILS_MAX_ADU']
+        stg.mask_threshold = self.config['STARTRAILS_MASK_THOLD']
+        stg.pixel_cutoff_threshold = self.config['STARTRAILS_PIXEL_THOLD']
+        stg.min_stars = self.config.get('STARTRAILS_MIN_STARS', 0)
+        stg.latitude = camera.latitude
+        stg.longitude = camera.longitude
+        stg.sun_alt_threshold = self.config['STARTRAILS_SUN_ALT_THOLD']
+
+        if self.config['STARTRAILS_MOONMODE_THOLD']:
+            stg.moonmode_alt = self.config['NIGHT_MOONMODE_ALT_DEG']
+            stg.moonmode_phase = self.config['NIGHT_MOONMODE_PHASE']
+        else:
+            stg.moon_alt_threshold = self.config['STARTRAILS_MOON_ALT_THOLD']
+            stg.moon_phase_threshold = self.config['STARTRAILS_MOON_PHASE_THOLD']
+
+        return stg
+
+
+    def getFolder(self, camera_id, dayDate, night):
+        if night:
+            timeofday = 'night'
+        else:
+            timeofday = 'day'
+
+        return self.accum_dir.joinpath('ccd{0:d}_{1:s}_{2:s}'.format(camera_id, dayDate.strftime('%Y%m%d'), timeofday))
+
+
+    def getTimelapseFolder(self, camera_id, dayDate, night):
+        return self.getFolder(camera_id, dayDate, night).joinpath('timelapse')
+
+
+    def _getCheckpointFolder(self, camera_id, dayDate, night):
+        accum_folder = self.getFolder(camera_id, dayDate, night)
+
+        checkpoint_p = accum_folder.joinpath('checkpoint')
+        if checkpoint_p.exists():
+            return checkpoint_p
+
+
+        # interrupted while replacing the checkpoint
+        checkpoint_old_p = accum_folder.joinpath('checkpoint_old')
+        if checkpoint_old_p.exists():
+            return checkpoint_old_p
+
+
+        return None
+
+
+    def getImageIds(self, camera_id, dayDate, night):
+        checkpoint_p = self._getCheckpointFolder(camera_id, dayDate, night)
+
+        if not checkpoint_p:
+            return None
+
+
+        try:
+            with io.open(str(checkpoint_p.joinpath('state.json')), 'r') as f_state:
+                state = json.load(f_state)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            logger.error('Invalid accumulator checkpoint: %s', str(e))
+            return None
+
+
+        return state['image_id_list']
+
+
+    def restore(self, camera_id, dayDate, night, kg, stg):
+        checkpoint_p = self._getCheckpointFolder(camera_id, dayDate, night)
+
+        if not checkpoint_p:
+            return
+
+
+        kg.restore(checkpoint_p)
+
+        if stg:
+            stg.restore(checkpoint_p)
+
+
+    def add(self, image_entry, image_p, image_data, camera, adu=None, star_count=None):
+        add_start = time.time()
+
+        key = (camera.id, image_entry.dayDate, bool(image_entry.night))
+
+        if self._isStale():
+            # another image worker accumulated images, continue from its checkpoint
+            self._key = None
+            self._shared_count = self._shared_count_v.value
+
+        if key != self._key:
+            if self._key:
+                # final checkpoint for the previous period
+                self.checkpoint()
+
+            self._start(key, camera)
+
+
+        self._kg.processImage(image_p, image_data)
+
+        if self._stg:
+            if self.config.get('STARTRAILS_USE_DB_DATA', True):
+                self._stg.processImage(image_p, image_data, adu=adu, star_count=star_count)
+            else:
+                self._stg.processImage(image_p, image_data)
+
+
+        self._image_id_list.append(image_entry.id)
+
+        add_elapsed_s = time.time() - add_start
+        logger.info('Keogram/star trail accumulated in %0.4f s', add_elapsed_s)
+
+
+        self._checkpoint_count += 1
+
+        if not isinstance(self._shared_count_v, type(None)):
+            # the next image may be accumulated by another worker
+            self.checkpoint()
+
+            self._shared_count_v.value += 1
+            self._shared_count = self._shared_count_v.value
+        elif self._checkpoint_count >= self.checkpoint_interval:
+            self.checkpoint()
+
+
+    def _isStale(self):
+        if isinstance(self._shared_count_v, type(None)):
+            return False
+
+        return self._shared_count_v.value != self._shared_count
+
+
+    def _start(self, key, camera):
+        camera_id, dayDate, night = key
+
+        self._key = key
+        self._camera = camera
+        self._image_id_list = list()
+        self._checkpoint_count = 0
+
+
+        self._kg = self.buildKeogramGenerator()
+
+        if night:
+            timelapse_dir_p = self.getTimelapseFolder(camera_id, dayDate, night)
+            if not timelapse_dir_p.exists():
+                timelapse_dir_p.mkdir(mode=0o755, parents=True)
+
+            self._stg = self.buildStarTrailGenerator(camera, timelapse_dir=timelapse_dir_p)
+        else:
+            self._stg = None
+
+
+        # continue after a restart
+        image_id_list = self.getImageIds(camera_id, dayDate, night)
+        if image_id_list:
+            logger.warning('Restoring keogram/star trail checkpoint with %d images', len(image_id_list))
+            self.restore(camera_id, dayDate, night, self._kg, self._stg)
+            self._image_id_list = image_id_list
+
+
+        self._expireFolders()
+
+
+    def checkpoint(self):
+        if not self._key:
+            return
+
+        if self._isStale():
+            # would overwrite the checkpoint of another worker
+            return
+
+        if not self._image_id_list:
+            return
+
+
+        checkpoint_start = time.time()
+
+        camera_id, dayDate, night = self._key
+        accum_folder = self.getFolder(camera_id, dayDate, night)
+
+        checkpoint_p = accum_folder.joinpath('checkpoint')
+        checkpoint_tmp_p = accum_folder.joinpath('checkpoint_tmp')
+        checkpoint_old_p = accum_folder.joinpath('checkpoint_old')
+
+
+        if checkpoint_tmp_p.exists():
+            shutil.rmtree(str(checkpoint_tmp_p))
+
+        checkpoint_tmp_p.mkdir(mode=0o755, parents=True)
+
+
+        self._kg.checkpoint(checkpoint_tmp_p)
+
+        if self._stg:
+            self._stg.checkpoint(checkpoint_tmp_p)
+
+
+        state = {
+            'image_id_list' : self._image_id_list,
+        }
+
+        with io.open(str(checkpoint_tmp_p.joinpath('state.json')), 'w') as f_state:
+            json.dump(state, f_state)
+
+
+        # replace the previous checkpoint
+        if checkpoint_old_p.exists():
+            shutil.rmtree(str(checkpoint_old_p))
+
+        if checkpoint_p.exists():
+            checkpoint_p.rename(checkpoint_old_p)
+
+        checkpoint_tmp_p.rename(checkpoint_p)
+
+        if checkpoint_old_p.exists():
+            shutil.rmtree(str(checkpoint_old_p))
+
+
+        self._checkpoint_count = 0
+
+        checkpoint_elapsed_s = time.time() - checkpoint_start
+        logger.info('Keogram/star trail checkpoint (%d images) in %0.4f s', len(self._image_id_list), checkpoint_elapsed_s)
+
+
+    def _expireFolders(self):
+        if not self.accum_dir.exists():
+            return
+
+
+        camera_id, dayDate, night = self._key
+
+        # the previous period may not be finalized yet
+        keep_list = [
+            self.getFolder(camera_id, dayDate, night).name,
+        ]
+
+        if night:
+            keep_list.append(self.getFolder(camera_id, dayDate, False).name)
+        else:
+            keep_list.append(self.getFolder(camera_id, dayDate - timedelta(days=1), True).name)
+
+
+        for f in self.accum_dir.iterdir():
+            if not f.is_dir():
+                continue
+
+            if not f.name.startswith('ccd{0:d}_'.format(camera_id)):
+                # other cameras
+                continue
+
+            if f.name in keep_list:
+                continue
+
+            logger.warning('Removing expired keogram/star trail checkpoint: %s', f)
+            shutil.rmtree(str(f))
@@ -21,6 +21,7 @@ from .version import __version__
 from .version import __config_level__
 
 from .config import IndiAllSkyConfig
+from .imageSequencer import IndiAllskyImageSequencer
 
 from . import constants
 
@@ -141,6 +142,13 @@ class IndiAllSky(object):
             -1.0,  # maximum
         ])
 
+        # image pipeline
+        # 0 pending frames
+        # 1 compute latency
+        # 2 write latency
+        # 3 persist latency
+        self.image_pipeline_av = Array('f', [0.0, 0.0, 0.0, 0.0])
+
         self.gain_v = Value('i', -1)  # value set in CCD config
         self.bin_v = Value('i', 1)  # set 1 for sane default
         self.night_v = Value('i', -1)  # bogus initial value
@@ -153,10 +161,14 @@ class IndiAllSky(object):
         self.capture_worker_idx = 0
 
         self.image_q = Queue()
-        self.image_error_q = Queue()
-        self.image_worker = None
+        self.image_worker_list = []
         self.image_worker_idx = 0
 
+        # frames are committed in capture order when there are multiple image workers
+        self.image_sequencer = IndiAllskyImageSequencer()
+
+        self._buildImageWorkerList()
+
         self.video_q = Queue()
         self.video_error_q = Queue()
         self.video_worker = None
@@ -170,6 +182,11 @@ class IndiAllSky(object):
         self.upload_worker_list = []
         self.upload_worker_idx = 0
 
+        self.mqtt_q = Queue()
+        self.mqtt_worker = None
+        self.mqtt_error_q = Queue()
+        self.mqtt_worker_idx = 0
+
         for x in range(self.config.get('UPLOAD_WORKERS', 1)):
             self.upload_worker_list.append({
                 'worker'  : None,
@@ -328,6 +345,7 @@ class IndiAllSky(object):
             self.sensors_user_av,
             self.night_v,
             self.moonmode_v,
+            pipeline_av=self.image_pipeline_av,
         )
         self.capture_worker.start()
 
@@ -349,15 +367,45 @@ class IndiAllSky(object):
         self.capture_worker.join()
 
 
-    def _startImageWorker(self):
+    def _getImageWorkerCount(self):
+        image_workers = int(self.config.get('IMAGE_WORKERS', 1))
+
+        if image_workers <= 1:
+            return 1
+
+        return image_workers
+
+
+    def _buildImageWorkerList(self):
+        # workers must be stopped
+        self.image_worker_list = []
+
+        image_workers = self._getImageWorkerCount()
+
+        # stacking and incremental keograms share their history through the sequencer
+        self.image_sequencer.worker_count_v.value = image_workers
+
+        for x in range(image_workers):
+            self.image_worker_list.append({
+                'worker'  : None,
+                'error_q' : Queue(),
+            })
+
+
+    def _startImageWorkers(self):
+        for image_worker_dict in self.image_worker_list:
+            self._imageWorkerStart(image_worker_dict)
+
+
+    def _imageWorkerStart(self, iw_dict):
         from .image import ImageWorker
 
-        if self.image_worker:
-            if self.image_worker.is_alive():
+        if iw_dict['worker']:
+            if iw_dict['worker'].is_alive():
                 return
 
             try:
-                image_error, image_traceback = self.image_error_q.get_nowait()
+                image_error, image_traceback = iw_dict['error_q'].get_nowait()
                 for line in image_traceback.split('\n'):
                     logger.error('Image worker exception: %s', line)
             except queue.Empty:
@@ -367,10 +415,10 @@ class IndiAllSky(object):
         self.image_worker_idx += 1
 
         logger.info('Starting Image-%d worker', self.image_worker_idx)
-        self.image_worker = ImageWorker(
+        iw_dict['worker'] = ImageWorker(
             self.image_worker_idx,
             self.config,
-            self.image_error_q,
+            iw_dict['error_q'],
             self.image_q,
             self.upload_q,
             self.position_av,
@@ -381,8 +429,11 @@ class IndiAllSky(object):
             self.sensors_user_av,
             self.night_v,
             self.moonmode_v,
+            sequencer=self.image_sequencer,
+            pipeline_av=self.image_pipeline_av,
+            mqtt_q=self.mqtt_q,
         )
-        self.image_worker.start()
+        iw_dict['worker'].start()
 
 
         if self.image_worker_idx % 10 == 0:
@@ -396,21 +447,33 @@ class IndiAllSky(object):
                 )
 
 
-    def _stopImageWorker(self):
-        if not self.image_worker:
-            return
+    def _stopImageWorkers(self):
+        active_worker_list = list()
+        for image_worker_dict in self.image_worker_list:
+            if not image_worker_dict['worker']:
+                continue
 
-        if not self.image_worker.is_alive():
-            return
+            if not image_worker_dict['worker'].is_alive():
+                continue
 
-        if self._terminate:
-            logger.info('Terminating Image worker')
-            self.image_worker.terminate()
+            if self._terminate:
+                logger.info('Terminating Image worker')
+                image_worker_dict['worker'].terminate()
+
+            active_worker_list.append(image_worker_dict)
 
+            # need to put the stops in the queue before waiting on workers to join
+            self.image_q.put({'stop' : True})
+
+
+        for image_worker_dict in active_worker_list:
+            self._imageWorkerStop(image_worker_dict)
+
+
+    def _imageWorkerStop(self, iw_dict):
         logger.info('Stopping Image worker')
 
-        self.image_q.put({'stop' : True})
-        self.image_worker.join()
+        iw_dict['worker'].join()
 
 
     def _startVideoWorker(self):
@@ -524,6 +587,62 @@ class IndiAllSky(object):
         self.sensor_worker.join()
 
 
+    def _startMqttWorker(self):
+        from .mqttPublisher import MqttPublisher
+
+        if not self.config.get('MQTTPUBLISH', {}).get('ENABLE'):
+            return
+
+
+        if self.mqtt_worker:
+            if self.mqtt_worker.is_alive():
+                return
+
+
+            try:
+                mqtt_error, mqtt_traceback = self.mqtt_error_q.get_nowait()
+                for line in mqtt_traceback.split('\n'):
+                    logger.error('Mqtt worker exception: %s', line)
+            except queue.Empty:
+                pass
+
+
+        self.mqtt_worker_idx += 1
+
+        logger.info('Starting Mqtt-%d worker', self.mqtt_worker_idx)
+        self.mqtt_worker = MqttPublisher(
+            self.mqtt_worker_idx,
+            self.config,
+            self.mqtt_error_q,
+            self.mqtt_q,
+        )
+        self.mqtt_worker.start()
+
+
+        if self.mqtt_worker_idx % 10 == 0:
+            # notify if worker is restarted more than 10 times
+            with app.app_context():
+                self._miscDb.addNotification(
+                    NotificationCategory.WORKER,
+                    'MqttPublisher',
+                    'WARNING: MqttPublisher was restarted more than 10 times',
+                    expire=timedelta(hours=2),
+                )
+
+
+    def _stopMqttWorker(self):
+        if not self.mqtt_worker:
+            return
+
+        if not self.mqtt_worker.is_alive():
+            return
+
+        logger.info('Stopping Mqtt worker')
+
+        self.mqtt_worker.stop()
+        self.mqtt_worker.join()
+
+
     def _startFileUploadWorkers(self):
         for upload_worker_dict in self.upload_worker_list:
             self._fileUploadWorkerStart(upload_worker_dict)
@@ -614,10 +733,13 @@ class IndiAllSky(object):
             if self._shutdown:
                 logger.warning('Shutting down')
                 self._stopCaptureWorker()  # stop this first so image queue is cleared out
-                self._stopImageWorker()
+                self._stopImageWorkers()
                 self._stopVideoWorker()
                 self._stopSensorWorker()
                 self._stopFileUploadWorkers()
+                self._stopMqttWorker()
+
+                self.image_sequencer.stack_history.cleanup()
 
 
                 with app.app_context():
@@ -636,10 +758,11 @@ class IndiAllSky(object):
                 logger.warning('Restarting processes')
                 self._reload = False
                 self._stopCaptureWorker()  # stop this first so image queue is cleared out
-                self._stopImageWorker()
+                self._stopImageWorkers()
                 self._stopVideoWorker()
                 self._stopSensorWorker()
                 self._stopFileUploadWorkers()
+                self._stopMqttWorker()
                 # processes will start at the next loop
 
                 with app.app_context():
@@ -651,10 +774,11 @@ class IndiAllSky(object):
 
             # restart worker if it has failed
             self._startCaptureWorker()
-            self._startImageWorker()
+            self._startImageWorkers()
             self._startVideoWorker()
             self._startSensorWorker()
             self._startFileUploadWorkers()
+            self._startMqttWorker()
 
 
             # Queue externally defined tasks
@@ -675,6 +799,10 @@ class IndiAllSky(object):
         self.config = self._config_obj.config
 
 
+        # IMAGE_WORKERS may have changed, the image workers are already stopped
+        self._buildImageWorkerList()
+
+
         if __config_level__ != self._config_obj.config_level:
             logger.error('indi-allsky version does not match config, please rerun setup.sh')
 
@@ -0,0 +1,228 @@
+from pathlib import Path
+from collections import OrderedDict
+import hashlib
+import tempfile
+import time
+import numpy
+import logging
+
+from .flask.models import IndiAllSkyDbStateTable
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyCalibrationCache(object):
+
+    generation_key = 'CALIBRATION_GENERATION'
+
+
+    def __init__(self, config):
+        self.config = config
+
+        # keys are ordered from least to most recently used
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+
+        self._generation = None
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        self._memory_limit = int(self.config.get('IMAGE_CALIBRATE_CACHE_MB', 256)) * 1024 * 1024
+        self._mmap = bool(self.config.get('IMAGE_CALIBRATE_CACHE_MMAP', False))
+
+
+        if self.config.get('IMAGE_FOLDER'):
+            image_dir = Path(self.config['IMAGE_FOLDER']).absolute()
+        else:
+            image_dir = Path(__file__).parent.parent.joinpath('html', 'images').absolute()
+
+        self.cache_dir = image_dir.joinpath('darks', 'cache')
+
+
+    @property
+    def enabled(self):
+        return self._memory_limit > 0
+
+    @enabled.setter
+    def enabled(self, *args):
+        pass  # read only
+
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @hits.setter
+    def hits(self, *args):
+        pass  # read only
+
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @misses.setter
+    def misses(self, *args):
+        pass  # read only
+
+
+    def get(self, key, filenames):
+        if not self.enabled:
+            return None
+
+
+        self.checkGeneration()
+
+
+        entry = self._cache.get(key)
+
+        if isinstance(entry, type(None)):
+            self._misses += 1
+            logger.info('Calibration cache miss (%d hits, %d misses)', self._hits, self._misses)
+            return None
+
+
+        if entry['filenames'] != filenames:
+            # database ids can be reused after darks are flushed
+            logger.warning('Calibration cache entry is stale, reloading')
+            self._remove(key)
+            self._misses += 1
+            return None
+
+
+        self._cache.move_to_end(key)
+
+        self._hits += 1
+        logger.info('Calibration cache hit (%d hits, %d misses)', self._hits, self._misses)
+
+        return entry['data']
+
+
+    def put(self, key, master_dark, filenames):
+        if not self.enabled:
+            return master_dark
+
+
+        if master_dark.nbytes > self._memory_limit:
+            logger.warning('Master dark exceeds calibration cache budget, not caching')
+            return master_dark
+
+
+        if key in self._cache:
+            self._remove(key)
+
+
+        # make room for the new entry
+        while self._cache and (self._cache_bytes + master_dark.nbytes) > self._memory_limit:
+            old_key = next(iter(self._cache))
+            self._remove(old_key)
+            self._evictions += 1
+            logger.info('Calibration cache evicted master dark (%d evictions)', self._evictions)
+
+
+        mmap_p = None
+        if self._mmap:
+            try:
+                master_dark, mmap_p = self._memmap(master_dark, filenames)
+            except OSError as e:
+                logger.error('Unable to memory map master dark: %s', str(e))
+
+
+        # cached data is shared between frames
+        master_dark.flags.writeable = False
+
+
+        self._cache[key] = {
+            'data'      : master_dark,
+            'filenames' : filenames,
+            'nbytes'    : master_dark.nbytes,
+            'mmap_p'    : mmap_p,
+        }
+        self._cache_bytes += master_dark.nbytes
+
+        logger.info('Calibration cache: %d entries, %0.1f MB', len(self._cache), self._cache_bytes / 1024 / 1024)
+
+        return master_dark
+
+
+    def clear(self):
+        for key in list(self._cache.keys()):
+            self._remove(key)
+
+
+        if self._mmap and self.cache_dir.exists():
+            # other processes may also have data mapped, unlinking is safe
+            for f in self.cache_dir.glob('master_*.npy'):
+                try:
+                    f.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+    def checkGeneration(self):
+        ### darks.py and the web interface update the generation when calibration frames change
+        generation_entry = IndiAllSkyDbStateTable.query\
+            .filter(IndiAllSkyDbStateTable.key == self.generation_key)\
+            .first()
+
+        if generation_entry:
+            generation = generation_entry.value
+        else:
+            generation = ''
+
+
+        if isinstance(self._generation, type(None)):
+            # first check
+            self._generation = generation
+            return
+
+
+        if generation == self._generation:
+            return
+
+
+        logger.warning('Calibration frames updated, clearing calibration cache')
+        self._generation = generation
+        self.clear()
+
+
+    def _remove(self, key):
+        entry = self._cache.pop(key)
+        self._cache_bytes -= entry['nbytes']
+
+        if entry['mmap_p']:
+            try:
+                entry['mmap_p'].unlink()
+            except FileNotFoundError:
+                pass
+
+
+    def _memmap(self, master_dark, filenames):
+        if not self.cache_dir.exists():
+            self.cache_dir.mkdir(mode=0o755, parents=True)
+
+
+        # dark filenames include a timestamp, so the hash will not be reused
+        name_hash = hashlib.md5('|'.join([str(x) for x in filenames]).encode()).hexdigest()
+        mmap_p = self.cache_dir.joinpath('master_{0:s}.npy'.format(name_hash))
+
+
+        if not mmap_p.exists():
+            mmap_start = time.time()
+
+            f_tmp_npy = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.tmp', delete=False)
+            numpy.save(f_tmp_npy, master_dark)
+            f_tmp_npy.flush()
+            f_tmp_npy.close()
+
+            # atomic rename
+            Path(f_tmp_npy.name).rename(mmap_p)
+
+            mmap_elapsed_s = time.time() - mmap_start
+            logger.info('Wrote memory mapped master dark in %0.4f s: %s', mmap_elapsed_s, mmap_p)
+
+
+        return numpy.load(str(mmap_p), mmap_mode='r'), mmap_p
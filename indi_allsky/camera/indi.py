@@ -12,6 +12,8 @@ import PyIndi
 
 from .fake_indi import FakeIndiCcd
 
+from ..frameBuffer import IndiAllskyFrameBuffer
+
 #from ..flask import db
 from ..flask import create_app
 
@@ -119,6 +121,10 @@ class IndiClient(PyIndi.BaseClient):
 
         self._disconnected = False
 
+        # frames are passed to the image worker in shared memory when the buffer size is known
+        self._frame_buffer = None
+        self._frame_buffer_size = 0
+
         logger.info('creating an instance of IndiClient')
 
         pyindi_version = '.'.join((
@@ -129,6 +135,15 @@ class IndiClient(PyIndi.BaseClient):
         logger.info('PyIndi version: %s', pyindi_version)
 
 
+    @property
+    def frame_buffer_size(self):
+        return self._frame_buffer_size
+
+    @frame_buffer_size.setter
+    def frame_buffer_size(self, new_frame_buffer_size):
+        self._frame_buffer_size = int(new_frame_buffer_size)
+
+
     @property
     def disconnected(self):
         return self._disconnected
@@ -297,17 +312,24 @@ class IndiClient(PyIndi.BaseClient):
         blobfile = io.BytesIO(imgdata)
         hdulist = fits.open(blobfile)
 
-        try:
-            f_tmpfile = tempfile.NamedTemporaryFile(mode='w+b', delete=False, suffix='.fit')
-            f_tmpfile_p = Path(f_tmpfile.name)
 
-            hdulist.writeto(f_tmpfile)
+        frame = self._putFrameBuffer(hdulist)
 
-            f_tmpfile.flush()
-            f_tmpfile.close()
-        except OSError as e:
-            logger.error('OSError: %s', str(e))
-            return
+        if frame:
+            f_tmpfile_p = None
+        else:
+            # fallback to a temporary fits file
+            try:
+                f_tmpfile = tempfile.NamedTemporaryFile(mode='w+b', delete=False, suffix='.fit')
+                f_tmpfile_p = Path(f_tmpfile.name)
+
+                hdulist.writeto(f_tmpfile)
+
+                f_tmpfile.flush()
+                f_tmpfile.close()
+            except OSError as e:
+                logger.error('OSError: %s', str(e))
+                return
 
 
         #elapsed_s = time.time() - start
@@ -317,7 +339,8 @@ class IndiClient(PyIndi.BaseClient):
 
         ### process data in worker
         jobdata = {
-            'filename'    : str(f_tmpfile_p),
+            'filename'    : str(f_tmpfile_p) if f_tmpfile_p else None,
+            'frame'       : frame,
             'exposure'    : self._exposure,
             'exp_time'    : datetime.timestamp(exp_date),  # datetime objects are not json serializable
             'exp_elapsed' : exposure_elapsed_s,
@@ -342,6 +365,43 @@ class IndiClient(PyIndi.BaseClient):
         self.image_q.put(jobdata)
 
 
+    def _putFrameBuffer(self, hdulist):
+        if not self._frame_buffer_size:
+            return None
+
+
+        if not self._frame_buffer:
+            try:
+                self._frame_buffer = IndiAllskyFrameBuffer.create(
+                    self._frame_buffer_size,
+                    self.config.get('IMAGE_QUEUE_MAX', 3) + 1,
+                )
+            except OSError as e:
+                logger.error('Unable to create frame buffer: %s', str(e))
+                self._frame_buffer_size = 0  # do not try again
+                return None
+
+
+        frame = self._frame_buffer.put(hdulist[0].data)
+
+        if not frame:
+            return None
+
+
+        # the header is sent with the job, the pixel data stays in shared memory
+        frame['header'] = hdulist[0].header.tostring()
+
+        return frame
+
+
+    def closeFrameBuffer(self):
+        if not self._frame_buffer:
+            return
+
+        self._frame_buffer.unlink()
+        self._frame_buffer = None
+
+
     def newMessage(self, d, m):
         logger.info("new Message %s", d.messageQueue(m))
 
@@ -5,7 +5,12 @@ from collections import OrderedDict
 import time
 import tempfile
 import json
+import signal
 import subprocess
+import queue
+from threading import Thread
+from threading import Event
+from collections import deque
 import psutil
 from pathlib import Path
 import logging
@@ -22,6 +27,13 @@ logger = logging.getLogger('indi_allsky')
 
 class IndiClientLibCameraGeneric(IndiClient):
 
+    # maximum time for the camera to start before the first signal is sent
+    session_start_timeout = 15.0
+
+    # logged for every viewfinder frame with --verbose 2, the signal is checked between these frames
+    session_ready_marker = 'Viewfinder frame'
+
+
     def __init__(self, *args, **kwargs):
         super(IndiClientLibCameraGeneric, self).__init__(*args, **kwargs)
 
@@ -47,6 +59,16 @@ class IndiClientLibCameraGeneric(IndiClient):
         self.current_exposure_file_p = None
         self.current_metadata_file_p = None
 
+        # persistent capture session
+        self._last_cmd = None
+        self._session_cmd = None
+        self._session_dir_p = None
+        self._session_frame = 0
+        self._session_metadata_q = None
+        self._session_reader = None
+        self._session_ready = None
+        self._session_output = deque(maxlen=20)
+
         memory_info = psutil.virtual_memory()
         self.memory_total_mb = memory_info[0] / 1024.0 / 1024.0
 
@@ -165,27 +187,21 @@ class IndiClientLibCameraGeneric(IndiClient):
         if image_type in ['dng']:
             cmd = [
                 self.ccd_device.driver_exec,
-                '--immediate',
                 '--nopreview',
                 '--raw',
                 '--denoise', 'off',
                 '--gain', '{0:d}'.format(self.gain_v.value),
                 '--shutter', '{0:d}'.format(exposure_us),
-                '--metadata', str(metadata_tmp_p),
-                '--metadata-format', 'json',
             ]
         elif image_type in ['jpg', 'png']:
             #logger.warning('RAW frame mode disabled due to low memory resources')
             cmd = [
                 self.ccd_device.driver_exec,
-                '--immediate',
                 '--nopreview',
                 '--encoding', '{0:s}'.format(image_type),
                 '--quality', '95',
                 '--gain', '{0:d}'.format(self.gain_v.value),
                 '--shutter', '{0:d}'.format(exposure_us),
-                '--metadata', str(metadata_tmp_p),
-                '--metadata-format', 'json',
             ]
         else:
             raise Exception('Invalid image type')
@@ -238,6 +254,28 @@ class IndiClientLibCameraGeneric(IndiClient):
                 cmd.extend(extra_options.split(' '))
 
 
+        if self.config.get('LIBCAMERA', {}).get('PERSISTENT'):
+            # the exposure and gain cannot be changed in a running session
+            # a session is only started when the settings repeat, single captures are used while the exposure is changing
+            settings_stable = cmd == self._last_cmd
+            self._last_cmd = cmd
+
+            if cmd == self._session_cmd or settings_stable:
+                self.current_metadata_file_p = None
+                self._sessionExposure(cmd, image_type, sync=sync, timeout=timeout)
+                return
+
+
+        self._stopLibCameraSession()
+
+
+        cmd.extend([
+            '--immediate',
+            '--metadata', str(metadata_tmp_p),
+            '--metadata-format', 'json',
+        ])
+
+
         # Finally add output file
         cmd.extend(['--output', str(image_tmp_p)])
 
@@ -286,6 +324,10 @@ class IndiClientLibCameraGeneric(IndiClient):
 
     def getCcdExposureStatus(self):
         # returns camera_ready, exposure_state
+        if self._session_cmd:
+            return self._getSessionExposureStatus()
+
+
         if self._libCameraPidRunning():
             return False, 'BUSY'
 
@@ -312,30 +354,31 @@ class IndiClientLibCameraGeneric(IndiClient):
         return True, 'READY'
 
 
-    def _processMetadata(self):
+    def _processMetadata(self, metadata_dict=None):
         # read metadata to get sensor temperature
-        if self.current_metadata_file_p:
-            try:
-                with io.open(self.current_metadata_file_p, 'r') as f_metadata:
-                    metadata_dict = json.loads(f_metadata.read(), object_pairs_hook=OrderedDict)
-            except FileNotFoundError as e:
-                logger.error('Metadata file not found: %s', str(e))
-                metadata_dict = dict()
-            except PermissionError as e:
-                logger.error('Permission erro: %s', str(e))
-                metadata_dict = dict()
-            except json.JSONDecodeError as e:
-                logger.error('Error decoding json: %s', str(e))
-                metadata_dict = dict()
+        if isinstance(metadata_dict, type(None)):
+            # persistent sessions deliver the metadata over the pipe
+            metadata_dict = dict()
 
+            if self.current_metadata_file_p:
+                try:
+                    with io.open(self.current_metadata_file_p, 'r') as f_metadata:
+                        metadata_dict = json.loads(f_metadata.read(), object_pairs_hook=OrderedDict)
+                except FileNotFoundError as e:
+                    logger.error('Metadata file not found: %s', str(e))
+                except PermissionError as e:
+                    logger.error('Permission erro: %s', str(e))
+                except json.JSONDecodeError as e:
+                    logger.error('Error decoding json: %s', str(e))
 
-        #logger.info('Metadata: %s', metadata_dict)
 
+                try:
+                    self.current_metadata_file_p.unlink()
+                except FileNotFoundError:
+                    pass
 
-        try:
-            self.current_metadata_file_p.unlink()
-        except FileNotFoundError:
-            pass
+
+        #logger.info('Metadata: %s', metadata_dict)
 
 
         ### Temperature
@@ -434,6 +477,12 @@ class IndiClientLibCameraGeneric(IndiClient):
 
         self.active_exposure = False
 
+        if self._session_cmd:
+            # a hung session is restarted with the next exposure
+            self._stopLibCameraSession()
+            return
+
+
         for x in range(5):
             if self._libCameraPidRunning():
                 self.libcamera_process.terminate()
@@ -479,6 +528,229 @@ class IndiClientLibCameraGeneric(IndiClient):
         self.image_q.put(jobdata)
 
 
+    def _sessionExposure(self, cmd, image_type, sync=False, timeout=None):
+        ### One libcamera-still process is kept running in signal mode, each SIGUSR1 captures a frame
+        # the exposure settings are fixed when the process starts, the session is restarted when they change
+
+        if cmd != self._session_cmd or not self._libCameraPidRunning():
+            self._stopLibCameraSession()
+
+            try:
+                self._startLibCameraSession(cmd, image_type)
+            except OSError as e:
+                logger.error('OSError: %s', str(e))
+                return
+
+
+        self.current_exposure_file_p = self._session_dir_p.joinpath('frame{0:05d}.{1:s}'.format(self._session_frame, image_type))
+        self._session_frame += 1
+
+
+        self.exposureStartTime = time.time()
+
+        self.libcamera_process.send_signal(signal.SIGUSR1)
+
+        self.active_exposure = True
+
+        if sync:
+            try:
+                metadata_dict = self._session_metadata_q.get(timeout=timeout)
+            except queue.Empty:
+                logger.error('Exposure timeout')
+                raise TimeOutException('Timeout waiting for exposure')
+
+            self.active_exposure = False
+
+            self._sessionFrameReady(metadata_dict)
+
+
+    def _getSessionExposureStatus(self):
+        if not self.active_exposure:
+            return True, 'READY'
+
+
+        try:
+            metadata_dict = self._session_metadata_q.get_nowait()
+        except queue.Empty:
+            if self._libCameraPidRunning():
+                return False, 'BUSY'
+
+
+            # the session exited before the frame was delivered
+            logger.error('libcamera-still session exited: %s', str(self.libcamera_process.returncode))
+            for line in self._session_output:
+                logger.error('libcamera-still error: %s', line)
+
+            self.active_exposure = False
+            self._stopLibCameraSession()
+
+            return True, 'READY'
+
+
+        self.active_exposure = False
+
+        self._sessionFrameReady(metadata_dict)
+
+        return True, 'READY'
+
+
+    def _sessionFrameReady(self, metadata_dict):
+        # the metadata is written after the image is saved
+        frame_p = self.current_exposure_file_p
+
+        try:
+            # move the frame out of the session folder, the image worker removes the file
+            image_tmp_f = tempfile.NamedTemporaryFile(mode='w', suffix=frame_p.suffix, delete=True)
+            image_tmp_f.close()
+            image_tmp_p = Path(image_tmp_f.name)
+
+            frame_p.rename(image_tmp_p)
+        except FileNotFoundError:
+            logger.error('libcamera-still frame not found: %s', frame_p)
+            return
+        except OSError as e:
+            logger.error('OSError: %s', str(e))
+            return
+
+
+        self.current_exposure_file_p = image_tmp_p
+
+        self._processMetadata(metadata_dict=metadata_dict)
+
+        self._queueImage()
+
+
+    def _startLibCameraSession(self, cmd, image_type):
+        self._session_dir_p = Path(tempfile.mkdtemp(prefix='libcamera_'))
+        self._session_frame = 0
+
+        session_cmd = list(cmd)
+        session_cmd.extend([
+            '--signal',
+            '--verbose', '2',  # viewfinder frames indicate the camera is running
+            '--timeout', '0',
+            '--framestart', '0',
+            '--metadata', '-',
+            '--metadata-format', 'json',
+            '--output', str(self._session_dir_p.joinpath('frame%05d.{0:s}'.format(image_type))),
+        ])
+
+        logger.info('session command: %s', ' '.join(session_cmd))
+
+
+        self.libcamera_process = subprocess.Popen(
+            session_cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            universal_newlines=True,
+        )
+
+        self._session_cmd = cmd
+
+        self._session_metadata_q = queue.Queue()
+        self._session_ready = Event()
+        self._session_output.clear()
+
+        self._session_reader = Thread(
+            target=self._readLibCameraSession,
+            args=(self.libcamera_process.stdout, self._session_metadata_q, self._session_output, self._session_ready),
+            daemon=True,
+        )
+        self._session_reader.start()
+
+
+        # a signal sent before the camera is running terminates the process
+        start = time.time()
+
+        while not self._session_ready.wait(timeout=0.1):
+            if not self._libCameraPidRunning():
+                logger.error('libcamera-still session exited: %s', str(self.libcamera_process.returncode))
+                for line in self._session_output:
+                    logger.error('libcamera-still error: %s', line)
+
+                break
+
+            if time.time() - start > self.session_start_timeout:
+                logger.error('libcamera-still session not ready after %0.1fs', self.session_start_timeout)
+                break
+        else:
+            logger.info('libcamera-still session ready in %0.4f s', time.time() - start)
+
+
+    def _readLibCameraSession(self, stdout, metadata_q, output, ready):
+        # metadata objects are separated from the log messages on the shared pipe
+        buf = list()
+
+        for line in stdout:
+            if not buf and not line.lstrip().startswith('{'):
+                if self.session_ready_marker in line:
+                    ready.set()
+                    continue
+
+                output.append(line.rstrip())
+                continue
+
+
+            buf.append(line)
+
+            if not line.rstrip().endswith('}'):
+                continue
+
+
+            try:
+                metadata_dict = json.loads(''.join(buf), object_pairs_hook=OrderedDict)
+            except json.JSONDecodeError:
+                if len(buf) > 1000:
+                    logger.error('Unable to decode libcamera metadata')
+                    buf = list()
+
+                continue
+
+
+            metadata_q.put(metadata_dict)
+            buf = list()
+
+
+    def _stopLibCameraSession(self):
+        if not self._session_cmd:
+            return
+
+
+        logger.warning('Stopping libcamera-still session')
+
+        for x in range(5):
+            if self._libCameraPidRunning():
+                self.libcamera_process.terminate()
+                time.sleep(0.5)
+                continue
+            else:
+                break
+
+        else:
+            self.libcamera_process.kill()
+            self.libcamera_process.wait()
+
+
+        if self._session_reader:
+            self._session_reader.join(timeout=5.0)
+
+
+        shutil.rmtree(str(self._session_dir_p), ignore_errors=True)
+
+
+        self._session_cmd = None
+        self._session_dir_p = None
+        self._session_metadata_q = None
+        self._session_reader = None
+        self._session_ready = None
+
+
+    def disconnectServer(self, *args, **kwargs):
+        self._stopLibCameraSession()
+
+        super(IndiClientLibCameraGeneric, self).disconnectServer(*args, **kwargs)
+
+
     def _libCameraPidRunning(self):
         if not self.libcamera_process:
             return False
@@ -67,6 +67,7 @@ class CaptureWorker(Process):
         sensors_user_av,
         night_v,
         moonmode_v,
+        pipeline_av=None,
     ):
 
         super(CaptureWorker, self).__init__()
@@ -91,6 +92,8 @@ class CaptureWorker(Process):
         self.night_v = night_v
         self.moonmode_v = moonmode_v
 
+        self.pipeline_av = pipeline_av  # pending frames, compute, write, persist
+
         self._miscDb = miscDb(self.config)
 
         self.indiclient = None
@@ -172,6 +175,9 @@ class CaptureWorker(Process):
             tb = traceback.format_exc()
             self.error_q.put((str(e), tb))
             raise e
+        finally:
+            if self.indiclient:
+                self.indiclient.closeFrameBuffer()
 
 
 
@@ -412,7 +418,16 @@ class CaptureWorker(Process):
 
                         # if the image queue grows too large, introduce delays to new exposures
                         image_queue_size = self.image_q.qsize()
-                        logger.info('Image queue depth: %d', image_queue_size)
+
+                        if self.pipeline_av:
+                            # frames waiting to be saved are still in progress
+                            pipeline_pending = max(int(self.pipeline_av[0]), 0)
+                            logger.info('Image queue depth: %d (pipeline: %d)', image_queue_size, pipeline_pending)
+                            logger.info('Image stages - compute: %0.4f s, write: %0.4f s, persist: %0.4f s', self.pipeline_av[1], self.pipeline_av[2], self.pipeline_av[3])
+
+                            image_queue_size += pipeline_pending
+                        else:
+                            logger.info('Image queue depth: %d', image_queue_size)
 
                         if image_queue_size <= self.image_queue_min:
                             if self.add_period_delay > 0:
@@ -621,6 +636,20 @@ class CaptureWorker(Process):
             cfa_pattern = ccd_info['CCD_CFA']['CFA_TYPE'].get('text')
 
 
+        if self.config.get('IMAGE_SHARED_MEMORY', True):
+            # frame buffer slots are sized for a full resolution raw frame
+            ccd_width = int(ccd_info.get('CCD_FRAME', {}).get('WIDTH', {}).get('max', 0))
+            ccd_height = int(ccd_info.get('CCD_FRAME', {}).get('HEIGHT', {}).get('max', 0))
+            ccd_bits = int(ccd_info.get('CCD_INFO', {}).get('CCD_BITSPERPIXEL', {}).get('current', 16))
+
+            if ccd_bits > 8:
+                ccd_bytes = 2
+            else:
+                ccd_bytes = 1
+
+            self.indiclient.frame_buffer_size = ccd_width * ccd_height * ccd_bytes
+
+
         # populate S3 data
         s3_data = {
             'host'      : self.config['S3UPLOAD'].get('HOST', ''),
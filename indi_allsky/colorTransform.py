@@ -0,0 +1,107 @@
+import time
+import cv2
+import numpy
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyColorTransform(object):
+
+    ### Manual white balance, auto white balance and saturation composed into a single pass
+    # gains only are applied with a per-channel lookup table, saturation requires a 3x3 matrix
+
+    # BGR luma weights (Rec. 601)
+    luma_bgr = numpy.array([0.114, 0.587, 0.299], dtype=numpy.float32)
+
+
+    def __init__(self, config):
+        self.config = config
+
+        # lookup tables are reused while the gains do not change
+        self._lut_gains = None
+        self._lut = None
+
+
+    def gains(self, image):
+        wb_gains = numpy.array([
+            float(self.config.get('WBB_FACTOR', 1.0)),
+            float(self.config.get('WBG_FACTOR', 1.0)),
+            float(self.config.get('WBR_FACTOR', 1.0)),
+        ], dtype=numpy.float64)
+
+
+        if not self.config.get('AUTO_WB'):
+            return wb_gains
+
+
+        # the channel means after the manual white balance (ignoring clipping)
+        channel_means = numpy.array(cv2.mean(image)[:3]) * wb_gains
+
+        k = numpy.mean(channel_means)
+
+        # zero channels are treated as 0.1, same as the per-step method
+        channel_means[channel_means == 0] = 0.1
+
+        return wb_gains * (k / channel_means)
+
+
+    def matrix(self, image):
+        gains = self.gains(image)
+
+        SATURATION_FACTOR = float(self.config.get('SATURATION_FACTOR', 1.0))
+
+        # saturation is scaled around the luma of each pixel
+        sat_matrix = (numpy.eye(3) * SATURATION_FACTOR) + (numpy.outer(numpy.ones(3), self.luma_bgr) * (1.0 - SATURATION_FACTOR))
+
+        return sat_matrix @ numpy.diag(gains)
+
+
+    def apply(self, image):
+        if len(image.shape) == 2:
+            # mono
+            return image
+
+
+        SATURATION_FACTOR = float(self.config.get('SATURATION_FACTOR', 1.0))
+
+        transform_start = time.time()
+
+        if SATURATION_FACTOR == 1.0:
+            gains = self.gains(image)
+
+            if numpy.all(gains == 1.0):
+                # no action
+                return image
+
+
+            if image.dtype == numpy.uint8:
+                image = cv2.LUT(image, self._getLut(gains))
+            else:
+                image = cv2.multiply(image, tuple(gains) + (1.0,))
+        else:
+            image = cv2.transform(image, self.matrix(image))
+
+
+        transform_elapsed_s = time.time() - transform_start
+        logger.info('Color transform in %0.4f s', transform_elapsed_s)
+
+        return image
+
+
+    def _getLut(self, gains):
+        gains_key = tuple(gains)
+
+        if gains_key == self._lut_gains:
+            return self._lut
+
+
+        # rounding matches cv2.multiply()
+        levels = numpy.arange(256, dtype=numpy.float64)
+        lut = numpy.clip(numpy.round(numpy.outer(levels, gains)), 0, 255).astype(numpy.uint8)
+
+        self._lut = lut.reshape((1, 256, 3))
+        self._lut_gains = gains_key
+
+        return self._lut
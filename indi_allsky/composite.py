@@ -0,0 +1,183 @@
+import time
+import numpy
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyComposite(object):
+
+    ### Image circle mask and logo overlay applied in a single pass
+    # the layers are reduced to a multiplier and a premultiplied overlay, the frame is split into tiles
+    # tiles that are not changed are skipped, fully covered tiles are copied, only the remaining tiles are blended
+
+    def __init__(self, tile_size=64):
+        self.tile_size = int(tile_size)
+
+        self._shape = None
+
+        self._fill_list = list()   # (y1, y2, x1, x2, overlay)
+        self._blend_list = list()  # (y1, y2, x1, x2, multiplier, overlay)
+
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @shape.setter
+    def shape(self, *args):
+        pass  # read only
+
+
+    def build(self, shape, circle_mask=None, outline_mask=None, outline_color=64, overlay=None, overlay_alpha=None):
+        ### all masks are single channel uint8, 255 is opaque
+        build_start = time.time()
+
+        image_height, image_width = shape[:2]
+
+
+        # fraction of the original image that is kept
+        keep = numpy.ones((image_height, image_width), dtype=numpy.float32)
+
+        # premultiplied overlay
+        if len(shape) == 3:
+            premult = numpy.zeros((image_height, image_width, shape[2]), dtype=numpy.float32)
+        else:
+            premult = numpy.zeros((image_height, image_width), dtype=numpy.float32)
+
+
+        if not isinstance(circle_mask, type(None)):
+            keep *= circle_mask / 255
+
+        if not isinstance(outline_mask, type(None)):
+            # the outline is drawn over the circle mask
+            outline = outline_mask > 0
+            keep[outline] = 0
+            premult[outline] = outline_color
+
+        if not isinstance(overlay, type(None)):
+            alpha = overlay_alpha / 255
+
+            keep *= 1 - alpha
+
+            if len(premult.shape) == 3:
+                alpha = alpha[:, :, numpy.newaxis]
+
+            premult *= 1 - alpha
+            premult += overlay * alpha
+
+
+        multiplier = numpy.round(keep * 255).astype(numpy.uint8)
+        premult = numpy.round(premult).astype(numpy.uint8)
+
+
+        self._fill_list = list()
+        self._blend_list = list()
+
+        # adjacent tiles of the same type are merged into runs
+        for y1 in range(0, image_height, self.tile_size):
+            y2 = min(y1 + self.tile_size, image_height)
+
+            run_type = None
+            run_x1 = 0
+
+            for x1 in range(0, image_width, self.tile_size):
+                x2 = min(x1 + self.tile_size, image_width)
+
+                tile_type = self._tileType(multiplier[y1:y2, x1:x2], premult[y1:y2, x1:x2])
+
+                if tile_type != run_type:
+                    self._addRun(run_type, y1, y2, run_x1, x1, multiplier, premult)
+                    run_type = tile_type
+                    run_x1 = x1
+
+            self._addRun(run_type, y1, y2, run_x1, image_width, multiplier, premult)
+
+
+        self._shape = shape
+
+
+        cached_bytes = 0
+        for fill in self._fill_list:
+            if not isinstance(fill[4], type(None)):
+                cached_bytes += fill[4].nbytes
+
+        for blend in self._blend_list:
+            cached_bytes += blend[4].nbytes
+            if not isinstance(blend[5], type(None)):
+                cached_bytes += blend[5].nbytes
+
+
+        build_elapsed_s = time.time() - build_start
+        logger.info(
+            'Composite built in %0.4f s: %d fill regions, %d blend regions, %0.1f MB',
+            build_elapsed_s,
+            len(self._fill_list),
+            len(self._blend_list),
+            cached_bytes / 1024 / 1024,
+        )
+
+
+    def apply(self, image):
+        ### image is modified in place
+        for y1, y2, x1, x2, fill_premult in self._fill_list:
+            if isinstance(fill_premult, type(None)):
+                image[y1:y2, x1:x2] = 0
+            else:
+                image[y1:y2, x1:x2] = fill_premult
+
+
+        for y1, y2, x1, x2, blend_multiplier, blend_premult in self._blend_list:
+            self.blend(image[y1:y2, x1:x2], blend_multiplier, blend_premult)
+
+
+        return image
+
+
+    @staticmethod
+    def blend(tile, multiplier, premult):
+        ### tile is modified in place, multiplier is single channel
+        if len(tile.shape) == 3:
+            multiplier = multiplier[:, :, numpy.newaxis]
+
+        # integer divide by 255 with rounding
+        blend = tile.astype(numpy.uint16)
+        blend *= multiplier
+        blend += 128
+        blend += blend >> 8
+        blend >>= 8
+
+        if not isinstance(premult, type(None)):
+            # the sum cannot exceed 255 by more than rounding
+            blend += premult
+            numpy.minimum(blend, 255, out=blend)
+
+        tile[:] = blend
+
+
+    def _tileType(self, tile_multiplier, tile_premult):
+        if tile_multiplier.min() == 255 and not tile_premult.any():
+            return None  # no change
+
+        if not tile_multiplier.any():
+            return 'fill'
+
+        return 'blend'
+
+
+    def _addRun(self, run_type, y1, y2, x1, x2, multiplier, premult):
+        if isinstance(run_type, type(None)):
+            return
+
+        run_premult = premult[y1:y2, x1:x2]
+        if run_premult.any():
+            run_premult = run_premult.copy()
+        else:
+            run_premult = None
+
+
+        if run_type == 'fill':
+            self._fill_list.append((y1, y2, x1, x2, run_premult))
+        else:
+            self._blend_list.append((y1, y2, x1, x2, multiplier[y1:y2, x1:x2].copy(), run_premult))
@@ -5,6 +5,7 @@ import io
 import json
 import tempfile
 import random
+import copy
 from pathlib import Path
 from collections import OrderedDict
 from prettytable import PrettyTable
@@ -81,6 +82,7 @@ class IndiAllSkyConfigBase(object):
         "WBB_FACTOR"       : 1.0,
         "AUTO_WB"          : False,
         "SATURATION_FACTOR": 1.0,
+        "COLOR_TRANSFORM_FUSED" : True,
         "CCD_COOLING"      : False,
         "CCD_TEMP"         : 15.0,
         "TEMP_DISPLAY"     : "c",  # c = celcius, f = fahrenheit, k = kelvin",
@@ -96,6 +98,7 @@ class IndiAllSkyConfigBase(object):
         "DETECT_STARS" : True,
         "DETECT_STARS_THOLD" : 0.6,
         "DETECT_METEORS" : False,
+        "DETECT_METEORS_PREPASS" : False,
         "DETECT_MASK" : "",
         "DETECT_DRAW" : False,
         "LOGO_OVERLAY" : "",
@@ -105,6 +108,7 @@ class IndiAllSkyConfigBase(object):
         "LOCATION_LATITUDE"  : 33.0,
         "LOCATION_LONGITUDE" : -84.0,
         "LOCATION_ELEVATION" : 300.0,
+        "ASTROMETRIC_PLANET_INTERVAL" : 300,
         "TIMELAPSE_ENABLE"         : True,
         "TIMELAPSE_SKIP_FRAMES"    : 4,
         "DAYTIME_CAPTURE"          : True,
@@ -139,6 +143,8 @@ class IndiAllSkyConfigBase(object):
         "KEOGRAM_CROP_TOP"      : 0,  # percent
         "KEOGRAM_CROP_BOTTOM"   : 0,  # percent
         "KEOGRAM_LABEL"         : True,
+        "KEOGRAM_MEMMAP"        : False,
+        "KEOGRAM_STARTRAILS_INCREMENTAL" : False,
         "STARTRAILS_MAX_ADU"    : 65,
         "STARTRAILS_MASK_THOLD" : 190,
         "STARTRAILS_PIXEL_THOLD": 1.0,
@@ -151,6 +157,8 @@ class IndiAllSkyConfigBase(object):
         "STARTRAILS_MOON_PHASE_THOLD"    : 101.0,
         "STARTRAILS_USE_DB_DATA"         : True,
         "IMAGE_CALIBRATE_DARK"  : True,
+        "IMAGE_CALIBRATE_CACHE_MB"   : 256,
+        "IMAGE_CALIBRATE_CACHE_MMAP" : False,
         "IMAGE_EXIF_PRIVACY"    : False,
         "IMAGE_FILE_TYPE" : "jpg",  # jpg, png, or tif
         "IMAGE_FILE_COMPRESSION" : {
@@ -208,12 +216,17 @@ class IndiAllSkyConfigBase(object):
         "IMAGE_STACK_SPLIT"   : False,
         "THUMBNAILS" : {
             "IMAGES_AUTO" : True,
+            "SIZES"       : [],
+            "BACKGROUND"  : False,
         },
         "IMAGE_EXPIRE_DAYS"     : 30,
         "TIMELAPSE_EXPIRE_DAYS" : 365,
         "IMAGE_QUEUE_MAX"       : 3,
         "IMAGE_QUEUE_MIN"       : 1,
         "IMAGE_QUEUE_BACKOFF"   : 0.5,
+        "IMAGE_SHARED_MEMORY"   : True,
+        "IMAGE_WORKERS"         : 1,
+        "IMAGE_PIPELINE"        : False,
         "FFMPEG_FRAMERATE" : 25,
         "FFMPEG_BITRATE"   : "5000k",
         "FFMPEG_VFSCALE"   : "",
@@ -271,6 +284,8 @@ class IndiAllSkyConfigBase(object):
             "RETROGRADE"     : False,
         },
         "UPLOAD_WORKERS" : 2,
+        "UPLOAD_IDLE_TIMEOUT" : 300,
+        "UPLOAD_BATCH_MAX" : 10,
         "FILETRANSFER" : {
             "CLASSNAME"              : "pycurl_sftp",  # pycurl_sftp, pycurl_ftps, pycurl_ftpes, paramiko_sftp, python_ftp, python_ftpes
             "HOST"                   : "",
@@ -345,6 +360,8 @@ class IndiAllSkyConfigBase(object):
             "TLS"                    : True,
             "CERT_BYPASS"            : True,
             "PUBLISH_IMAGE"          : True,
+            "IMAGE_PERIOD"           : 0,  # seconds between image publishes, 0 publishes every image
+            "DEADBAND"               : 0.0,  # numeric values are only published when the change exceeds this
         },
         "SYNCAPI" : {
             "ENABLE"                 : False,
@@ -355,6 +372,7 @@ class IndiAllSkyConfigBase(object):
             "CERT_BYPASS"            : False,
             "POST_S3"                : False,
             "EMPTY_FILE"             : False,
+            "BATCH"                  : False,
             "UPLOAD_IMAGE"           : 1,
             "UPLOAD_PANORAMA"        : 1,
             #"UPLOAD_VIDEO"           : True,  # this cannot be changed
@@ -381,6 +399,7 @@ class IndiAllSkyConfigBase(object):
             "AWB_ENABLE_DAY"         : False,
             "EXTRA_OPTIONS"          : "",
             "EXTRA_OPTIONS_DAY"      : "",
+            "PERSISTENT"             : False,
         },
         "PYCURL_CAMERA" : {
             "URL"                    : '',
@@ -693,6 +712,53 @@ class IndiAllSkyConfig(IndiAllSkyConfigBase):
         return config, encrypted
 
 
+class IndiAllSkyConfigCached(IndiAllSkyConfig):
+    # per process cache of the latest config for the web interface
+    _cache = {
+        'id'     : None,
+        'level'  : None,
+        'config' : None,
+    }
+
+
+    def __init__(self):
+        # only the id and level of the latest entry are fetched to validate the cache
+        config_id, config_level = self._getConfigIdLevel()
+
+        cache = self._cache
+        if cache['id'] != config_id or cache['level'] != config_level:
+            # a new config has been saved
+            super(IndiAllSkyConfigCached, self).__init__()
+
+            IndiAllSkyConfigCached._cache = {
+                'id'     : self._config_id,
+                'level'  : self._config_level,
+                'config' : copy.deepcopy(self._config),
+            }
+
+            return
+
+
+        self._config_id = cache['id']
+        self._config_level = cache['level']
+
+        # views may modify the config
+        self._config = copy.deepcopy(cache['config'])
+
+
+    def _getConfigIdLevel(self):
+        # not catching NoResultFound
+        config_entry = db.session.query(
+            IndiAllSkyDbConfigTable.id,
+            IndiAllSkyDbConfigTable.level,
+        )\
+            .order_by(IndiAllSkyDbConfigTable.createDate.desc())\
+            .limit(1)\
+            .one()
+
+        return config_entry.id, config_entry.level
+
+
 class IndiAllSkyConfigUtil(IndiAllSkyConfig):
 
     def __init__(self):
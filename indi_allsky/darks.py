@@ -24,6 +24,8 @@ from .exceptions import BadImage
 
 from .config import IndiAllSkyConfig
 
+from .imagePipeline import ImagePipelineStage
+
 from . import camera as camera_module
 
 from . import constants
@@ -851,59 +853,80 @@ class IndiAllSkyDarks(object):
 
         image_bitpix = None
 
-        i = 1
-        while i <= self.count:
-            # sometimes image data is bad, take images until we reach the desired number
-            logger.info(f"Starting image {i}/{self.count}.")
-            start = time.time()
 
-            self._pre_shoot_reconfigure()
+        s = stacking_class(self.gain_v, self.bin_v)
+        s.bitmax = self.bitmax
+        s.hotpixel_adu_percent = self.hotpixel_adu_percent
 
-            self.shoot(exposure_f, sync=True, timeout=180.0)  # flat 3 minute timeout
+        # frames are stacked while the next exposure is taken
+        stack_stage = ImagePipelineStage(0, 'DarkStack', self._stackFrame, self._stackError)
+        stack_stage.start()
 
-            frame_elapsed = time.time() - start
-            frame_delta = frame_elapsed - exposure_f
 
-            logger.info('Exposure received in %0.4fs (%0.4f)', frame_elapsed, frame_delta)
+        try:
+            i = 1
+            while i <= self.count:
+                # sometimes image data is bad, take images until we reach the desired number
+                logger.info(f"Starting image {i}/{self.count}.")
+                start = time.time()
 
-            if frame_delta < 0:
-                logger.error('%0.1fs EXPOSURE RECEIVED IN %0.1fs.  POSSIBLE CAMERA PROBLEM.', exposure_f, frame_elapsed)
+                self._pre_shoot_reconfigure()
 
+                self.shoot(exposure_f, sync=True, timeout=180.0)  # flat 3 minute timeout
 
-            try:
-                hdulist = self._wait_for_image(exposure_f)
-            except BadImage as e:
-                logger.error('Bad Image: %s', str(e))
-                continue
+                frame_elapsed = time.time() - start
+                frame_delta = frame_elapsed - exposure_f
 
+                logger.info('Exposure received in %0.4fs (%0.4f)', frame_elapsed, frame_delta)
 
-            hdulist[0].header['BUNIT'] = 'ADU'  # hack for ccdproc
+                if frame_delta < 0:
+                    logger.error('%0.1fs EXPOSURE RECEIVED IN %0.1fs.  POSSIBLE CAMERA PROBLEM.', exposure_f, frame_elapsed)
 
-            #logger.info('Shape: %s', str(hdulist[0].data.shape))
-            if len(hdulist[0].data.shape) == 3:
-                # RGB fits data
-                image_height, image_width = hdulist[0].data.shape[-2:]
-            else:
-                # Mono data
-                image_height, image_width = hdulist[0].data.shape[:2]
 
-            image_bitpix = hdulist[0].header['BITPIX']
+                try:
+                    hdulist = self._wait_for_image(exposure_f)
+                except BadImage as e:
+                    logger.error('Bad Image: %s', str(e))
+                    continue
 
 
-            f_tmp_fit = tempfile.NamedTemporaryFile(dir=tmp_fit_dir_p, suffix='.fit', delete=False)
-            hdulist.writeto(f_tmp_fit)
-            f_tmp_fit.flush()
-            f_tmp_fit.close()
+                hdulist[0].header['BUNIT'] = 'ADU'
 
-            #logger.info('FIT: %s', f_tmp_fit.name)
+                #logger.info('Shape: %s', str(hdulist[0].data.shape))
+                if len(hdulist[0].data.shape) == 3:
+                    # RGB fits data
+                    image_height, image_width = hdulist[0].data.shape[-2:]
+                else:
+                    # Mono data
+                    image_height, image_width = hdulist[0].data.shape[:2]
 
-            m_avg = numpy.mean(hdulist[0].data)
-            logger.info('Image average adu: %0.2f', m_avg)
+                image_bitpix = hdulist[0].header['BITPIX']
 
-            self.getSensorTemperature()
-            logger.info('Camera temperature: %0.2f', self.sensors_temp_av[0])
 
-            i += 1  # increment
+                if s.frames_required:
+                    f_tmp_fit = tempfile.NamedTemporaryFile(dir=tmp_fit_dir_p, suffix='.fit', delete=False)
+                    hdulist.writeto(f_tmp_fit)
+                    f_tmp_fit.flush()
+                    f_tmp_fit.close()
+
+                    #logger.info('FIT: %s', f_tmp_fit.name)
+
+                m_avg = numpy.mean(hdulist[0].data)
+                logger.info('Image average adu: %0.2f', m_avg)
+
+                stack_stage.put({
+                    'stacker' : s,
+                    'hdulist' : hdulist,
+                })
+
+                self.getSensorTemperature()
+                logger.info('Camera temperature: %0.2f', self.sensors_temp_av[0])
+
+                i += 1  # increment
+        finally:
+            # the stage thread must always be stopped, otherwise the process does not exit
+            stack_stage.stop()
+            stack_stage.join()
 
 
         # libcamera does not know the temperature until the first exposure is taken
@@ -932,9 +955,8 @@ class IndiAllSkyDarks(object):
         full_bpm_filename_p = self.darks_dir.joinpath(bpm_filename)
 
 
-        s = stacking_class(self.gain_v, self.bin_v)
-        s.bitmax = self.bitmax
-        s.hotpixel_adu_percent = self.hotpixel_adu_percent
+        logger.info('Stacked %d frames', s.count)
+
 
         bpm_adu_avg = s.buildBadPixelMap(tmp_fit_dir_p, full_bpm_filename_p, exposure_f, image_bitpix)
         dark_adu_avg = s.stack(tmp_fit_dir_p, full_dark_filename_p, exposure_f, image_bitpix)
@@ -987,6 +1009,15 @@ class IndiAllSkyDarks(object):
 
 
 
+    def _stackFrame(self, job):
+        job['stacker'].add(job['hdulist'])
+
+
+    def _stackError(self, job, e):
+        # the frame is left out of the stack
+        logger.error('Dark frame not stacked: %s', str(e))
+
+
     def flush(self):
         with app.app_context():
             self._flush()
@@ -1021,6 +1052,8 @@ class IndiAllSkyDarks(object):
         dark_frames_all.delete()
         db.session.commit()
 
+        self._miscDb.invalidateCalibrationCache()
+
 
 
     def getSensorTemperature(self):
@@ -1134,6 +1167,14 @@ class IndiAllSkyDarks(object):
 
 
 class IndiAllSkyDarksProcessor(object):
+
+    ### Frames are folded into running accumulators as they arrive, the frames are never held in memory together
+    # sum is used for the average, max for the bad pixel map, mean/variance (Welford) for the noise estimate
+
+    # frames must be kept on disk for the final stack
+    frames_required = False
+
+
     def __init__(self, gain_v, bin_v):
         self.gain_v = gain_v
         self.bin_v = bin_v
@@ -1142,6 +1183,13 @@ class IndiAllSkyDarksProcessor(object):
 
         self._bitmax = 0
 
+        self._count = 0
+        self._hdulist = None  # the last frame is reused for the header
+        self._sum_data = None
+        self._max_data = None
+        self._mean_data = None
+        self._m2_data = None
+
 
     @property
     def bitmax(self):
@@ -1161,10 +1209,69 @@ class IndiAllSkyDarksProcessor(object):
         self._hotpixel_adu_percent = int(new_hotpixel_adu_percent)
 
 
+    @property
+    def count(self):
+        return self._count
 
-    def buildBadPixelMap(self, tmp_fit_dir_p, filename_p, exposure, image_bitpix):
+    @count.setter
+    def count(self, *args):
+        pass  # read only
+
+
+    def add(self, hdulist):
+        data = hdulist[0].data
+
+        if isinstance(self._sum_data, type(None)):
+            self._sum_data = numpy.zeros(data.shape, dtype=numpy.uint32)
+            self._max_data = numpy.zeros(data.shape, dtype=data.dtype)
+            self._mean_data = numpy.zeros(data.shape, dtype=numpy.float32)
+            self._m2_data = numpy.zeros(data.shape, dtype=numpy.float32)
+        elif data.shape != self._sum_data.shape:
+            logger.error('Dark frame shape %s does not match %s, skipping', str(data.shape), str(self._sum_data.shape))
+            return
+
+
+        self._count += 1
+
+        numpy.add(self._sum_data, data, out=self._sum_data, casting='unsafe')
+        numpy.maximum(self._max_data, data, out=self._max_data)
+
+
+        # Welford
+        delta = data.astype(numpy.float32)
+        delta -= self._mean_data
+        self._mean_data += delta / self._count
+
+        delta2 = data - self._mean_data
+        delta2 *= delta
+        self._m2_data += delta2
+
+
+        self._hdulist = hdulist
+
+
+    def addFiles(self, tmp_fit_dir_p):
         from astropy.io import fits
 
+        # fallback when the frames were not added as they were taken
+        for item in sorted(Path(tmp_fit_dir_p).iterdir()):
+            #logger.info('Found item: %s', item)
+            if item.is_file() and item.suffix in ('.fit',):
+                #logger.info('Found fit: %s', item)
+                hdulist = fits.open(item)
+                self.add(hdulist)
+
+
+    def logNoise(self):
+        if self._count < 2:
+            return
+
+        noise = numpy.sqrt(numpy.mean(self._m2_data) / (self._count - 1))
+        logger.info('Dark frame average noise: %0.2f', noise)
+
+
+
+    def buildBadPixelMap(self, tmp_fit_dir_p, filename_p, exposure, image_bitpix):
         logger.info('Building bad pixel map for exposure %0.1fs, gain %d, bin %d', exposure, self.gain_v.value, self.bin_v.value)
 
         if image_bitpix == 16:
@@ -1175,21 +1282,12 @@ class IndiAllSkyDarksProcessor(object):
             raise Exception('Unknown bits per pixel')
 
 
-        image_data = list()
-        hdulist = None
-        for item in Path(tmp_fit_dir_p).iterdir():
-            #logger.info('Found item: %s', item)
-            if item.is_file() and item.suffix in ['.fit']:
-                #logger.info('Found fit: %s', item)
-                hdulist = fits.open(item)
-                image_data.append(hdulist[0].data)
-
+        if not self._count:
+            self.addFiles(tmp_fit_dir_p)
 
-        bpm = numpy.zeros(image_data[0].shape, dtype=numpy_type)
 
-        # take the max values of each pixel from each image
-        for image in image_data:
-            bpm = numpy.maximum(bpm, image)
+        # the max values of each pixel from each image
+        bpm = self._max_data.astype(numpy_type)
 
 
         max_val = numpy.amax(bpm)
@@ -1205,10 +1303,10 @@ class IndiAllSkyDarksProcessor(object):
         bpm_adu_avg = numpy.mean(bpm)
         logger.info('Master BPM average adu: %0.2f', bpm_adu_avg)
 
-        hdulist[0].data = bpm
+        self._hdulist[0].data = bpm
 
         # reuse the last fits file for the stacked data
-        hdulist.writeto(filename_p)
+        self._hdulist.writeto(filename_p)
 
         return bpm_adu_avg
 
@@ -1219,8 +1317,6 @@ class IndiAllSkyDarksProcessor(object):
 
 class IndiAllSkyDarksAverage(IndiAllSkyDarksProcessor):
     def stack(self, tmp_fit_dir_p, filename_p, exposure, image_bitpix):
-        from astropy.io import fits
-
         logger.info('Stacking dark frames for exposure %0.1fs, gain %d, bin %d', exposure, self.gain_v.value, self.bin_v.value)
 
         if image_bitpix == 16:
@@ -1230,39 +1326,48 @@ class IndiAllSkyDarksAverage(IndiAllSkyDarksProcessor):
         else:
             raise Exception('Unknown bits per pixel')
 
-        image_data = list()
-        hdulist = None
-        for item in Path(tmp_fit_dir_p).iterdir():
-            #logger.info('Found item: %s', item)
-            if item.is_file() and item.suffix in ('.fit',):
-                #logger.info('Found fit: %s', item)
-                hdulist = fits.open(item)
-                image_data.append(hdulist[0].data)
+
+        if not self._count:
+            self.addFiles(tmp_fit_dir_p)
 
 
         start = time.time()
 
-        avg_data = (numpy.sum(image_data, axis=0) / len(image_data)).astype(numpy_type)
+        # integer division truncates the same as the float average
+        avg_data = (self._sum_data // self._count).astype(numpy_type)
         #logger.info('Avg dims: %s', str(avg_data.shape))
 
         elapsed_s = time.time() - start
         logger.info('Exposure average stacked in %0.4f s', elapsed_s)
 
+        self.logNoise()
+
         dark_adu_avg = numpy.mean(avg_data)
         logger.info('Master Dark average adu: %0.2f', dark_adu_avg)
 
-        hdulist[0].data = avg_data
+        self._hdulist[0].data = avg_data
 
         # reuse the last fits file for the stacked data
-        hdulist.writeto(filename_p)
+        self._hdulist.writeto(filename_p)
 
         return dark_adu_avg
 
 
 class IndiAllSkyDarksSigmaClip(IndiAllSkyDarksProcessor):
+
+    ### The frames are read from disk in bands of rows, memory use is limited by mem_limit instead of the frame count
+
+    frames_required = True
+
+    mem_limit = 350000000
+
+    sigma_clip_low_thresh = 5
+    sigma_clip_high_thresh = 5
+
+
     def stack(self, tmp_fit_dir_p, filename_p, exposure, image_bitpix):
+        from astropy.io import fits
         from astropy.stats import mad_std
-        import ccdproc
 
         logger.info('Stacking dark frames for exposure %0.1fs, gain %d, bin %d', exposure, self.gain_v.value, self.bin_v.value)
 
@@ -1270,36 +1375,105 @@ class IndiAllSkyDarksSigmaClip(IndiAllSkyDarksProcessor):
             numpy_type = numpy.uint16
         elif image_bitpix == 8:
             numpy_type = numpy.uint8
+        else:
+            raise Exception('Unknown bits per pixel')
+
+
+        # memmap without scaling, otherwise astropy reads the entire frame
+        hdulist_list = list()
+        for item in sorted(Path(tmp_fit_dir_p).iterdir()):
+            if item.is_file() and item.suffix in ('.fit',):
+                hdulist_list.append(fits.open(item, memmap=True, do_not_scale_image_data=True))
+
 
-        dark_images = ccdproc.ImageFileCollection(tmp_fit_dir_p)
+        header = hdulist_list[0][0].header.copy()
+        shape = hdulist_list[0][0].data.shape
+        height = shape[-2]
 
-        cal_darks = dark_images.files_filtered(exptime=exposure, include_path=True)
+
+        frame_count = len(hdulist_list)
+        row_pixels = int(numpy.prod(shape)) // height
+
+        # for every frame: the tile list, the stacked tile, the median partition copy and the mad_std deviations are float32
+        # the clip comparisons and the clip mask are bool
+        frame_pixel_bytes = (4 * numpy.dtype(numpy.float32).itemsize) + (3 * numpy.dtype(numpy.bool_).itemsize)
+
+        # once per pixel: center, dev and the sum are float32, keep_count is int64
+        # dividing by keep_count upcasts the average and the numpy.where() result to float64
+        pixel_bytes = (3 * numpy.dtype(numpy.float32).itemsize) + (2 * numpy.dtype(numpy.int64).itemsize) + (2 * numpy.dtype(numpy.float64).itemsize)
+
+        row_bytes = row_pixels * ((frame_pixel_bytes * frame_count) + pixel_bytes)
+        tile_rows = max(1, min(height, self.mem_limit // row_bytes))
+
+        logger.info('Sigma clip tiles: %d rows, %d frames, %d MB', tile_rows, frame_count, (row_bytes * tile_rows) // 1000000)
 
 
         start = time.time()
 
-        combined_dark = ccdproc.combine(
-            cal_darks,
-            method='average',
-            sigma_clip=True,
-            sigma_clip_low_thresh=5,
-            sigma_clip_high_thresh=5,
-            sigma_clip_func=numpy.ma.median,
-            signma_clip_dev_func=mad_std,
-            dtype=numpy_type,
-            mem_limit=350000000,
-        )
+        combined_data = numpy.zeros(shape, dtype=numpy_type)
+
+        for y in range(0, height, tile_rows):
+            tile_list = list()
+            for hdulist in hdulist_list:
+                bzero = hdulist[0].header.get('BZERO', 0)
+                bscale = hdulist[0].header.get('BSCALE', 1)
+
+                tile = hdulist[0].data[..., y:y + tile_rows, :].astype(numpy.float32)
+
+                if bscale != 1:
+                    tile *= bscale
+
+                if bzero:
+                    tile += bzero
+
+                tile_list.append(tile)
+
+
+            tile_data = numpy.stack(tile_list, axis=0)
+            del tile_list
+
+
+            center = numpy.median(tile_data, axis=0)
+            dev = mad_std(tile_data, axis=0)
+
+            deviation = tile_data - center
+            clip_mask = (deviation < (dev * -self.sigma_clip_low_thresh)) | (deviation > (dev * self.sigma_clip_high_thresh))
+            del deviation
+
+            tile_data[clip_mask] = 0
+            keep_count = frame_count - numpy.sum(clip_mask, axis=0)
+            del clip_mask
+
+
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                tile_avg = numpy.sum(tile_data, axis=0) / keep_count
+
+            # every value clipped
+            tile_avg = numpy.where(keep_count > 0, tile_avg, center)
+
+            combined_data[..., y:y + tile_rows, :] = tile_avg.astype(numpy_type)
+
+
+        for hdulist in hdulist_list:
+            hdulist.close()
+
 
         elapsed_s = time.time() - start
         logger.info('Exposure sigma clip stacked in %0.4f s', elapsed_s)
 
+        self.logNoise()
 
-        combined_dark.meta['combined'] = True
 
-        dark_adu_avg = numpy.mean(combined_dark[0].data, axis=0)
+        for key in ('BZERO', 'BSCALE'):
+            if key in header:
+                del header[key]
+
+        header['COMBINED'] = True
+
+        dark_adu_avg = numpy.mean(combined_data)
         logger.info('Master Dark average adu: %0.2f', dark_adu_avg)
 
-        combined_dark.write(filename_p)
+        hdu = fits.PrimaryHDU(data=combined_data, header=header)
+        hdu.writeto(filename_p)
 
         return dark_adu_avg
-
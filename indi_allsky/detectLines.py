@@ -23,13 +23,16 @@ class IndiAllskyDetectLines(object):
 
     mask_blur_kernel_size = 75
 
+    prepass_scale = 2  # the first pass is downscaled by this factor
+
 
     def __init__(self, config, bin_v, mask=None):
         self.config = config
         self.bin_v = bin_v
 
         self._sqm_mask = mask
-        self._sqm_gradient_mask = None
+        self._sqm_gradient_mask = None  # uint8, cropped to the roi
+        self._roi = None  # x, y, w, h of the non-zero mask region
 
 
     def detectLines(self, original_img):
@@ -42,22 +45,34 @@ class IndiAllskyDetectLines(object):
             self._generateSqmGradientMask(original_img)
 
 
-        # apply the gradient to the image
-        masked_img = (original_img * self._sqm_gradient_mask).astype(numpy.uint8)
+        lines_start = time.time()
 
-        #cv2.imwrite('/tmp/masked.jpg', masked_img, [cv2.IMWRITE_JPEG_QUALITY, 90])  # debugging
+        x, y, w, h = self._roi
 
+        # everything outside of the roi is masked
+        roi_img = original_img[y:y + h, x:x + w]
 
         if len(original_img.shape) == 2:
-            img_gray = masked_img
+            img_gray = roi_img
         else:
-            img_gray = cv2.cvtColor(masked_img, cv2.COLOR_BGR2GRAY)
+            img_gray = cv2.cvtColor(roi_img, cv2.COLOR_BGR2GRAY)
 
 
+        # apply the gradient to the image, fixed point
+        masked_img = cv2.multiply(img_gray, self._sqm_gradient_mask, scale=1.0 / 255)
 
-        lines_start = time.time()
+        #cv2.imwrite('/tmp/masked.jpg', masked_img, [cv2.IMWRITE_JPEG_QUALITY, 90])  # debugging
 
-        blur_gray = cv2.GaussianBlur(img_gray, (self.blur_kernel_size, self.blur_kernel_size), cv2.BORDER_DEFAULT)
+
+        if self.config.get('DETECT_METEORS_PREPASS'):
+            if not self._prepass(masked_img):
+                lines_elapsed_s = time.time() - lines_start
+                logger.info('Line detection (pre-pass) in %0.4f s', lines_elapsed_s)
+                logger.info('Detected 0 lines')
+                return list()
+
+
+        blur_gray = cv2.GaussianBlur(masked_img, (self.blur_kernel_size, self.blur_kernel_size), cv2.BORDER_DEFAULT)
 
 
         edges = cv2.Canny(blur_gray, self.canny_low_threshold, self.canny_high_threshold)
@@ -74,6 +89,10 @@ class IndiAllskyDetectLines(object):
             self.max_line_gap,
         )
 
+        if not isinstance(lines, type(None)):
+            # translate the roi coordinates back to the image
+            lines += numpy.array([x, y, x, y], dtype=lines.dtype)
+
         lines_elapsed_s = time.time() - lines_start
         logger.info('Line detection in %0.4f s', lines_elapsed_s)
 
@@ -89,6 +108,41 @@ class IndiAllskyDetectLines(object):
         return lines
 
 
+    def _prepass(self, masked_img):
+        # returns True when the downscaled image contains line candidates
+        roi_height, roi_width = masked_img.shape[:2]
+
+        small_img = cv2.resize(
+            masked_img,
+            (int(roi_width / self.prepass_scale), int(roi_height / self.prepass_scale)),
+            interpolation=cv2.INTER_AREA,
+        )
+
+        blur_gray = cv2.GaussianBlur(small_img, (3, 3), cv2.BORDER_DEFAULT)
+
+        edges = cv2.Canny(blur_gray, self.canny_low_threshold, self.canny_high_threshold)
+
+        if not cv2.countNonZero(edges):
+            return False
+
+
+        # thresholds are lowered so the pre-pass does not miss lines the full pass would find
+        lines = cv2.HoughLinesP(
+            edges,
+            self.rho,
+            self.theta,
+            int(self.threshold / (self.prepass_scale * 2)),
+            numpy.array([]),
+            int(self.min_line_length / (self.prepass_scale * 2)),
+            int(self.max_line_gap / self.prepass_scale),
+        )
+
+        if isinstance(lines, type(None)):
+            return False
+
+        return True
+
+
     def _generateSqmMask(self, img):
         logger.info('Generating mask based on SQM_ROI')
 
@@ -142,14 +196,22 @@ class IndiAllskyDetectLines(object):
         # blur the mask to prevent mask edges from being detected as lines
         blur_mask = cv2.blur(self._sqm_mask, (self.mask_blur_kernel_size, self.mask_blur_kernel_size), cv2.BORDER_DEFAULT)
 
-        if len(img.shape) == 2:
-            # mono
-            mask = blur_mask
-        else:
-            # color
-            mask = cv2.cvtColor(blur_mask, cv2.COLOR_GRAY2BGR)
 
-        self._sqm_gradient_mask = (mask / 255).astype(numpy.float32)
+        # pad the roi so the blur and edge detection see the masked border
+        pad = self.blur_kernel_size + 3
+
+        x, y, w, h = cv2.boundingRect(blur_mask)
+        x1 = max(0, x - pad)
+        y1 = max(0, y - pad)
+        x2 = min(image_width, x + w + pad)
+        y2 = min(image_height, y + h + pad)
+
+        self._roi = (x1, y1, x2 - x1, y2 - y1)
+        logger.info('Line detection roi: %s', str(self._roi))
+
+
+        # the mask is applied to the grayscale image
+        self._sqm_gradient_mask = blur_mask[y1:y2, x1:x2].copy()
 
 
     def _drawLines(self, img, lines):
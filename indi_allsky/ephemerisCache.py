@@ -0,0 +1,275 @@
+import math
+import time
+from datetime import timedelta
+import ephem
+import logging
+
+from .flask.models import IndiAllSkyDbStateTable
+from .flask.models import IndiAllSkyDbTleDataTable
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyEphemerisCache(object):
+
+    generation_key = 'SATELLITE_GENERATION'
+
+    planet_classes = {
+        'mercury' : ephem.Mercury,
+        'venus'   : ephem.Venus,
+        'mars'    : ephem.Mars,
+        'jupiter' : ephem.Jupiter,
+        'saturn'  : ephem.Saturn,
+    }
+
+
+    def __init__(self, config):
+        self.config = config
+
+        self._generation = None
+        self._position = None
+
+        # parsed TLE bodies
+        self._satellites = None
+        self._satellites_load_s = 0.0
+
+        # next pass predictions, keys are satellite keys
+        self._pass_dict = dict()
+        self._pass_compute_s = 0.0
+
+        # planet positions are interpolated between two samples
+        self._planet_interval = timedelta(seconds=float(self.config.get('ASTROMETRIC_PLANET_INTERVAL', 300)))
+        self._planet_t0 = None
+        self._planet_t1 = None
+        self._planet_data0 = None
+        self._planet_data1 = None
+        self._planet_compute_s = 0.0
+
+        self._hits = 0
+        self._misses = 0
+        self._saved_s = 0.0
+
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @hits.setter
+    def hits(self, *args):
+        pass  # read only
+
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @misses.setter
+    def misses(self, *args):
+        pass  # read only
+
+
+    @property
+    def saved_s(self):
+        return self._saved_s
+
+    @saved_s.setter
+    def saved_s(self, *args):
+        pass  # read only
+
+
+    def resetStats(self):
+        self._hits = 0
+        self._misses = 0
+        self._saved_s = 0.0
+
+
+    def checkPosition(self, obs):
+        position = (float(obs.lat), float(obs.lon), float(obs.elevation))
+
+        if position == self._position:
+            return
+
+
+        if not isinstance(self._position, type(None)):
+            logger.warning('Location changed, clearing ephemeris cache')
+
+        self._position = position
+        self._pass_dict = dict()
+        self._planet_t0 = None
+
+
+    def getSatellites(self, satellite_dict):
+        self.checkGeneration()
+
+        if not isinstance(self._satellites, type(None)):
+            self._hits += 1
+            self._saved_s += self._satellites_load_s
+            return self._satellites
+
+
+        load_start = time.time()
+
+        satellites = dict()
+        for sat_key, sat_data in satellite_dict.items():
+            # there may be multiple satellites of the same name, usually pieces of the same rocket
+            sat_entry = IndiAllSkyDbTleDataTable.query\
+                .filter(IndiAllSkyDbTleDataTable.group == sat_data['group'])\
+                .filter(IndiAllSkyDbTleDataTable.title == sat_data['title'])\
+                .order_by(IndiAllSkyDbTleDataTable.id.desc())\
+                .first()
+
+
+            if not sat_entry:
+                logger.warning('Satellite data not found: %s', sat_data['title'])
+                continue
+
+            #logger.info('Found satellite data: %s', sat_name)
+
+            try:
+                sat = ephem.readtle(sat_entry.title, sat_entry.line1, sat_entry.line2)
+            except ValueError as e:
+                logger.error('Satellite TLE data error: %s', str(e))
+                continue
+
+            satellites[sat_key] = sat
+
+
+        self._satellites = satellites
+        self._satellites_load_s = time.time() - load_start
+        self._misses += 1
+
+        return self._satellites
+
+
+    def nextPass(self, sat_key, sat, obs):
+        now = obs.date.datetime()
+
+        pass_entry = self._pass_dict.get(sat_key)
+        if pass_entry and now < pass_entry['expire']:
+            self._hits += 1
+            self._saved_s += self._pass_compute_s
+            return pass_entry['next_pass']
+
+
+        pass_start = time.time()
+
+        # exceptions are handled by the caller
+        next_pass = obs.next_pass(sat)
+
+        self._pass_compute_s = time.time() - pass_start
+        self._misses += 1
+
+
+        rise_time = next_pass[0]
+        set_time = next_pass[4]
+
+        # the prediction does not change until the satellite rises, or the current pass ends
+        if rise_time and rise_time.datetime() > now:
+            expire = rise_time.datetime()
+        elif set_time and set_time.datetime() > now:
+            expire = set_time.datetime()
+        else:
+            expire = None
+
+
+        if expire:
+            self._pass_dict[sat_key] = {
+                'next_pass' : next_pass,
+                'expire'    : expire,
+            }
+        else:
+            self._pass_dict.pop(sat_key, None)
+
+
+        return next_pass
+
+
+    def getPlanets(self, obs):
+        now = obs.date.datetime()
+
+        if not self._planet_interval.total_seconds():
+            # interpolation disabled
+            self._misses += 1
+            return self._computePlanets(obs, now)
+
+
+        if isinstance(self._planet_t0, type(None)) or now < self._planet_t0 or now > self._planet_t1 + self._planet_interval:
+            # first sample, or the samples are too old to reuse
+            self._planet_t0 = now
+            self._planet_data0 = self._computePlanets(obs, self._planet_t0)
+            self._planet_t1 = now + self._planet_interval
+            self._planet_data1 = self._computePlanets(obs, self._planet_t1)
+            self._misses += 1
+        elif now > self._planet_t1:
+            self._planet_t0 = self._planet_t1
+            self._planet_data0 = self._planet_data1
+            self._planet_t1 = self._planet_t0 + self._planet_interval
+            self._planet_data1 = self._computePlanets(obs, self._planet_t1)
+            self._misses += 1
+        else:
+            self._hits += 1
+            self._saved_s += self._planet_compute_s
+
+
+        f = (now - self._planet_t0).total_seconds() / self._planet_interval.total_seconds()
+
+        planet_data = dict()
+        for k, v0 in self._planet_data0.items():
+            planet_data[k] = v0 + ((self._planet_data1[k] - v0) * f)
+
+        return planet_data
+
+
+    def _computePlanets(self, obs, date):
+        compute_start = time.time()
+
+        planet_obs = obs.copy()
+        planet_obs.date = date
+
+        planet_data = dict()
+        for planet_name, planet_class in self.planet_classes.items():
+            planet = planet_class()
+            planet.compute(planet_obs)
+
+            planet_data['{0:s}_alt'.format(planet_name)] = math.degrees(planet.alt)
+
+            if planet_name == 'venus':
+                planet_data['venus_phase'] = planet.phase
+
+
+        self._planet_compute_s = time.time() - compute_start
+
+        return planet_data
+
+
+    def clear(self):
+        self._satellites = None
+        self._pass_dict = dict()
+
+
+    def checkGeneration(self):
+        ### satellite_download.py updates the generation when new TLE data is imported
+        generation_entry = IndiAllSkyDbStateTable.query\
+            .filter(IndiAllSkyDbStateTable.key == self.generation_key)\
+            .first()
+
+        if generation_entry:
+            generation = generation_entry.value
+        else:
+            generation = ''
+
+
+        if isinstance(self._generation, type(None)):
+            # first check
+            self._generation = generation
+            return
+
+
+        if generation == self._generation:
+            return
+
+
+        logger.warning('Satellite data updated, clearing ephemeris cache')
+        self._generation = generation
+        self.clear()
@@ -15,6 +15,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class boto3_s3(GenericFileTransfer):
+
+    # http connections are reused by the client library
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(boto3_s3, self).__init__(*args, **kwargs)
 
@@ -16,6 +16,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class gcp_storage(GenericFileTransfer):
+
+    # http connections are reused by the client library
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(gcp_storage, self).__init__(*args, **kwargs)
 
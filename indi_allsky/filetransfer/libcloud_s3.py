@@ -14,6 +14,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class libcloud_s3(GenericFileTransfer):
+
+    # http connections are reused by the client library
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(libcloud_s3, self).__init__(*args, **kwargs)
 
@@ -17,6 +17,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class oci_storage(GenericFileTransfer):
+
+    # http connections are reused by the client library
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(oci_storage, self).__init__(*args, **kwargs)
 
@@ -0,0 +1,141 @@
+import time
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger('indi_allsky')
+
+
+class FileTransferPool(object):
+    def __init__(self, idle_timeout=300):
+        self._idle_timeout = float(idle_timeout)
+
+        # connected clients, the key is a client instance
+        self._clients = dict()
+
+        self._handshakes = 0
+        self._reuses = 0
+        self._failures = 0
+
+
+    @property
+    def idle_timeout(self):
+        return self._idle_timeout
+
+    @idle_timeout.setter
+    def idle_timeout(self, new_idle_timeout):
+        self._idle_timeout = float(new_idle_timeout)
+
+
+    @property
+    def stats(self):
+        return {
+            'connections' : len(self._clients),
+            'handshakes'  : self._handshakes,
+            'reuses'      : self._reuses,
+            'failures'    : self._failures,
+        }
+
+    @stats.setter
+    def stats(self, *args):
+        pass  # read only
+
+
+    def connect(self, client, connect_kwargs):
+        key = self._getKey(client, connect_kwargs)
+
+        pool_entry = self._clients.get(key)
+        if pool_entry:
+            pooled_client = pool_entry['client']
+
+            if pooled_client.healthy():
+                logger.info('Reusing %s connection', pooled_client.__class__.__name__)
+                self._reuses += 1
+                pool_entry['last_used'] = time.time()
+                return pooled_client
+
+
+            logger.warning('Pooled %s connection is not healthy, reconnecting', pooled_client.__class__.__name__)
+            self.discard(pooled_client)
+
+
+        # exceptions are handled by the caller
+        client.connect(**connect_kwargs)
+        self._handshakes += 1
+
+
+        if client.reusable and self._idle_timeout > 0:
+            self._clients[key] = {
+                'client'    : client,
+                'last_used' : time.time(),
+            }
+
+
+        return client
+
+
+    def release(self, client):
+        # return the client to the pool after a successful transfer
+        for key, pool_entry in self._clients.items():
+            if pool_entry['client'] is client:
+                pool_entry['last_used'] = time.time()
+                return
+
+
+        # client is not pooled
+        client.close()
+
+
+    def discard(self, client):
+        # remove a client after a failure
+        self._failures += 1
+
+        for key, pool_entry in list(self._clients.items()):
+            if pool_entry['client'] is client:
+                del self._clients[key]
+                break
+
+
+        try:
+            client.close()
+        except Exception as e:
+            logger.error('Error closing %s connection: %s', client.__class__.__name__, str(e))
+
+
+    def expire(self):
+        now = time.time()
+
+        for key, pool_entry in list(self._clients.items()):
+            if now - pool_entry['last_used'] < self._idle_timeout:
+                continue
+
+            logger.info('Closing idle %s connection', pool_entry['client'].__class__.__name__)
+            del self._clients[key]
+
+            try:
+                pool_entry['client'].close()
+            except Exception as e:
+                logger.error('Error closing %s connection: %s', pool_entry['client'].__class__.__name__, str(e))
+
+
+    def closeAll(self):
+        for key, pool_entry in list(self._clients.items()):
+            del self._clients[key]
+
+            try:
+                pool_entry['client'].close()
+            except Exception as e:
+                logger.error('Error closing %s connection: %s', pool_entry['client'].__class__.__name__, str(e))
+
+
+    def _getKey(self, client, connect_kwargs):
+        # credentials are hashed, not stored in the key
+        creds_hash = hashlib.sha256(json.dumps(connect_kwargs, sort_keys=True, default=str).encode()).hexdigest()
+
+        return (
+            client.__class__.__name__,
+            connect_kwargs.get('hostname'),
+            client.port,
+            bool(client.delete),
+            creds_hash,
+        )
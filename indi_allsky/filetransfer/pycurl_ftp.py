@@ -13,6 +13,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class pycurl_ftp(GenericFileTransfer):
+
+    # curl handles keep connections open and reconnect when needed
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(pycurl_ftp, self).__init__(*args, **kwargs)
 
@@ -76,6 +81,10 @@ class pycurl_ftp(GenericFileTransfer):
             self.client.close()
 
 
+    def healthy(self):
+        return bool(self.client)
+
+
     def put(self, *args, **kwargs):
         super(pycurl_ftp, self).put(*args, **kwargs)
 
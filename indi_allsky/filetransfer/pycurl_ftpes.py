@@ -14,6 +14,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class pycurl_ftpes(GenericFileTransfer):
+
+    # curl handles keep connections open and reconnect when needed
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(pycurl_ftpes, self).__init__(*args, **kwargs)
 
@@ -86,6 +91,10 @@ class pycurl_ftpes(GenericFileTransfer):
             self.client.close()
 
 
+    def healthy(self):
+        return bool(self.client)
+
+
     def put(self, *args, **kwargs):
         super(pycurl_ftpes, self).put(*args, **kwargs)
 
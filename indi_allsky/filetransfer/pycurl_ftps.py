@@ -14,6 +14,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class pycurl_ftps(GenericFileTransfer):
+
+    # curl handles keep connections open and reconnect when needed
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(pycurl_ftps, self).__init__(*args, **kwargs)
 
@@ -83,6 +88,10 @@ class pycurl_ftps(GenericFileTransfer):
             self.client.close()
 
 
+    def healthy(self):
+        return bool(self.client)
+
+
     def put(self, *args, **kwargs):
         super(pycurl_ftps, self).put(*args, **kwargs)
 
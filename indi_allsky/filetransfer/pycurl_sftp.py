@@ -14,6 +14,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class pycurl_sftp(GenericFileTransfer):
+
+    # curl handles keep connections open and reconnect when needed
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(pycurl_sftp, self).__init__(*args, **kwargs)
 
@@ -100,6 +105,10 @@ class pycurl_sftp(GenericFileTransfer):
             self.client.close()
 
 
+    def healthy(self):
+        return bool(self.client)
+
+
     def put(self, *args, **kwargs):
         super(pycurl_sftp, self).put(*args, **kwargs)
 
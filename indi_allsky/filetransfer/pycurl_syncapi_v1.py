@@ -132,6 +132,89 @@ class pycurl_syncapi_v1(GenericFileTransfer):
 
         start = time.time()
 
+        response = self._perform()
+
+        upload_elapsed_s = time.time() - start
+        logger.info('File transferred in %0.4f s (%0.2f kB/s)', upload_elapsed_s, local_file_size / upload_elapsed_s / 1024)
+
+
+        return response
+
+
+    def put_batch(self, *args, **kwargs):
+        ### Upload multiple assets for one camera in a single request
+        # the url must be the batch endpoint
+
+        import pycurl
+
+
+        metadata = kwargs['metadata']
+        asset_list = kwargs['asset_list']
+
+
+        logger.info('Uploading batch of %d assets', len(asset_list))
+
+
+        metadata['assets'] = list()
+
+        files = list()
+        total_size = 0
+
+        for asset in asset_list:
+            local_file_p = Path(asset['local_file'])
+
+            # assets that cannot be read are dropped from the batch, the caller fails the task
+            try:
+                local_file_size = local_file_p.stat().st_size
+            except OSError as e:
+                logger.error('Unable to read %s: %s', local_file_p, str(e))
+                asset['error'] = str(e)
+                continue
+
+            files.append((
+                'media_{0:d}'.format(len(metadata['assets'])), (
+                    pycurl.FORM_FILE, str(local_file_p),
+                    pycurl.FORM_FILENAME, local_file_p.name,  # need file extension from original file
+                    pycurl.FORM_CONTENTTYPE, 'application/octet-stream',
+                )
+            ))
+
+            asset['metadata']['file_size'] = local_file_size  # needed to validate
+            metadata['assets'].append(asset['metadata'])
+            total_size += local_file_size
+
+
+        if not metadata['assets']:
+            return {'assets' : []}
+
+
+        files.insert(0, (
+            'metadata', (
+                pycurl.FORM_BUFFER, 'metadata.json',
+                pycurl.FORM_BUFFERPTR, json.dumps(metadata),
+                pycurl.FORM_CONTENTTYPE, 'application/json',
+            )
+        ))
+
+
+        self.client.setopt(pycurl.HTTPPOST, files)
+
+
+        start = time.time()
+
+        response = self._perform()
+
+        upload_elapsed_s = time.time() - start
+        logger.info('Batch transferred in %0.4f s (%0.2f kB/s)', upload_elapsed_s, total_size / upload_elapsed_s / 1024)
+
+
+        return response
+
+
+    def _perform(self):
+        import pycurl
+
+
         self.client.setopt(pycurl.URL, self.url)
 
         #self.client.setopt(pycurl.POST, 1)
@@ -166,10 +249,6 @@ class pycurl_syncapi_v1(GenericFileTransfer):
                 raise e from e
 
 
-        upload_elapsed_s = time.time() - start
-        logger.info('File transferred in %0.4f s (%0.2f kB/s)', upload_elapsed_s, local_file_size / upload_elapsed_s / 1024)
-
-
         response_str = response_buffer.getvalue().decode()
         logger.info('Response: %s', response_str)
 
@@ -180,4 +259,3 @@ class pycurl_syncapi_v1(GenericFileTransfer):
 
 
         return response
-
@@ -14,6 +14,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class pycurl_webdav_https(GenericFileTransfer):
+
+    # curl handles keep connections open and reconnect when needed
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(pycurl_webdav_https, self).__init__(*args, **kwargs)
 
@@ -87,6 +92,10 @@ class pycurl_webdav_https(GenericFileTransfer):
             self.client.close()
 
 
+    def healthy(self):
+        return bool(self.client)
+
+
     def put(self, *args, **kwargs):
         super(pycurl_webdav_https, self).put(*args, **kwargs)
 
@@ -113,6 +122,7 @@ class pycurl_webdav_https(GenericFileTransfer):
             d_url = '{0:s}/{1:s}'.format(self.url, d_str)
 
             self.client.setopt(pycurl.URL, d_url)
+            self.client.setopt(pycurl.UPLOAD, 0)  # reset from previous transfer
             self.client.setopt(pycurl.CUSTOMREQUEST, 'MKCOL')  # mkdir
 
             try:
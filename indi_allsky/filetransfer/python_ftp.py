@@ -15,6 +15,10 @@ logger = logging.getLogger('indi_allsky')
 
 
 class python_ftp(GenericFileTransfer):
+
+    reusable = True
+
+
     def __init__(self, *args, **kwargs):
         super(python_ftp, self).__init__(*args, **kwargs)
 
@@ -54,7 +58,23 @@ class python_ftp(GenericFileTransfer):
         super(python_ftp, self).close()
 
         if self.client:
-            self.client.quit()
+            try:
+                self.client.quit()
+            except (ftplib.Error, OSError, EOFError):
+                # connection already closed
+                self.client.close()
+
+
+    def healthy(self):
+        if not self.client:
+            return False
+
+        try:
+            self.client.voidcmd('NOOP')
+        except (ftplib.Error, OSError, EOFError):
+            return False
+
+        return True
 
 
     def put(self, *args, **kwargs):
@@ -27,6 +27,8 @@ logger = logging.getLogger('indi_allsky')
 
 class requests_syncapi_v1(GenericFileTransfer):
 
+    reusable = True
+
     time_skew = 300  # number of seconds the client is allowed to deviate from server
 
 
@@ -59,7 +61,8 @@ class requests_syncapi_v1(GenericFileTransfer):
         self.url = endpoint_url
 
 
-        self.client = requests
+        # session keeps the connection alive between transfers
+        self.client = requests.Session()
 
 
         if cert_bypass:
@@ -70,6 +73,13 @@ class requests_syncapi_v1(GenericFileTransfer):
     def close(self):
         super(requests_syncapi_v1, self).close()
 
+        if self.client:
+            self.client.close()
+
+
+    def healthy(self):
+        return bool(self.client)
+
 
     def put(self, *args, **kwargs):
         super(requests_syncapi_v1, self).put(*args, **kwargs)
@@ -81,6 +91,116 @@ class requests_syncapi_v1(GenericFileTransfer):
 
         #logger.info('requests URL: %s', self.url)
 
+        local_file_p, local_file_size, f_media = self._openMedia(metadata, local_file, empty_file)
+
+
+        json_metadata = json.dumps(metadata)
+        f_metadata = io.StringIO(json_metadata)
+
+
+        fields = {
+            'metadata' : (
+                'metadata.json',
+                f_metadata,
+                'application/json',
+            ),
+            'media' : (
+                local_file_p.name,  # need file extension from original file
+                f_media,
+                'application/octet-stream',
+            ),
+        }
+
+
+        start = time.time()
+
+        try:
+            r = self._putFields(fields, json_metadata)
+        finally:
+            f_metadata.close()
+            f_media.close()
+
+
+        upload_elapsed_s = time.time() - start
+        logger.info('File transferred in %0.4f s (%0.2f kB/s)', upload_elapsed_s, local_file_size / upload_elapsed_s / 1024)
+
+
+        return json.loads(r.text)
+
+
+    def put_batch(self, *args, **kwargs):
+        ### Upload multiple assets for one camera in a single request
+        # the url must be the batch endpoint
+
+        metadata = kwargs['metadata']
+        asset_list = kwargs['asset_list']
+        empty_file = kwargs['empty_file']
+
+
+        logger.info('Uploading batch of %d assets', len(asset_list))
+
+
+        metadata['assets'] = list()
+
+        f_media_list = list()
+        fields = dict()
+        total_size = 0
+
+        try:
+            for asset in asset_list:
+                # assets that cannot be read are dropped from the batch, the caller fails the task
+                try:
+                    local_file_p, local_file_size, f_media = self._openMedia(asset['metadata'], asset['local_file'], empty_file)
+                except OSError as e:
+                    logger.error('Unable to read %s: %s', asset['local_file'], str(e))
+                    asset['error'] = str(e)
+                    continue
+
+                f_media_list.append(f_media)
+
+                fields['media_{0:d}'.format(len(metadata['assets']))] = (
+                    local_file_p.name,  # need file extension from original file
+                    f_media,
+                    'application/octet-stream',
+                )
+
+                metadata['assets'].append(asset['metadata'])
+                total_size += local_file_size
+
+
+            if not metadata['assets']:
+                return {'assets' : []}
+
+
+            json_metadata = json.dumps(metadata)
+            f_metadata = io.StringIO(json_metadata)
+
+            fields['metadata'] = (
+                'metadata.json',
+                f_metadata,
+                'application/json',
+            )
+
+
+            start = time.time()
+
+            try:
+                r = self._putFields(fields, json_metadata)
+            finally:
+                f_metadata.close()
+        finally:
+            for f_media in f_media_list:
+                f_media.close()
+
+
+        upload_elapsed_s = time.time() - start
+        logger.info('Batch transferred in %0.4f s (%0.2f kB/s)', upload_elapsed_s, total_size / upload_elapsed_s / 1024)
+
+
+        return json.loads(r.text)
+
+
+    def _openMedia(self, metadata, local_file, empty_file):
         # cameras do not have files
         if str(local_file) == 'camera':
             local_file_p = Path('bogus.ext')
@@ -101,24 +221,10 @@ class requests_syncapi_v1(GenericFileTransfer):
                 metadata['file_size'] = 0
 
 
-        json_metadata = json.dumps(metadata)
-        f_metadata = io.StringIO(json_metadata)
-
-
-        fields = {
-            'metadata' : (
-                'metadata.json',
-                f_metadata,
-                'application/json',
-            ),
-            'media' : (
-                local_file_p.name,  # need file extension from original file
-                f_media,
-                'application/octet-stream',
-            ),
-        }
+        return local_file_p, local_file_size, f_media
 
 
+    def _putFields(self, fields, json_metadata):
         mp_enc = MultipartEncoder(fields=fields)
 
 
@@ -136,13 +242,10 @@ class requests_syncapi_v1(GenericFileTransfer):
 
         headers = {
             'Authorization' : 'Bearer {0:s}:{1:s}'.format(self.username, message_hmac),
-            'Connection'    : 'close',  # no need for keep alives
             'Content-Type'  : mp_enc.content_type,
         }
 
 
-        start = time.time()
-
         try:
             # put allows overwrites
             r = self.client.put(
@@ -166,18 +269,10 @@ class requests_syncapi_v1(GenericFileTransfer):
             raise CertificateValidationFailure(str(e)) from e
         except requests.exceptions.SSLError as e:
             raise CertificateValidationFailure(str(e)) from e
-        finally:
-            f_metadata.close()
-            f_media.close()
 
 
         if r.status_code >= 400:
             raise TransferFailure('Sync error: {0:d}'.format(r.status_code))
 
 
-        upload_elapsed_s = time.time() - start
-        logger.info('File transferred in %0.4f s (%0.2f kB/s)', upload_elapsed_s, local_file_size / upload_elapsed_s / 1024)
-
-
-        return json.loads(r.text)
-
+        return r
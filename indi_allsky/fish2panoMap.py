@@ -0,0 +1,144 @@
+import math
+from pathlib import Path
+import hashlib
+import tempfile
+import time
+import cv2
+import numpy
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyFish2PanoMap(object):
+
+    def __init__(self, config):
+        self.config = config
+
+        # only the most recent maps are kept in memory
+        self._map_key = None
+        self._map1 = None
+        self._map2 = None
+
+
+        if self.config.get('IMAGE_FOLDER'):
+            image_dir = Path(self.config['IMAGE_FOLDER']).absolute()
+        else:
+            image_dir = Path(__file__).parent.parent.joinpath('html', 'images').absolute()
+
+        self.cache_dir = image_dir.joinpath('cache')
+
+
+    def remap(self, image):
+        height, width = image.shape[:2]
+
+        angle = int(self.config.get('FISH2PANO', {}).get('ROTATE_ANGLE', 0))
+        x_offset = self.config.get('FISH2PANO', {}).get('OFFSET_X', 0)
+        y_offset = self.config.get('FISH2PANO', {}).get('OFFSET_Y', 0)
+        radius = self.config.get('FISH2PANO', {}).get('DIAMETER', 3000) / 2
+        scale = self.config.get('FISH2PANO', {}).get('SCALE', 0.3)
+
+
+        map_key = (width, height, angle, x_offset, y_offset, radius, scale)
+
+        if map_key != self._map_key:
+            self._map1, self._map2 = self._getMaps(map_key)
+            self._map_key = map_key
+
+
+        return cv2.remap(image, self._map1, self._map2, interpolation=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+
+
+    def _getMaps(self, map_key):
+        map_hash = hashlib.md5(str(map_key).encode()).hexdigest()
+        map_p = self.cache_dir.joinpath('fish2pano_{0:s}.npz'.format(map_hash))
+
+
+        if map_p.exists():
+            try:
+                with numpy.load(str(map_p)) as map_data:
+                    logger.info('Loaded panorama maps: %s', map_p)
+                    return map_data['map1'], map_data['map2']
+            except (OSError, ValueError, KeyError) as e:
+                logger.error('Unable to load panorama maps: %s', str(e))
+
+
+        map1, map2 = self._buildMaps(*map_key)
+
+
+        try:
+            self._saveMaps(map_p, map1, map2)
+        except OSError as e:
+            logger.error('Unable to save panorama maps: %s', str(e))
+
+
+        return map1, map2
+
+
+    def _buildMaps(self, width, height, angle, x_offset, y_offset, radius, scale):
+        build_start = time.time()
+
+        center_x = int(width / 2)
+        center_y = int(height / 2)
+
+        # same bounding box as the rotated image in the fish2pano module path
+        rot = cv2.getRotationMatrix2D((center_x, center_y), angle, 1.0)
+
+        abs_cos = abs(rot[0, 0])
+        abs_sin = abs(rot[0, 1])
+
+        bound_w = int(height * abs_sin + width * abs_cos)
+        bound_h = int(height * abs_cos + width * abs_sin)
+
+        rot[0, 2] += bound_w / 2 - center_x
+        rot[1, 2] += bound_h / 2 - center_y
+
+
+        rot_center_x = int(bound_w / 2) + x_offset
+        rot_center_y = int(bound_h / 2) - y_offset  # note minus for y
+
+
+        pano_w = int(scale * 2 * math.pi * radius + 0.5)
+        pano_h = int(scale * radius + 0.5)
+
+        # width and height needs to be divisible by 2 for timelapse
+        mod_height = pano_h % 2
+        crop_width = pano_w - (pano_w % 2)
+
+
+        theta = (2.0 * math.pi) * numpy.arange(crop_width, dtype=numpy.float32) / pano_w
+        r_0 = radius * numpy.arange(mod_height, pano_h, dtype=numpy.float32) / pano_h  # trim the top
+
+        rot_x = numpy.outer(r_0, numpy.cos(theta)) + rot_center_x
+        rot_y = numpy.outer(r_0, numpy.sin(theta)) + rot_center_y
+
+
+        # fold the rotation into the map, coordinates in the rotated image map back to the original
+        inv_rot = cv2.invertAffineTransform(rot)
+
+        map_x = (inv_rot[0, 0] * rot_x + inv_rot[0, 1] * rot_y + inv_rot[0, 2]).astype(numpy.float32)
+        map_y = (inv_rot[1, 0] * rot_x + inv_rot[1, 1] * rot_y + inv_rot[1, 2]).astype(numpy.float32)
+
+
+        # fixed point maps are faster with remap
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+        build_elapsed_s = time.time() - build_start
+        logger.info('Built panorama maps (%d x %d) in %0.4f s', crop_width, pano_h - mod_height, build_elapsed_s)
+
+        return map1, map2
+
+
+    def _saveMaps(self, map_p, map1, map2):
+        if not self.cache_dir.exists():
+            self.cache_dir.mkdir(mode=0o755, parents=True)
+
+
+        f_tmp_npz = tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix='.npz', delete=False)
+        numpy.savez(f_tmp_npz, map1=map1, map2=map2)
+        f_tmp_npz.flush()
+        f_tmp_npz.close()
+
+        # atomic rename
+        Path(f_tmp_npz.name).rename(map_p)
@@ -1,9 +1,12 @@
 import os
 import json
+import time
 from pathlib import Path
 from logging.config import dictConfig
 
 from flask import Flask
+from flask import g
+from flask import request
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_wtf.csrf import CSRFProtect
@@ -112,6 +115,28 @@ def create_app():
         return IndiAllSkyDbUserTable.query.get(int(user_id))
 
 
+    @app.before_request
+    def request_timer_start():
+        g.request_start = time.time()
+
+
+    @app.after_request
+    def request_timer_header(response):
+        # request latency is visible in the browser developer tools
+        request_start = g.get('request_start')
+        if isinstance(request_start, type(None)):
+            # an earlier before_request handler (CSRF) aborted the request
+            return response
+
+        request_elapsed_ms = (time.time() - request_start) * 1000
+        response.headers['Server-Timing'] = 'app;dur={0:0.1f}'.format(request_elapsed_ms)
+
+        if app.config.get('REQUEST_TIMING_LOG'):
+            app.logger.info('Request %s completed in %0.1f ms', request.path, request_elapsed_ms)
+
+        return response
+
+
     with app.app_context():
         from sqlalchemy import event
 
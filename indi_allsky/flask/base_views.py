@@ -28,6 +28,8 @@ from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.sql.expression import false as sa_false
 #from sqlalchemy.sql.expression import null as sa_null
 
+from . import db
+
 from .misc import login_optional
 
 from .models import NotificationCategory
@@ -44,12 +46,20 @@ from .miscDb import miscDb
 class BaseView(View):
     decorators = [login_optional]  # auth based on app.config['INDI_ALLSKY_AUTH_ALL_VIEWS']
 
+    camera_cache_seconds = 15
+    sun_set_cache_seconds = 60
+
+    # per process caches, keys are camera ids
+    _camera_cache = dict()
+    _sun_set_cache = dict()
+
+
     def __init__(self, **kwargs):
         super(BaseView, self).__init__(**kwargs)
-        from ..config import IndiAllSkyConfig  # prevent circular import
+        from ..config import IndiAllSkyConfigCached  # prevent circular import
 
         # not catching exception
-        self._indi_allsky_config_obj = IndiAllSkyConfig()
+        self._indi_allsky_config_obj = IndiAllSkyConfigCached()
 
         self.indi_allsky_config = self._indi_allsky_config_obj.config
 
@@ -118,15 +128,28 @@ class BaseView(View):
             return FakeCamera()
 
 
+        camera_entry = self._camera_cache.get(camera_id)
+        if camera_entry and time.time() < camera_entry['expire']:
+            # attach the cached camera to this session without a query
+            return db.session.merge(camera_entry['camera'], load=False)
+
+
         camera = IndiAllSkyDbCameraTable.query\
             .filter(IndiAllSkyDbCameraTable.id == camera_id)\
             .first()
 
         if not camera:
             # this can happen when cameras are deleted
+            self._camera_cache.pop(camera_id, None)
             session['camera_id'] = -1
             return FakeCamera()
 
+
+        self._camera_cache[camera_id] = {
+            'camera' : camera,
+            'expire' : time.time() + self.camera_cache_seconds,
+        }
+
         return camera
 
 
@@ -187,6 +210,14 @@ class BaseView(View):
 
 
     def getSunSetDate(self):
+        sun_set_key = (self.camera.latitude, self.camera.longitude, self.camera.elevation, self.camera.nightSunAlt)
+
+        sun_set_entry = self._sun_set_cache.get(self.camera.id)
+        if sun_set_entry and sun_set_entry['key'] == sun_set_key and time.time() < sun_set_entry['expire']:
+            self.sun_set_date = sun_set_entry['sun_set_date']
+            return
+
+
         utcnow = datetime.now(tz=timezone.utc)  # ephem expects UTC dates
 
         obs = ephem.Observer()
@@ -212,6 +243,19 @@ class BaseView(View):
             self.sun_set_date = None
 
 
+        sun_set_expire = time.time() + self.sun_set_cache_seconds
+
+        if self.sun_set_date:
+            # the next sun set changes after the sun sets
+            sun_set_expire = min(sun_set_expire, self.sun_set_date.replace(tzinfo=timezone.utc).timestamp())
+
+        self._sun_set_cache[self.camera.id] = {
+            'key'          : sun_set_key,
+            'sun_set_date' : self.sun_set_date,
+            'expire'       : sun_set_expire,
+        }
+
+
     def _load_detection_mask(self):
         import cv2
         from multiprocessing import Value
@@ -5,6 +5,7 @@ import re
 import json
 import time
 from datetime import datetime
+from datetime import timedelta
 import tempfile
 import subprocess
 
@@ -42,6 +43,7 @@ from flask import current_app as app
 
 from .models import IndiAllSkyDbCameraTable
 from .models import IndiAllSkyDbImageTable
+from .models import IndiAllSkyDbImageCalendarTable
 from .models import IndiAllSkyDbVideoTable
 from .models import IndiAllSkyDbKeogramTable
 from .models import IndiAllSkyDbStarTrailsTable
@@ -514,6 +516,17 @@ def LOCATION_ELEVATION_validator(form, field):
         raise ValidationError('Please enter valid number')
 
 
+def ASTROMETRIC_PLANET_INTERVAL_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 0:
+        raise ValidationError('Interval must be 0 or greater')
+
+    if field.data > 3600:
+        raise ValidationError('Interval must be 3600 or less')
+
+
 def CLAHE_CLIPLIMIT_validator(form, field):
     if not isinstance(field.data, (int, float)):
         raise ValidationError('Please enter valid number')
@@ -909,6 +922,25 @@ def IMAGE_QUEUE_BACKOFF_validator(form, field):
         raise ValidationError('Backoff multiplier must be greater than 0')
 
 
+def IMAGE_WORKERS_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 1:
+        raise ValidationError('Worker count must be 1 or greater')
+
+    if field.data > 8:
+        raise ValidationError('Worker count must be 8 or less')
+
+
+def IMAGE_CALIBRATE_CACHE_MB_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 0:
+        raise ValidationError('Cache size must be 0 or greater')
+
+
 def IMAGE_FILE_TYPE_validator(form, field):
     if field.data not in ('jpg', 'png', 'tif', 'webp'):
         raise ValidationError('Please select a valid file type')
@@ -1261,6 +1293,29 @@ def IMAGE_EXPIRE_DAYS_validator(form, field):
         raise ValidationError('Image Expiration must be 1 or greater')
 
 
+def THUMBNAILS__SIZES_STR_validator(form, field):
+    if not field.data:
+        return
+
+
+    for size_str in field.data.split(','):
+        size_str = size_str.strip()
+
+        if not size_str:
+            continue
+
+        try:
+            size = int(size_str)
+        except ValueError:
+            raise ValidationError('Please enter a comma separated list of numbers')
+
+        if size < 10:
+            raise ValidationError('Thumbnail size must be 10 or greater')
+
+        if size > 2000:
+            raise ValidationError('Thumbnail size must be 2000 or less')
+
+
 def TIMELAPSE_EXPIRE_DAYS_validator(form, field):
     if not isinstance(field.data, int):
         raise ValidationError('Please enter valid number')
@@ -1473,6 +1528,25 @@ def UPLOAD_WORKERS_validator(form, field):
         raise ValidationError('Worker count must be less than 5')
 
 
+def UPLOAD_IDLE_TIMEOUT_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 0:
+        raise ValidationError('Idle timeout must be 0 or greater')
+
+
+def UPLOAD_BATCH_MAX_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 1:
+        raise ValidationError('Batch size must be 1 or greater')
+
+    if field.data > 100:
+        raise ValidationError('Batch size must be 100 or less')
+
+
 def FILETRANSFER__CLASSNAME_validator(form, field):
     class_names = (
         'pycurl_sftp',
@@ -1969,6 +2043,22 @@ def MQTTPUBLISH__QOS_validator(form, field):
         raise ValidationError('Invalid QoS')
 
 
+def MQTTPUBLISH__IMAGE_PERIOD_validator(form, field):
+    if not isinstance(field.data, int):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 0:
+        raise ValidationError('Image publish period must be 0 or greater')
+
+
+def MQTTPUBLISH__DEADBAND_validator(form, field):
+    if not isinstance(field.data, (int, float)):
+        raise ValidationError('Please enter valid number')
+
+    if field.data < 0:
+        raise ValidationError('Deadband must be 0 or greater')
+
+
 def SYNCAPI__BASEURL_validator(form, field):
     url_regex = r'^[a-zA-Z0-9\-\/\.\:\\]+$'
 
@@ -2624,6 +2714,7 @@ class IndiAllskyConfigForm(FlaskForm):
     WBB_FACTOR                       = FloatField('Blue Balance Factor', validators=[WB_FACTOR_validator])
     AUTO_WB                          = BooleanField('Auto White Balance')
     SATURATION_FACTOR                = FloatField('Saturation Factor', validators=[SATURATION_FACTOR_validator])
+    COLOR_TRANSFORM_FUSED            = BooleanField('Fused Color Transform')
     CCD_COOLING                      = BooleanField('CCD Cooling')
     CCD_TEMP                         = FloatField('Target CCD Temp', validators=[CCD_TEMP_validator])
     TEMP_DISPLAY                     = SelectField('Temperature Display', choices=TEMP_DISPLAY_choices, validators=[DataRequired(), TEMP_DISPLAY_validator])
@@ -2642,6 +2733,7 @@ class IndiAllskyConfigForm(FlaskForm):
     DETECT_STARS                     = BooleanField('Star Detection')
     DETECT_STARS_THOLD               = FloatField('Star Detection Threshold', validators=[DataRequired(), DETECT_STARS_THOLD_validator])
     DETECT_METEORS                   = BooleanField('Meteor Detection')
+    DETECT_METEORS_PREPASS           = BooleanField('Meteor Detection Pre-pass')
     DETECT_MASK                      = StringField('Detection Mask', validators=[DETECT_MASK_validator])
     DETECT_DRAW                      = BooleanField('Mark Detections on Image')
     LOGO_OVERLAY                     = StringField('Logo Overlay', validators=[LOGO_OVERLAY_validator])
@@ -2656,6 +2748,7 @@ class IndiAllskyConfigForm(FlaskForm):
     LOCATION_LATITUDE                = FloatField('Latitude', validators=[LOCATION_LATITUDE_validator])
     LOCATION_LONGITUDE               = FloatField('Longitude', validators=[LOCATION_LONGITUDE_validator])
     LOCATION_ELEVATION               = IntegerField('Elevation', validators=[LOCATION_ELEVATION_validator])
+    ASTROMETRIC_PLANET_INTERVAL      = IntegerField('Planet Interval', validators=[ASTROMETRIC_PLANET_INTERVAL_validator])
     TIMELAPSE_ENABLE                 = BooleanField('Enable Timelapse Creation')
     TIMELAPSE_SKIP_FRAMES            = IntegerField('Timelapse Skip Frames', validators=[TIMELAPSE_SKIP_FRAMES_validator])
     DAYTIME_CAPTURE                  = BooleanField('Daytime Capture')
@@ -2684,6 +2777,8 @@ class IndiAllskyConfigForm(FlaskForm):
     KEOGRAM_CROP_TOP                 = IntegerField('Keogram Crop Top (%)', validators=[KEOGRAM_CROP_TOP_validator])
     KEOGRAM_CROP_BOTTOM              = IntegerField('Keogram Crop Bottom (%)', validators=[KEOGRAM_CROP_BOTTOM_validator])
     KEOGRAM_LABEL                    = BooleanField('Label Keogram')
+    KEOGRAM_MEMMAP                   = BooleanField('Disk Backed Keogram')
+    KEOGRAM_STARTRAILS_INCREMENTAL   = BooleanField('Incremental Keogram/Star Trails')
     STARTRAILS_SUN_ALT_THOLD         = FloatField('Star Trails Max Sun Altitude', validators=[DataRequired(), STARTRAILS_SUN_ALT_THOLD_validator])
     STARTRAILS_MOONMODE_THOLD        = BooleanField('Star Trails Exclude Moon Mode')
     STARTRAILS_MOON_ALT_THOLD        = FloatField('Custom Max Moon Altitude', validators=[DataRequired(), STARTRAILS_MOON_ALT_THOLD_validator])
@@ -2696,6 +2791,8 @@ class IndiAllskyConfigForm(FlaskForm):
     STARTRAILS_TIMELAPSE_MINFRAMES   = IntegerField('Star Trails Timelapse Minimum Frames', validators=[DataRequired(), STARTRAILS_TIMELAPSE_MINFRAMES_validator])
     STARTRAILS_USE_DB_DATA           = BooleanField('Star Trails Use Existing Data')
     IMAGE_CALIBRATE_DARK             = BooleanField('Apply Dark Calibration Frames')
+    IMAGE_CALIBRATE_CACHE_MB         = IntegerField('Calibration Cache (MB)', validators=[IMAGE_CALIBRATE_CACHE_MB_validator])
+    IMAGE_CALIBRATE_CACHE_MMAP       = BooleanField('Memory Map Cached Darks')
     IMAGE_SAVE_FITS_PRE_DARK         = BooleanField('Save FITS Pre-Calibration')
     IMAGE_EXIF_PRIVACY               = BooleanField('Enable EXIF Privacy')
     IMAGE_FILE_TYPE                  = SelectField('Image file type', choices=IMAGE_FILE_TYPE_choices, validators=[DataRequired(), IMAGE_FILE_TYPE_validator])
@@ -2724,6 +2821,9 @@ class IndiAllskyConfigForm(FlaskForm):
     IMAGE_QUEUE_MAX                  = IntegerField('Image Queue Maximum', validators=[IMAGE_QUEUE_MAX_validator])
     IMAGE_QUEUE_MIN                  = IntegerField('Image Queue Minimum', validators=[IMAGE_QUEUE_MIN_validator])
     IMAGE_QUEUE_BACKOFF              = FloatField('Image Queue Backoff Multiplier', validators=[IMAGE_QUEUE_BACKOFF_validator])
+    IMAGE_SHARED_MEMORY              = BooleanField('Shared Memory Frames')
+    IMAGE_WORKERS                    = IntegerField('Image Workers', validators=[DataRequired(), IMAGE_WORKERS_validator])
+    IMAGE_PIPELINE                   = BooleanField('Image Pipeline')
     FISH2PANO__ENABLE                = BooleanField('Enable Fisheye to Panoramic')
     FISH2PANO__DIAMETER              = IntegerField('Diameter', validators=[DataRequired(), FISH2PANO__DIAMETER_validator])
     FISH2PANO__OFFSET_X              = IntegerField('X Offset', validators=[FISH2PANO__OFFSET_X_validator])
@@ -2752,6 +2852,8 @@ class IndiAllskyConfigForm(FlaskForm):
     IMAGE_STACK_SPLIT                = BooleanField('Stack split screen')
     IMAGE_EXPIRE_DAYS                = IntegerField('Image expiration (days)', validators=[DataRequired(), IMAGE_EXPIRE_DAYS_validator])
     THUMBNAILS__IMAGES_AUTO          = BooleanField('Auto Generate Image Thumbnails')
+    THUMBNAILS__SIZES_STR            = StringField('Additional Thumbnail Sizes', validators=[THUMBNAILS__SIZES_STR_validator])
+    THUMBNAILS__BACKGROUND           = BooleanField('Background Thumbnails')
     TIMELAPSE_EXPIRE_DAYS            = IntegerField('Timelapse expiration (days)', validators=[DataRequired(), TIMELAPSE_EXPIRE_DAYS_validator])
     FFMPEG_FRAMERATE                 = IntegerField('FFMPEG Framerate', validators=[DataRequired(), FFMPEG_FRAMERATE_validator])
     FFMPEG_BITRATE                   = StringField('FFMPEG Bitrate', validators=[DataRequired(), FFMPEG_BITRATE_validator])
@@ -2796,6 +2898,8 @@ class IndiAllskyConfigForm(FlaskForm):
     ORB_PROPERTIES__AZ_OFFSET        = FloatField('Azimuth Offset', validators=[ORB_PROPERTIES__AZ_OFFSET_validator])
     ORB_PROPERTIES__RETROGRADE       = BooleanField('Reverse Orb Motion')
     UPLOAD_WORKERS                   = IntegerField('Upload Workers', validators=[DataRequired(), UPLOAD_WORKERS_validator])
+    UPLOAD_IDLE_TIMEOUT              = IntegerField('Upload Idle Timeout', validators=[UPLOAD_IDLE_TIMEOUT_validator])
+    UPLOAD_BATCH_MAX                 = IntegerField('Upload Batch Size', validators=[DataRequired(), UPLOAD_BATCH_MAX_validator])
     FILETRANSFER__CLASSNAME          = SelectField('Protocol', choices=FILETRANSFER__CLASSNAME_choices, validators=[DataRequired(), FILETRANSFER__CLASSNAME_validator])
     FILETRANSFER__HOST               = StringField('Host', validators=[FILETRANSFER__HOST_validator])
     FILETRANSFER__PORT               = IntegerField('Port', validators=[FILETRANSFER__PORT_validator])
@@ -2862,6 +2966,8 @@ class IndiAllskyConfigForm(FlaskForm):
     MQTTPUBLISH__TLS                 = BooleanField('Use TLS')
     MQTTPUBLISH__CERT_BYPASS         = BooleanField('Disable Certificate Validation')
     MQTTPUBLISH__PUBLISH_IMAGE       = BooleanField('Enable Image Publishing')
+    MQTTPUBLISH__IMAGE_PERIOD        = IntegerField('Image Publish Period', validators=[MQTTPUBLISH__IMAGE_PERIOD_validator])
+    MQTTPUBLISH__DEADBAND            = FloatField('Publish Deadband', validators=[MQTTPUBLISH__DEADBAND_validator])
     SYNCAPI__ENABLE                  = BooleanField('Enable Sync API')
     SYNCAPI__BASEURL                 = StringField('URL', validators=[SYNCAPI__BASEURL_validator])
     SYNCAPI__USERNAME                = StringField('Username', validators=[SYNCAPI__USERNAME_validator], render_kw={'autocomplete' : 'new-password'})
@@ -2869,6 +2975,7 @@ class IndiAllskyConfigForm(FlaskForm):
     SYNCAPI__CERT_BYPASS             = BooleanField('Disable Certificate Validation')
     SYNCAPI__POST_S3                 = BooleanField('Sync after S3 Upload')
     SYNCAPI__EMPTY_FILE              = BooleanField('Sync empty file')
+    SYNCAPI__BATCH                   = BooleanField('Batch Uploads')
     SYNCAPI__UPLOAD_IMAGE            = IntegerField('Transfer images', validators=[SYNCAPI__UPLOAD_IMAGE_validator])
     SYNCAPI__UPLOAD_PANORAMA         = IntegerField('Transfer panoramas', validators=[SYNCAPI__UPLOAD_IMAGE_validator])
     SYNCAPI__UPLOAD_VIDEO            = BooleanField('Transfer videos', render_kw={'disabled' : 'disabled'})
@@ -2903,6 +3010,7 @@ class IndiAllskyConfigForm(FlaskForm):
     LIBCAMERA__AWB_ENABLE_DAY        = BooleanField('Day Enable AWB')
     LIBCAMERA__EXTRA_OPTIONS         = StringField('Night libcamera extra options', validators=[LIBCAMERA__EXTRA_OPTIONS_validator])
     LIBCAMERA__EXTRA_OPTIONS_DAY     = StringField('Day libcamera extra options', validators=[LIBCAMERA__EXTRA_OPTIONS_validator])
+    LIBCAMERA__PERSISTENT            = BooleanField('Persistent libcamera session')
     PYCURL_CAMERA__URL               = StringField('pyCurl Camera URL', validators=[PYCURL_CAMERA__URL_validator])
     PYCURL_CAMERA__USERNAME          = StringField('Username', validators=[PYCURL_CAMERA__USERNAME_validator], render_kw={'autocomplete' : 'new-password'})
     PYCURL_CAMERA__PASSWORD          = PasswordField('Password', widget=PasswordInput(hide_value=False), validators=[PYCURL_CAMERA__PASSWORD_validator], render_kw={'autocomplete' : 'new-password'})
@@ -3187,39 +3295,24 @@ class IndiAllskyImageViewer(FlaskForm):
 
 
     def getYears(self):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
+        calendar_count = self._getCalendarCount()
 
         years_query = db.session.query(
-            createDate_year,
+            IndiAllSkyDbImageCalendarTable.year,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
+                    IndiAllSkyDbImageCalendarTable.camera_id == self.camera_id,
+                    calendar_count > 0,
                 )
-        )
-
-
-        if not self.local:
-            # Do not serve local assets
-            years_query = years_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
-
-
-        years_query = years_query\
+        )\
             .distinct()\
-            .order_by(createDate_year.desc())
+            .order_by(IndiAllSkyDbImageCalendarTable.year.desc())
 
 
         year_choices = []
         for y in years_query:
-            entry = (y.createDate_year, str(y.createDate_year))
+            entry = (y.year, str(y.year))
             year_choices.append(entry)
 
 
@@ -3227,44 +3320,27 @@ class IndiAllskyImageViewer(FlaskForm):
 
 
     def getMonths(self, year):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
-        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
+        calendar_count = self._getCalendarCount()
 
         months_query = db.session.query(
-            createDate_year,
-            createDate_month,
+            IndiAllSkyDbImageCalendarTable.month,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    createDate_year == year,
+                    IndiAllSkyDbImageCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbImageCalendarTable.year == int(year),
+                    calendar_count > 0,
                 )
         )\
-
-
-        if not self.local:
-            # Do not serve local assets
-            months_query = months_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
-
-
-        months_query = months_query\
             .distinct()\
-            .order_by(createDate_month.desc())
+            .order_by(IndiAllSkyDbImageCalendarTable.month.desc())
 
 
         month_choices = []
         for m in months_query:
-            month_name = datetime.strptime('{0} {1}'.format(year, m.createDate_month), '%Y %m')\
+            month_name = datetime.strptime('{0} {1}'.format(year, m.month), '%Y %m')\
                 .strftime('%B')
-            entry = (m.createDate_month, month_name)
+            entry = (m.month, month_name)
             month_choices.append(entry)
 
 
@@ -3272,45 +3348,26 @@ class IndiAllskyImageViewer(FlaskForm):
 
 
     def getDays(self, year, month):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
-        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
-        createDate_day = extract('day', IndiAllSkyDbImageTable.createDate).label('createDate_day')
+        calendar_count = self._getCalendarCount()
 
         days_query = db.session.query(
-            createDate_year,
-            createDate_month,
-            createDate_day,
+            IndiAllSkyDbImageCalendarTable.day,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    createDate_year == year,
-                    createDate_month == month,
+                    IndiAllSkyDbImageCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbImageCalendarTable.year == int(year),
+                    IndiAllSkyDbImageCalendarTable.month == int(month),
+                    calendar_count > 0,
                 )
-        )
-
-
-        if not self.local:
-            # Do not serve local assets
-            days_query = days_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
-
-
-        days_query = days_query\
+        )\
             .distinct()\
-            .order_by(createDate_day.desc())
+            .order_by(IndiAllSkyDbImageCalendarTable.day.desc())
 
 
         day_choices = []
         for d in days_query:
-            entry = (d.createDate_day, str(d.createDate_day))
+            entry = (d.day, str(d.day))
             day_choices.append(entry)
 
 
@@ -3318,59 +3375,52 @@ class IndiAllskyImageViewer(FlaskForm):
 
 
     def getHours(self, year, month, day):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
-        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
-        createDate_day = extract('day', IndiAllSkyDbImageTable.createDate).label('createDate_day')
-        createDate_hour = extract('hour', IndiAllSkyDbImageTable.createDate).label('createDate_hour')
+        calendar_count = self._getCalendarCount()
 
         hours_query = db.session.query(
-            createDate_year,
-            createDate_month,
-            createDate_day,
-            createDate_hour,
+            IndiAllSkyDbImageCalendarTable.hour,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    createDate_year == year,
-                    createDate_month == month,
-                    createDate_day == day,
+                    IndiAllSkyDbImageCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbImageCalendarTable.year == int(year),
+                    IndiAllSkyDbImageCalendarTable.month == int(month),
+                    IndiAllSkyDbImageCalendarTable.day == int(day),
+                    calendar_count > 0,
                 )
-        )
-
-
-        if not self.local:
-            # Do not serve local assets
-            hours_query = hours_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
-
-
-        hours_query = hours_query\
-            .distinct()\
-            .order_by(createDate_hour.desc())
+        )\
+            .order_by(IndiAllSkyDbImageCalendarTable.hour.desc())
 
 
         hour_choices = []
         for h in hours_query:
-            entry = (h.createDate_hour, str(h.createDate_hour))
+            entry = (h.hour, str(h.hour))
             hour_choices.append(entry)
 
 
         return hour_choices
 
 
+    def _getCalendarCount(self):
+        # the date pickers are served from the calendar table instead of the image table
+        if not self.local:
+            # Do not serve local assets
+            if self.detections_count:
+                return IndiAllSkyDbImageCalendarTable.remote_detection_count
+
+            return IndiAllSkyDbImageCalendarTable.remote_count
+
+
+        if self.detections_count:
+            return IndiAllSkyDbImageCalendarTable.detection_count
+
+        return IndiAllSkyDbImageCalendarTable.image_count
+
+
     def getImages(self, year, month, day, hour):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
-        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
-        createDate_day = extract('day', IndiAllSkyDbImageTable.createDate).label('createDate_day')
-        createDate_hour = extract('hour', IndiAllSkyDbImageTable.createDate).label('createDate_hour')
+        # a range on createDate can use the index
+        hour_start = datetime(int(year), int(month), int(day), int(hour))
+        hour_end = hour_start + timedelta(hours=1)
 
         images_query = db.session.query(
             IndiAllSkyDbImageTable,
@@ -3380,10 +3430,8 @@ class IndiAllskyImageViewer(FlaskForm):
                 and_(
                     IndiAllSkyDbCameraTable.id == self.camera_id,
                     IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    createDate_year == year,
-                    createDate_month == month,
-                    createDate_day == day,
-                    createDate_hour == hour,
+                    IndiAllSkyDbImageTable.createDate >= hour_start,
+                    IndiAllSkyDbImageTable.createDate < hour_end,
                 )
         )
 
@@ -3540,40 +3588,24 @@ class IndiAllskyGalleryViewer(FlaskForm):
 
 
     def getYears(self):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
+        calendar_count = self._getCalendarCount()
 
         years_query = db.session.query(
-            createDate_year,
+            IndiAllSkyDbImageCalendarTable.year,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
-            .join(IndiAllSkyDbThumbnailTable, IndiAllSkyDbImageTable.thumbnail_uuid == IndiAllSkyDbThumbnailTable.uuid)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                )
-        )
-
-
-        if not self.local:
-            # Do not serve local assets
-            years_query = years_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
+                    IndiAllSkyDbImageCalendarTable.camera_id == self.camera_id,
+                    calendar_count > 0,
                 )
-
-
-        years_query = years_query\
+        )\
             .distinct()\
-            .order_by(createDate_year.desc())
+            .order_by(IndiAllSkyDbImageCalendarTable.year.desc())
 
 
         year_choices = []
         for y in years_query:
-            entry = (y.createDate_year, str(y.createDate_year))
+            entry = (y.year, str(y.year))
             year_choices.append(entry)
 
 
@@ -3581,45 +3613,27 @@ class IndiAllskyGalleryViewer(FlaskForm):
 
 
     def getMonths(self, year):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
-        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
+        calendar_count = self._getCalendarCount()
 
         months_query = db.session.query(
-            createDate_year,
-            createDate_month,
+            IndiAllSkyDbImageCalendarTable.month,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
-            .join(IndiAllSkyDbThumbnailTable, IndiAllSkyDbImageTable.thumbnail_uuid == IndiAllSkyDbThumbnailTable.uuid)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    createDate_year == year,
+                    IndiAllSkyDbImageCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbImageCalendarTable.year == int(year),
+                    calendar_count > 0,
                 )
         )\
-
-
-        if not self.local:
-            # Do not serve local assets
-            months_query = months_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
-
-
-        months_query = months_query\
             .distinct()\
-            .order_by(createDate_month.desc())
+            .order_by(IndiAllSkyDbImageCalendarTable.month.desc())
 
 
         month_choices = []
         for m in months_query:
-            month_name = datetime.strptime('{0} {1}'.format(year, m.createDate_month), '%Y %m')\
+            month_name = datetime.strptime('{0} {1}'.format(year, m.month), '%Y %m')\
                 .strftime('%B')
-            entry = (m.createDate_month, month_name)
+            entry = (m.month, month_name)
             month_choices.append(entry)
 
 
@@ -3627,46 +3641,26 @@ class IndiAllskyGalleryViewer(FlaskForm):
 
 
     def getDays(self, year, month):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
-        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
-        createDate_day = extract('day', IndiAllSkyDbImageTable.createDate).label('createDate_day')
+        calendar_count = self._getCalendarCount()
 
         days_query = db.session.query(
-            createDate_year,
-            createDate_month,
-            createDate_day,
+            IndiAllSkyDbImageCalendarTable.day,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
-            .join(IndiAllSkyDbThumbnailTable, IndiAllSkyDbImageTable.thumbnail_uuid == IndiAllSkyDbThumbnailTable.uuid)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
-                    IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    createDate_year == year,
-                    createDate_month == month,
+                    IndiAllSkyDbImageCalendarTable.camera_id == self.camera_id,
+                    IndiAllSkyDbImageCalendarTable.year == int(year),
+                    IndiAllSkyDbImageCalendarTable.month == int(month),
+                    calendar_count > 0,
                 )
-        )
-
-
-        if not self.local:
-            # Do not serve local assets
-            days_query = days_query\
-                .filter(
-                    or_(
-                        IndiAllSkyDbImageTable.remote_url != sa_null(),
-                        IndiAllSkyDbImageTable.s3_key != sa_null(),
-                    )
-                )
-
-
-        days_query = days_query\
+        )\
             .distinct()\
-            .order_by(createDate_day.desc())
+            .order_by(IndiAllSkyDbImageCalendarTable.day.desc())
 
 
         day_choices = []
         for d in days_query:
-            entry = (d.createDate_day, str(d.createDate_day))
+            entry = (d.day, str(d.day))
             day_choices.append(entry)
 
 
@@ -3674,26 +3668,23 @@ class IndiAllskyGalleryViewer(FlaskForm):
 
 
     def getHours(self, year, month, day):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
-        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
-        createDate_day = extract('day', IndiAllSkyDbImageTable.createDate).label('createDate_day')
+        # the calendar does not track thumbnails, the hours are checked for thumbnails here
+        # a range on createDate can use the index
+        day_start = datetime(int(year), int(month), int(day))
+        day_end = day_start + timedelta(days=1)
+
         createDate_hour = extract('hour', IndiAllSkyDbImageTable.createDate).label('createDate_hour')
 
         hours_query = db.session.query(
-            createDate_year,
-            createDate_month,
-            createDate_day,
             createDate_hour,
         )\
-            .join(IndiAllSkyDbImageTable.camera)\
             .join(IndiAllSkyDbThumbnailTable, IndiAllSkyDbImageTable.thumbnail_uuid == IndiAllSkyDbThumbnailTable.uuid)\
             .filter(
                 and_(
-                    IndiAllSkyDbCameraTable.id == self.camera_id,
+                    IndiAllSkyDbImageTable.camera_id == self.camera_id,
                     IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    createDate_year == year,
-                    createDate_month == month,
-                    createDate_day == day,
+                    IndiAllSkyDbImageTable.createDate >= day_start,
+                    IndiAllSkyDbImageTable.createDate < day_end,
                 )
         )
 
@@ -3723,11 +3714,26 @@ class IndiAllskyGalleryViewer(FlaskForm):
         return hour_choices
 
 
+    def _getCalendarCount(self):
+        # the date pickers are served from the calendar table instead of the image table
+        if not self.local:
+            # Do not serve local assets
+            if self.detections_count:
+                return IndiAllSkyDbImageCalendarTable.remote_detection_count
+
+            return IndiAllSkyDbImageCalendarTable.remote_count
+
+
+        if self.detections_count:
+            return IndiAllSkyDbImageCalendarTable.detection_count
+
+        return IndiAllSkyDbImageCalendarTable.image_count
+
+
     def getImages(self, year, month, day, hour):
-        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
-        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
-        createDate_day = extract('day', IndiAllSkyDbImageTable.createDate).label('createDate_day')
-        createDate_hour = extract('hour', IndiAllSkyDbImageTable.createDate).label('createDate_hour')
+        # a range on createDate can use the index
+        hour_start = datetime(int(year), int(month), int(day), int(hour))
+        hour_end = hour_start + timedelta(hours=1)
 
         images_query = db.session.query(
             IndiAllSkyDbImageTable,
@@ -3739,10 +3745,8 @@ class IndiAllskyGalleryViewer(FlaskForm):
                 and_(
                     IndiAllSkyDbCameraTable.id == self.camera_id,
                     IndiAllSkyDbImageTable.detections >= self.detections_count,
-                    createDate_year == year,
-                    createDate_month == month,
-                    createDate_day == day,
-                    createDate_hour == hour,
+                    IndiAllSkyDbImageTable.createDate >= hour_start,
+                    IndiAllSkyDbImageTable.createDate < hour_end,
                 )
         )
 
@@ -1,13 +1,13 @@
 from datetime import datetime
 from datetime import timedelta
 from pathlib import Path
+import io
+import time
 import uuid
 import logging
 #from pprint import pformat
 
 import cv2
-import PIL
-from PIL import Image
 
 from cryptography.fernet import Fernet
 
@@ -16,6 +16,8 @@ from . import db
 
 from .models import IndiAllSkyDbCameraTable
 from .models import IndiAllSkyDbImageTable
+from .models import IndiAllSkyDbImageCalendarTable
+from .models import IndiAllSkyDbImageHistogramTable
 from .models import IndiAllSkyDbBadPixelMapTable
 from .models import IndiAllSkyDbDarkFrameTable
 from .models import IndiAllSkyDbVideoTable
@@ -41,6 +43,11 @@ logger = logging.getLogger('indi_allsky')
 
 
 class miscDb(object):
+
+    # histograms are only stored for the most recent images
+    histogram_keep = 1440
+
+
     def __init__(self, config):
         self.config = config
 
@@ -164,7 +171,7 @@ class miscDb(object):
         return camera
 
 
-    def addImage(self, filename, camera_id, metadata):
+    def addImage(self, filename, camera_id, metadata, histogram=None, commit=True):
 
         ### expected metadata
         #{
@@ -256,8 +263,23 @@ class miscDb(object):
             data=metadata.get('data', {}),
         )
 
+        if histogram:
+            image.histogram = IndiAllSkyDbImageHistogramTable(data=histogram)
+
         db.session.add(image)
-        db.session.commit()
+        db.session.flush()  # assigns the id
+
+        IndiAllSkyDbImageCalendarTable.addImage(image)
+
+
+        if histogram and image.histogram.id % 100 == 0:
+            # older images fall back to decoding the image
+            db.session.query(IndiAllSkyDbImageHistogramTable)\
+                .filter(IndiAllSkyDbImageHistogramTable.id <= image.histogram.id - self.histogram_keep)\
+                .delete(synchronize_session=False)
+
+        if commit:
+            db.session.commit()
 
         return image
 
@@ -323,6 +345,8 @@ class miscDb(object):
         db.session.add(dark)
         db.session.commit()
 
+        self.invalidateCalibrationCache()
+
         return dark
 
 
@@ -386,10 +410,12 @@ class miscDb(object):
         db.session.add(bpm)
         db.session.commit()
 
+        self.invalidateCalibrationCache()
+
         return bpm
 
 
-    def addVideo(self, filename, camera_id, metadata):
+    def addVideo(self, filename, camera_id, metadata, commit=True):
 
         ### expected metadata
         #{
@@ -436,12 +462,16 @@ class miscDb(object):
         )
 
         db.session.add(video)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return video
 
 
-    def addPanoramaVideo(self, filename, camera_id, metadata):
+    def addPanoramaVideo(self, filename, camera_id, metadata, commit=True):
 
         ### expected metadata
         #{
@@ -488,12 +518,16 @@ class miscDb(object):
         )
 
         db.session.add(panorama_video)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return panorama_video
 
 
-    def addKeogram(self, filename, camera_id, metadata):
+    def addKeogram(self, filename, camera_id, metadata, commit=True):
 
         ### expected metadata
         #{
@@ -541,12 +575,16 @@ class miscDb(object):
         )
 
         db.session.add(keogram)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return keogram
 
 
-    def addStarTrail(self, filename, camera_id, metadata):
+    def addStarTrail(self, filename, camera_id, metadata, commit=True):
 
         ### expected metadata
         #{
@@ -595,12 +633,16 @@ class miscDb(object):
         )
 
         db.session.add(startrail)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return startrail
 
 
-    def addStarTrailVideo(self, filename, camera_id, metadata):
+    def addStarTrailVideo(self, filename, camera_id, metadata, commit=True):
 
         ### expected metadata
         #{
@@ -647,12 +689,16 @@ class miscDb(object):
         )
 
         db.session.add(startrail_video)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return startrail_video
 
 
-    def addFitsImage(self, filename, camera_id, metadata):
+    def addFitsImage(self, filename, camera_id, metadata, commit=True):
 
         ### expected metadata
         #{
@@ -705,12 +751,16 @@ class miscDb(object):
         )
 
         db.session.add(fits_image)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return fits_image
 
 
-    def addRawImage(self, filename, camera_id, metadata):
+    def addRawImage(self, filename, camera_id, metadata, commit=True):
 
         ### expected metadata
         #{
@@ -763,12 +813,16 @@ class miscDb(object):
         )
 
         db.session.add(raw_image)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return raw_image
 
 
-    def addPanoramaImage(self, filename, camera_id, metadata):
+    def addPanoramaImage(self, filename, camera_id, metadata, commit=True):
 
         ### expected metadata
         #{
@@ -821,7 +875,11 @@ class miscDb(object):
         )
 
         db.session.add(panorama_image)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return panorama_image
 
@@ -949,6 +1007,16 @@ class miscDb(object):
         db.session.commit()
 
 
+    def invalidateCalibrationCache(self):
+        # image processors clear their master dark cache when the generation changes
+        self.setState('CALIBRATION_GENERATION', str(uuid.uuid4()))
+
+
+    def invalidateSatelliteCache(self):
+        # image processors reload satellite TLE data when the generation changes
+        self.setState('SATELLITE_GENERATION', str(uuid.uuid4()))
+
+
     def addThumbnail(self, entry, entry_metadata, camera_id, thumbnail_metadata, new_width=150, numpy_data=None):
         if entry.thumbnail_uuid:
             return
@@ -969,7 +1037,8 @@ class miscDb(object):
             timeofday = 'day'
 
 
-        thumbnail_uuid_str = str(uuid.uuid4())
+        # the uuid may be assigned in advance when the thumbnail is generated in the background
+        thumbnail_uuid_str = thumbnail_metadata.get('uuid', str(uuid.uuid4()))
 
 
         if thumbnail_metadata['origin'] in (
@@ -1017,27 +1086,23 @@ class miscDb(object):
                 logger.error('Cannot create thumbnail: File not found: %s', filename_p)
                 return
 
-            try:
-                img = Image.open(str(filename_p))
-            except PIL.UnidentifiedImageError:
+            numpy_data = cv2.imread(str(filename_p), cv2.IMREAD_COLOR)
+
+            if isinstance(numpy_data, type(None)):
                 logger.error('Cannot create thumbnail:  Bad Image')
                 return
-        else:
-            img = Image.fromarray(cv2.cvtColor(numpy_data, cv2.COLOR_BGR2RGB))
 
 
-        width, height = img.size
+        thumbnail_start = time.time()
 
-        if new_width < width:
-            scale = new_width / width
-            new_height = int(height * scale)
+        # additional preview sizes for the gallery, loop and mobile views
+        preview_width_list = [int(x) for x in self.config.get('THUMBNAILS', {}).get('SIZES', [])]
 
-            thumbnail_data = img.resize((new_width, new_height))
-        else:
-            # keep the same dimensions
-            thumbnail_data = img
-            new_width = width
-            new_height = height
+        thumbnail_dict = self._buildThumbnailPyramid(numpy_data, [new_width] + preview_width_list)
+
+
+        thumbnail_data = thumbnail_dict[new_width]
+        new_height, new_width = thumbnail_data.shape[:2]
 
 
         # insert new metadata
@@ -1048,7 +1113,32 @@ class miscDb(object):
         thumbnail_metadata['height'] = new_height
 
 
-        thumbnail_data.save(str(thumbnail_filename_p), quality=75)
+        self._writeThumbnail(thumbnail_filename_p, thumbnail_data)
+
+
+        thumbnail_entry_data = dict(thumbnail_metadata.get('data', {}))
+
+        preview_dict = dict()
+        for preview_width in preview_width_list:
+            if preview_width == new_width:
+                continue
+
+            preview_filename_p = thumbnail_dir_p.joinpath(
+                '{0:s}_{1:d}.jpg'.format(thumbnail_uuid_str, preview_width),
+            )
+
+            self._writeThumbnail(preview_filename_p, thumbnail_dict[preview_width])
+
+            preview_dict[str(preview_width)] = str(preview_filename_p.relative_to(self.image_dir))
+
+
+        if preview_dict:
+            # previews are only stored locally
+            thumbnail_entry_data['previews'] = preview_dict
+
+
+        thumbnail_elapsed_s = time.time() - thumbnail_start
+        logger.info('Thumbnails (%d) generated in %0.4f s', len(preview_dict) + 1, thumbnail_elapsed_s)
 
 
         thumbnail_entry = IndiAllSkyDbThumbnailTable(
@@ -1059,7 +1149,7 @@ class miscDb(object):
             width=new_width,
             height=new_height,
             camera_id=camera_id,
-            data=thumbnail_metadata.get('data', {}),
+            data=thumbnail_entry_data,
             s3_key=thumbnail_metadata.get('s3_key'),
             remote_url=thumbnail_metadata.get('remote_url'),
         )
@@ -1071,6 +1161,44 @@ class miscDb(object):
         return thumbnail_entry
 
 
+    def _buildThumbnailPyramid(self, data, width_list):
+        height, width = data.shape[:2]
+
+        thumbnail_dict = dict()
+
+        # each size is resized from the smallest halving that is still larger
+        level_data = data
+        for new_width in sorted(set(width_list), reverse=True):
+            if new_width >= width:
+                # keep the same dimensions
+                thumbnail_dict[new_width] = data
+                continue
+
+
+            while int(level_data.shape[1] / 2) >= new_width:
+                level_height, level_width = level_data.shape[:2]
+                level_data = cv2.resize(level_data, (int(level_width / 2), int(level_height / 2)), interpolation=cv2.INTER_AREA)
+
+
+            if level_data.shape[1] == new_width:
+                thumbnail_dict[new_width] = level_data
+                continue
+
+
+            new_height = int(height * (new_width / width))
+            thumbnail_dict[new_width] = cv2.resize(level_data, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+
+        return thumbnail_dict
+
+
+    def _writeThumbnail(self, filename_p, data):
+        result, jpg_data = cv2.imencode('.jpg', data, [cv2.IMWRITE_JPEG_QUALITY, 75])
+
+        with io.open(str(filename_p), 'wb') as f_thumbnail:
+            f_thumbnail.write(jpg_data.tobytes())
+
+
     def addThumbnailImageAuto(self, *args, **kwargs):
         if not self.config.get('THUMBNAILS', {}).get('IMAGES_AUTO', True):
             return
@@ -1078,7 +1206,7 @@ class miscDb(object):
         return self.addThumbnail(*args, **kwargs)
 
 
-    def addThumbnail_remote(self, filename, camera_id, thumbnail_metadata):
+    def addThumbnail_remote(self, filename, camera_id, thumbnail_metadata, commit=True):
 
         ### expected metadata
         #{
@@ -1118,7 +1246,11 @@ class miscDb(object):
         )
 
         db.session.add(thumbnail_entry)
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()  # assigns the id
 
         return thumbnail_entry
 
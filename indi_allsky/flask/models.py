@@ -7,6 +7,7 @@ from cryptography.fernet import Fernet
 from sqlalchemy.sql import expression
 
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.exc import IntegrityError
 
 from flask import current_app as app
 
@@ -17,6 +18,8 @@ __all__ = (
     'IndiAllSkyDbCameraTable',
     'IndiAllSkyDbThumbnailTable',
     'IndiAllSkyDbImageTable',
+    'IndiAllSkyDbImageCalendarTable',
+    'IndiAllSkyDbImageHistogramTable',
     'IndiAllSkyDbBadPixelMapTable',
     'IndiAllSkyDbDarkFrameTable',
     'IndiAllSkyDbVideoTable',
@@ -229,7 +232,29 @@ class IndiAllSkyDbThumbnailTable(IndiAllSkyDbFileBase):
         return None
 
 
+    def getPreviewUrl(self, width, s3_prefix='', local=True):
+        # previews are only stored locally
+        if local and self.data:
+            preview_filename = self.data.get('previews', {}).get(str(width))
+
+            if preview_filename:
+                return Path('images').joinpath(preview_filename)
+
+
+        return self.getUrl(s3_prefix=s3_prefix, local=local)
+
+
     def deleteAsset(self):
+        if self.data:
+            for preview_filename in self.data.get('previews', {}).values():
+                preview_p = Path(app.config['INDI_ALLSKY_IMAGE_FOLDER']).joinpath(preview_filename)
+
+                try:
+                    preview_p.unlink()
+                except FileNotFoundError:
+                    pass
+
+
         self.deleteFile()
 
 
@@ -271,6 +296,7 @@ class IndiAllSkyDbImageTable(IndiAllSkyDbFileBase):
     height = db.Column(db.Integer, nullable=True, index=True)
     camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False)
     camera = db.relationship('IndiAllSkyDbCameraTable', back_populates='images')
+    histogram = db.relationship('IndiAllSkyDbImageHistogramTable', back_populates='image', uselist=False, cascade='all, delete-orphan')
 
     # SQLAlchemy tries to create this over and over
     #db.Index(
@@ -286,6 +312,151 @@ class IndiAllSkyDbImageTable(IndiAllSkyDbFileBase):
         return '<Image {0:s}>'.format(self.filename)
 
 
+class IndiAllSkyDbImageHistogramTable(db.Model):
+    ### histogram of the processed image, only kept for the most recent images
+    __tablename__ = 'image_histogram'
+
+    id = db.Column(db.Integer, primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)  # little endian uint32, 256 counts per channel (BGR or gray)
+    image_id = db.Column(db.Integer, db.ForeignKey('image.id'), nullable=False, unique=True)
+    image = db.relationship('IndiAllSkyDbImageTable', back_populates='histogram')
+
+
+class IndiAllSkyDbImageCalendarTable(db.Model):
+    ### image counts per hour, maintained with the image table and used for the date pickers
+    __tablename__ = 'image_calendar'
+
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False, index=True)
+    month = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Integer, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    image_count = db.Column(db.Integer, server_default='0', nullable=False)
+    detection_count = db.Column(db.Integer, server_default='0', nullable=False)
+    remote_count = db.Column(db.Integer, server_default='0', nullable=False)  # images with a remote_url or s3_key
+    remote_detection_count = db.Column(db.Integer, server_default='0', nullable=False)
+    camera_id = db.Column(db.Integer, db.ForeignKey('camera.id'), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('camera_id', 'year', 'month', 'day', 'hour', name='uq_image_calendar_camera_YmdH'),
+    )
+
+
+    def __repr__(self):
+        return '<ImageCalendar {0:d}-{1:02d}-{2:02d} {3:02d}h>'.format(self.year, self.month, self.day, self.hour)
+
+
+    @classmethod
+    def addImage(cls, image):
+        ### image entry must have been flushed, caller commits
+        remote = bool(image.remote_url or image.s3_key)
+        detection = image.detections > 0
+
+        cls._updateCounts(
+            image.camera_id,
+            image.createDate,
+            image_count=1,
+            detection_count=int(detection),
+            remote_count=int(remote),
+            remote_detection_count=int(remote and detection),
+        )
+
+
+    @classmethod
+    def removeImage(cls, image):
+        ### call before the image entry is deleted, caller commits
+        remote = bool(image.remote_url or image.s3_key)
+        detection = image.detections > 0
+
+        cls._updateCounts(
+            image.camera_id,
+            image.createDate,
+            image_count=-1,
+            detection_count=-int(detection),
+            remote_count=-int(remote),
+            remote_detection_count=-int(remote and detection),
+        )
+
+
+    @classmethod
+    def addRemote(cls, image):
+        ### call when a local image gains a remote_url or s3_key, caller commits
+        detection = image.detections > 0
+
+        cls._updateCounts(
+            image.camera_id,
+            image.createDate,
+            remote_count=1,
+            remote_detection_count=int(detection),
+        )
+
+
+    @classmethod
+    def _updateCounts(cls, camera_id, createDate, image_count=0, detection_count=0, remote_count=0, remote_detection_count=0):
+        key_filter = (
+            cls.camera_id == camera_id,
+            cls.year == createDate.year,
+            cls.month == createDate.month,
+            cls.day == createDate.day,
+            cls.hour == createDate.hour,
+        )
+
+        # counts are changed in the database, concurrent writers do not overwrite each other
+        updated = db.session.query(cls)\
+            .filter(*key_filter)\
+            .update(
+                {
+                    cls.image_count: cls.image_count + image_count,
+                    cls.detection_count: cls.detection_count + detection_count,
+                    cls.remote_count: cls.remote_count + remote_count,
+                    cls.remote_detection_count: cls.remote_detection_count + remote_detection_count,
+                },
+                synchronize_session=False,
+            )
+
+
+        if updated:
+            if image_count < 0:
+                db.session.query(cls)\
+                    .filter(*key_filter)\
+                    .filter(cls.image_count <= 0)\
+                    .delete(synchronize_session=False)
+
+            return
+
+
+        if image_count <= 0:
+            # hour not indexed, rebuild the calendar to fix
+            return
+
+
+        calendar = cls(
+            camera_id=camera_id,
+            year=createDate.year,
+            month=createDate.month,
+            day=createDate.day,
+            hour=createDate.hour,
+            image_count=image_count,
+            detection_count=detection_count,
+            remote_count=remote_count,
+            remote_detection_count=remote_detection_count,
+        )
+
+        try:
+            with db.session.begin_nested():
+                db.session.add(calendar)
+        except IntegrityError:
+            # another process added the hour first
+            cls._updateCounts(
+                camera_id,
+                createDate,
+                image_count=image_count,
+                detection_count=detection_count,
+                remote_count=remote_count,
+                remote_detection_count=remote_detection_count,
+            )
+
+
 class IndiAllSkyDbDarkFrameTable(IndiAllSkyDbFileBase):
     __tablename__ = 'darkframe'
 
@@ -603,19 +774,25 @@ class IndiAllSkyDbTaskQueueTable(db.Model):
         self.state = TaskQueueState.QUEUED
         db.session.commit()
 
-    def setRunning(self):
+    def setRunning(self, commit=True):
         self.state = TaskQueueState.RUNNING
-        db.session.commit()
 
-    def setSuccess(self, result):
+        if commit:
+            db.session.commit()
+
+    def setSuccess(self, result, commit=True):
         self.state = TaskQueueState.SUCCESS
         self.result = result
-        db.session.commit()
 
-    def setFailed(self, result):
+        if commit:
+            db.session.commit()
+
+    def setFailed(self, result, commit=True):
         self.state = TaskQueueState.FAILED
         self.result = result
-        db.session.commit()
+
+        if commit:
+            db.session.commit()
 
     def setExpired(self):
         self.state = TaskQueueState.EXPIRED
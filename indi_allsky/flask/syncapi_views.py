@@ -25,6 +25,7 @@ from . import db
 
 from .models import IndiAllSkyDbCameraTable
 from .models import IndiAllSkyDbImageTable
+from .models import IndiAllSkyDbImageCalendarTable
 from .models import IndiAllSkyDbVideoTable
 from .models import IndiAllSkyDbKeogramTable
 from .models import IndiAllSkyDbStarTrailsTable
@@ -56,6 +57,14 @@ class SyncApiBaseView(BaseView):
 
     time_skew = 300  # number of seconds the client is allowed to deviate from server
 
+    apikey_cache_seconds = 300
+
+    # per process cache of decrypted api keys, keys are usernames
+    _apikey_cache = dict()
+
+    # batch uploads change files after the database commit
+    deferred_file_list = None
+
 
     def __init__(self, **kwargs):
         super(SyncApiBaseView, self).__init__(**kwargs)
@@ -97,24 +106,29 @@ class SyncApiBaseView(BaseView):
 
         tmp_media_file_p = self.saveMedia(request.files['media'])
 
-
-        media_file_size = tmp_media_file_p.stat().st_size
-        if media_file_size != metadata.get('file_size', -1):
-            tmp_media_file_p.unlink()
-            raise AuthenticationFailure('Media file size does not match')
+        try:
+            media_file_size = tmp_media_file_p.stat().st_size
+            if media_file_size != metadata.get('file_size', -1):
+                raise AuthenticationFailure('Media file size does not match')
 
 
-        try:
-            camera = self.getCamera(metadata)
-        except NoResultFound:
-            app.logger.error('Camera not found: %s', metadata['camera_uuid'])
-            return jsonify({'error' : 'camera not found'}), 400
+            try:
+                camera = self.getCamera(metadata)
+            except NoResultFound:
+                app.logger.error('Camera not found: %s', metadata['camera_uuid'])
+                return jsonify({'error' : 'camera not found'}), 400
 
 
-        try:
-            file_entry = self.processPost(camera, metadata, tmp_media_file_p, overwrite=overwrite)
-        except EntryExists:
-            return jsonify({'error' : 'file_exists'}), 400
+            try:
+                file_entry = self.processPost(camera, metadata, tmp_media_file_p, overwrite=overwrite)
+            except EntryExists:
+                return jsonify({'error' : 'file_exists'}), 400
+        finally:
+            # the temp file is in the image folder, it is renamed into place when successful
+            try:
+                tmp_media_file_p.unlink()
+            except FileNotFoundError:
+                pass
 
 
         return jsonify({
@@ -168,7 +182,7 @@ class SyncApiBaseView(BaseView):
         })
 
 
-    def processPost(self, camera, metadata, tmp_file_p, overwrite=False):
+    def processPost(self, camera, metadata, tmp_file_p, overwrite=False, commit=True):
         # offset createDate to account for difference between local and remote sites
         metadata['createDate'] += (metadata['utc_offset'] - datetime.now().astimezone().utcoffset().total_seconds())
 
@@ -203,7 +217,7 @@ class SyncApiBaseView(BaseView):
 
                 app.logger.warning('Removing orphaned video entry')
                 db.session.delete(old_entry)
-                db.session.commit()
+                self._commit(commit)
             except NoResultFound:
                 pass
 
@@ -212,7 +226,7 @@ class SyncApiBaseView(BaseView):
                 raise EntryExists()
 
             app.logger.warning('Replacing file')
-            filename_p.unlink()
+            self._removeFile(filename_p)
 
             try:
                 old_entry = self.model.query\
@@ -221,7 +235,7 @@ class SyncApiBaseView(BaseView):
 
                 app.logger.warning('Removing old entry')
                 db.session.delete(old_entry)
-                db.session.commit()
+                self._commit(commit)
             except NoResultFound:
                 pass
 
@@ -240,18 +254,11 @@ class SyncApiBaseView(BaseView):
             filename_p,
             camera.id,
             metadata,
+            commit=commit,
         )
 
 
-        tmp_file_size = tmp_file_p.stat().st_size
-        if tmp_file_size != 0:
-            # only copy file if it is not empty
-            # if the empty file option is selected, this can be expected
-            shutil.copy2(str(tmp_file_p), str(filename_p))
-            filename_p.chmod(0o644)
-
-
-        tmp_file_p.unlink()
+        self._moveMedia(tmp_file_p, filename_p)
 
         app.logger.info('Uploaded file: %s', filename_p)
 
@@ -271,6 +278,10 @@ class SyncApiBaseView(BaseView):
             entry.deleteFile()
 
             app.logger.warning('Deleting entry %d', entry.id)
+
+            if isinstance(entry, IndiAllSkyDbImageTable):
+                IndiAllSkyDbImageCalendarTable.removeImage(entry)
+
             db.session.delete(entry)
             db.session.commit()
         except NoResultFound:
@@ -307,16 +318,87 @@ class SyncApiBaseView(BaseView):
         media_file_p = Path(media_file.filename)  # need this for the extension
         #app.logger.info('File: %s', media_file_p)
 
-        f_tmp_media = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix=media_file_p.suffix)
-        f_tmp_media.close()
+        # the temp file is on the same filesystem as the final location, the file is renamed into place instead of copied
+        if not self.image_dir.exists():
+            self.image_dir.mkdir(mode=0o755, parents=True)
 
-        tmp_media_p = Path(f_tmp_media.name)
+        f_tmp_media = tempfile.NamedTemporaryFile(mode='wb', dir=str(self.image_dir), prefix='.syncapi_', delete=False, suffix=media_file_p.suffix)
+
+        try:
+            media_file.save(f_tmp_media)
+        finally:
+            f_tmp_media.close()
 
-        media_file.save(str(tmp_media_p))
+        tmp_media_p = Path(f_tmp_media.name)
 
         return tmp_media_p
 
 
+    def _removeFile(self, file_p):
+        if not isinstance(self.deferred_file_list, type(None)):
+            self.deferred_file_list.append((file_p, None))
+            return
+
+        file_p.unlink()
+
+
+    def _moveMedia(self, tmp_file_p, filename_p):
+        if not isinstance(self.deferred_file_list, type(None)):
+            self.deferred_file_list.append((filename_p, tmp_file_p))
+            return
+
+        self._placeMedia(tmp_file_p, filename_p)
+
+
+    def _processDeferredFiles(self):
+        for filename_p, tmp_file_p in self.deferred_file_list:
+            try:
+                if isinstance(tmp_file_p, type(None)):
+                    filename_p.unlink()
+                else:
+                    self._placeMedia(tmp_file_p, filename_p)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # the database is already committed
+                app.logger.error('Unable to update %s: %s', filename_p, str(e))
+
+
+        self.deferred_file_list.clear()
+
+
+    def _placeMedia(self, tmp_file_p, filename_p):
+        tmp_file_size = tmp_file_p.stat().st_size
+        if tmp_file_size == 0:
+            # only move file if it is not empty
+            # if the empty file option is selected, this can be expected
+            tmp_file_p.unlink()
+            return
+
+
+        file_dir_p = filename_p.parent
+        if not file_dir_p.exists():
+            file_dir_p.mkdir(mode=0o755, parents=True)
+
+
+        try:
+            # atomic
+            tmp_file_p.replace(filename_p)
+        except OSError:
+            # different filesystem
+            shutil.copy2(str(tmp_file_p), str(filename_p))
+            tmp_file_p.unlink()
+
+        filename_p.chmod(0o644)
+
+
+    def _commit(self, commit):
+        if commit:
+            db.session.commit()
+        else:
+            db.session.flush()
+
+
     #def put(self):
     #    #media_file = request.files.get('media')
     #    pass
@@ -339,16 +421,7 @@ class SyncApiBaseView(BaseView):
             raise AuthenticationFailure('Malformed API key')
 
 
-        user = IndiAllSkyDbUserTable.query\
-            .filter(IndiAllSkyDbUserTable.username == username)\
-            .first()
-
-
-        if not user:
-            raise AuthenticationFailure('Unknown user')
-
-
-        apikey = user.getApiKey(app.config['PASSWORD_KEY'])
+        apikey = self.getApiKey(username)
 
 
         time_floor = math.floor(time.time() / self.time_skew)
@@ -378,9 +451,38 @@ class SyncApiBaseView(BaseView):
             if hmac.compare_digest(message_hmac, received_hmac):
                 break
         else:
+            # the cached key may be out of date
+            self._apikey_cache.pop(username, None)
             raise AuthenticationFailure('Unable to authenticate API key')
 
 
+    def getApiKey(self, username):
+        now = time.time()
+
+        apikey_cache = self._apikey_cache.get(username)
+        if apikey_cache and apikey_cache['expire'] > now:
+            return apikey_cache['apikey']
+
+
+        user = IndiAllSkyDbUserTable.query\
+            .filter(IndiAllSkyDbUserTable.username == username)\
+            .first()
+
+
+        if not user:
+            raise AuthenticationFailure('Unknown user')
+
+
+        apikey = user.getApiKey(app.config['PASSWORD_KEY'])
+
+        self._apikey_cache[username] = {
+            'apikey' : apikey,
+            'expire' : now + self.apikey_cache_seconds,
+        }
+
+        return apikey
+
+
     def getCamera(self, metadata):
         # not catching NoResultFound
         camera = IndiAllSkyDbCameraTable.query\
@@ -471,7 +573,7 @@ class SyncApiImageView(SyncApiBaseView):
     type_folder = 'exposures'
 
 
-    def processPost(self, camera, image_metadata, tmp_file_p, overwrite=False):
+    def processPost(self, camera, image_metadata, tmp_file_p, overwrite=False, commit=True):
         # offset createDate to account for difference between local and remote sites
         image_metadata['createDate'] += (image_metadata['utc_offset'] - datetime.now().astimezone().utcoffset().total_seconds())
 
@@ -490,8 +592,9 @@ class SyncApiImageView(SyncApiBaseView):
                     .one()
 
                 app.logger.warning('Removing orphaned image entry')
+                IndiAllSkyDbImageCalendarTable.removeImage(old_image_entry)
                 db.session.delete(old_image_entry)
-                db.session.commit()
+                self._commit(commit)
             except NoResultFound:
                 pass
 
@@ -501,7 +604,7 @@ class SyncApiImageView(SyncApiBaseView):
                 raise EntryExists()
 
             app.logger.warning('Replacing image')
-            image_file_p.unlink()
+            self._removeFile(image_file_p)
 
             try:
                 old_image_entry = self.model.query\
@@ -509,8 +612,9 @@ class SyncApiImageView(SyncApiBaseView):
                     .one()
 
                 app.logger.warning('Removing old image entry')
+                IndiAllSkyDbImageCalendarTable.removeImage(old_image_entry)
                 db.session.delete(old_image_entry)
-                db.session.commit()
+                self._commit(commit)
             except NoResultFound:
                 pass
 
@@ -520,18 +624,11 @@ class SyncApiImageView(SyncApiBaseView):
             image_file_p,
             camera.id,
             image_metadata,
+            commit=commit,
         )
 
 
-        tmp_file_size = tmp_file_p.stat().st_size
-        if tmp_file_size != 0:
-            # only copy file if it is not empty
-            # if the empty file option is selected, this can be expected
-            shutil.copy2(str(tmp_file_p), str(image_file_p))
-            image_file_p.chmod(0o644)
-
-
-        tmp_file_p.unlink()
+        self._moveMedia(tmp_file_p, image_file_p)
 
         app.logger.info('Uploaded image: %s', image_file_p)
 
@@ -644,7 +741,7 @@ class SyncApiThumbnailView(SyncApiBaseView):
     add_function = 'addThumbnail_remote'
 
 
-    def processPost(self, camera, thumbnail_metadata, tmp_file_p, overwrite=False):
+    def processPost(self, camera, thumbnail_metadata, tmp_file_p, overwrite=False, commit=True):
         # offset createDate to account for difference between local and remote sites
         thumbnail_metadata['createDate'] += (thumbnail_metadata['utc_offset'] - datetime.now().astimezone().utcoffset().total_seconds())
 
@@ -702,7 +799,7 @@ class SyncApiThumbnailView(SyncApiBaseView):
 
                 app.logger.warning('Removing orphaned thumbnail entry')
                 db.session.delete(old_thumbnail_entry)
-                db.session.commit()
+                self._commit(commit)
             except NoResultFound:
                 pass
 
@@ -712,7 +809,7 @@ class SyncApiThumbnailView(SyncApiBaseView):
                 raise EntryExists()
 
             app.logger.warning('Replacing image')
-            thumbnail_file_p.unlink()
+            self._removeFile(thumbnail_file_p)
 
             try:
                 old_image_entry = self.model.query\
@@ -721,7 +818,7 @@ class SyncApiThumbnailView(SyncApiBaseView):
 
                 app.logger.warning('Removing old image entry')
                 db.session.delete(old_image_entry)
-                db.session.commit()
+                self._commit(commit)
             except NoResultFound:
                 pass
 
@@ -731,27 +828,131 @@ class SyncApiThumbnailView(SyncApiBaseView):
             thumbnail_file_p,
             camera.id,
             thumbnail_metadata,
+            commit=commit,
         )
 
 
-        tmp_file_size = tmp_file_p.stat().st_size
-        if tmp_file_size != 0:
-            # only copy file if it is not empty
-            # if the empty file option is selected, this can be expected
+        self._moveMedia(tmp_file_p, thumbnail_file_p)
 
-            thumbnail_dir_p = thumbnail_file_p.parent
-            if not thumbnail_dir_p.exists():
-                thumbnail_dir_p.mkdir(mode=0o755, parents=True)
+        app.logger.info('Uploaded thumbnail: %s', thumbnail_file_p)
 
-            shutil.copy2(str(tmp_file_p), str(thumbnail_file_p))
-            thumbnail_file_p.chmod(0o644)
+        return new_entry
 
 
-        tmp_file_p.unlink()
+class SyncApiBatchView(SyncApiBaseView):
+    decorators = []
 
-        app.logger.info('Uploaded thumbnail: %s', thumbnail_file_p)
+    ### Multiple assets for a single camera in one request
+    # the database entries for all assets are committed in one transaction
 
-        return new_entry
+    view_class_dict = {
+        constants.IMAGE           : SyncApiImageView,
+        constants.VIDEO           : SyncApiVideoView,
+        constants.KEOGRAM         : SyncApiKeogramView,
+        constants.STARTRAIL       : SyncApiStartrailView,
+        constants.STARTRAIL_VIDEO : SyncApiStartrailVideoView,
+        constants.RAW_IMAGE       : SyncApiRawImageView,
+        constants.FITS_IMAGE      : SyncApiFitsImageView,
+        constants.PANORAMA_IMAGE  : SyncApiPanoramaImageView,
+        constants.PANORAMA_VIDEO  : SyncApiPanoramaVideoView,
+        constants.THUMBNAIL       : SyncApiThumbnailView,
+    }
+
+
+    def post(self, overwrite=False):
+        metadata = self.saveMetadata(request.files['metadata'])
+
+        try:
+            camera = self.getCamera(metadata)
+        except NoResultFound:
+            app.logger.error('Camera not found: %s', metadata['camera_uuid'])
+            return jsonify({'error' : 'camera not found'}), 400
+
+
+        # files are only unlinked or moved into place after the commit, a rollback leaves the existing files intact
+        self.deferred_file_list = list()
+
+        view_dict = dict()
+        tmp_file_list = list()
+        asset_list = list()  # status for each asset, in the order they were sent
+
+        try:
+            for idx, asset_metadata in enumerate(metadata['assets']):
+                if asset_metadata['camera_uuid'] != camera.uuid:
+                    raise AuthenticationFailure('Asset camera does not match batch camera')
+
+
+                tmp_media_file_p = self.saveMedia(request.files['media_{0:d}'.format(idx)])
+                tmp_file_list.append(tmp_media_file_p)
+
+                media_file_size = tmp_media_file_p.stat().st_size
+                if media_file_size != asset_metadata.get('file_size', -1):
+                    raise AuthenticationFailure('Media file size does not match')
+
+
+                view_class = self.view_class_dict.get(asset_metadata['type'])
+                if not view_class:
+                    app.logger.error('Invalid asset type: %s', str(asset_metadata['type']))
+                    asset_list.append({'error' : 'invalid asset type'})
+                    continue
+
+                view = view_dict.get(view_class)
+                if not view:
+                    view = view_class()
+                    view.deferred_file_list = self.deferred_file_list
+                    view_dict[view_class] = view
+
+
+                try:
+                    # EntryExists is raised before the database is changed
+                    file_entry = view.processPost(camera, asset_metadata, tmp_media_file_p, overwrite=overwrite, commit=False)
+                except EntryExists:
+                    asset_list.append({'error' : 'file_exists'})
+                    continue
+
+
+                asset_list.append(file_entry)
+
+
+            db.session.commit()
+
+            self._processDeferredFiles()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            # temp files are renamed into place when successful
+            for tmp_file_p in tmp_file_list:
+                try:
+                    tmp_file_p.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+        for idx, file_entry in enumerate(asset_list):
+            if isinstance(file_entry, dict):
+                continue
+
+            asset_list[idx] = {
+                'id'   : file_entry.id,
+                'url'  : str(file_entry.getUrl(local=True)),
+            }
+
+
+        app.logger.info('Uploaded batch of %d assets, %d failed', len(asset_list), len([x for x in asset_list if x.get('error')]))
+
+
+        return jsonify({
+            'assets' : asset_list,
+        })
+
+
+    def delete(self):
+        return jsonify({'error' : 'not_implemented'}), 400
+
+
+    def get(self):
+        return jsonify({'error' : 'not_implemented'}), 400
 
 
 class EntryExists(Exception):
@@ -777,4 +978,5 @@ bp_syncapi_allsky.add_url_rule('/sync/v1/fitsimage', view_func=SyncApiFitsImageV
 bp_syncapi_allsky.add_url_rule('/sync/v1/panoramaimage', view_func=SyncApiPanoramaImageView.as_view('syncapi_v1_panoramaimage_view'), methods=['GET', 'POST', 'PUT', 'DELETE'])
 bp_syncapi_allsky.add_url_rule('/sync/v1/panoramavideo', view_func=SyncApiPanoramaVideoView.as_view('syncapi_v1_panorama_video_view'), methods=['GET', 'POST', 'PUT', 'DELETE'])
 bp_syncapi_allsky.add_url_rule('/sync/v1/thumbnail', view_func=SyncApiThumbnailView.as_view('syncapi_v1_thumbnail_view'), methods=['GET', 'POST', 'PUT', 'DELETE'])
+bp_syncapi_allsky.add_url_rule('/sync/v1/batch', view_func=SyncApiBatchView.as_view('syncapi_v1_batch_view'), methods=['POST', 'PUT'])
 
@@ -39,6 +39,7 @@ from . import db
 
 from .models import IndiAllSkyDbCameraTable
 from .models import IndiAllSkyDbImageTable
+from .models import IndiAllSkyDbImageCalendarTable
 from .models import IndiAllSkyDbVideoTable
 from .models import IndiAllSkyDbKeogramTable
 from .models import IndiAllSkyDbStarTrailsTable
@@ -55,6 +56,7 @@ from .models import IndiAllSkyDbNotificationTable
 from .models import IndiAllSkyDbUserTable
 from .models import IndiAllSkyDbConfigTable
 from .models import IndiAllSkyDbTleDataTable
+from .models import IndiAllSkyDbStateTable
 
 from .models import TaskQueueQueue
 from .models import TaskQueueState
@@ -1003,6 +1005,27 @@ class JsonChartView(JsonView):
             return chart_data
 
 
+        # histogram is calculated when the image is processed
+        if latest_image.histogram:
+            h_array = numpy.frombuffer(latest_image.histogram.data, dtype='<u4').reshape((-1, 256))
+
+            if h_array.shape[0] == 1:
+                color = ('gray',)
+            else:
+                color = ('blue', 'green', 'red')
+
+            for col, h_list in zip(color, h_array.tolist()):
+                for x, val in enumerate(h_list):
+                    h_data = {
+                        'x' : str(x),
+                        'y' : val,
+                    }
+                    chart_data['histogram'][col].append(h_data)
+
+            return chart_data
+
+
+        # older images do not have a stored histogram
         latest_image_p = latest_image.getFilesystemPath()
         if not latest_image_p.exists():
             app.logger.error('Image does not exist: %s', latest_image_p)
@@ -1132,6 +1155,7 @@ class ConfigView(FormView):
             'WBB_FACTOR'                     : self.indi_allsky_config.get('WBB_FACTOR', 1.0),
             'AUTO_WB'                        : self.indi_allsky_config.get('AUTO_WB', False),
             'SATURATION_FACTOR'              : self.indi_allsky_config.get('SATURATION_FACTOR', 1.0),
+            'COLOR_TRANSFORM_FUSED'          : self.indi_allsky_config.get('COLOR_TRANSFORM_FUSED', True),
             'CCD_COOLING'                    : self.indi_allsky_config.get('CCD_COOLING', False),
             'CCD_TEMP'                       : self.indi_allsky_config.get('CCD_TEMP', 15.0),
             'TEMP_DISPLAY'                   : self.indi_allsky_config.get('TEMP_DISPLAY', 'c'),
@@ -1147,6 +1171,7 @@ class ConfigView(FormView):
             'DETECT_STARS'                   : self.indi_allsky_config.get('DETECT_STARS', True),
             'DETECT_STARS_THOLD'             : self.indi_allsky_config.get('DETECT_STARS_THOLD', 0.6),
             'DETECT_METEORS'                 : self.indi_allsky_config.get('DETECT_METEORS', False),
+            'DETECT_METEORS_PREPASS'         : self.indi_allsky_config.get('DETECT_METEORS_PREPASS', False),
             'DETECT_MASK'                    : self.indi_allsky_config.get('DETECT_MASK', ''),
             'DETECT_DRAW'                    : self.indi_allsky_config.get('DETECT_DRAW', False),
             'LOGO_OVERLAY'                   : self.indi_allsky_config.get('LOGO_OVERLAY', ''),
@@ -1156,6 +1181,7 @@ class ConfigView(FormView):
             'LOCATION_LATITUDE'              : self.indi_allsky_config.get('LOCATION_LATITUDE', 0.0),
             'LOCATION_LONGITUDE'             : self.indi_allsky_config.get('LOCATION_LONGITUDE', 0.0),
             'LOCATION_ELEVATION'             : self.indi_allsky_config.get('LOCATION_ELEVATION', 0),
+            'ASTROMETRIC_PLANET_INTERVAL'    : self.indi_allsky_config.get('ASTROMETRIC_PLANET_INTERVAL', 300),
             'TIMELAPSE_ENABLE'               : self.indi_allsky_config.get('TIMELAPSE_ENABLE', True),
             'TIMELAPSE_SKIP_FRAMES'          : self.indi_allsky_config.get('TIMELAPSE_SKIP_FRAMES', 4),
             'DAYTIME_CAPTURE'                : self.indi_allsky_config.get('DAYTIME_CAPTURE', True),
@@ -1184,6 +1210,8 @@ class ConfigView(FormView):
             'KEOGRAM_CROP_TOP'               : self.indi_allsky_config.get('KEOGRAM_CROP_TOP', 0),
             'KEOGRAM_CROP_BOTTOM'            : self.indi_allsky_config.get('KEOGRAM_CROP_BOTTOM', 0),
             'KEOGRAM_LABEL'                  : self.indi_allsky_config.get('KEOGRAM_LABEL', True),
+            'KEOGRAM_MEMMAP'                 : self.indi_allsky_config.get('KEOGRAM_MEMMAP', False),
+            'KEOGRAM_STARTRAILS_INCREMENTAL' : self.indi_allsky_config.get('KEOGRAM_STARTRAILS_INCREMENTAL', False),
             'STARTRAILS_SUN_ALT_THOLD'       : self.indi_allsky_config.get('STARTRAILS_SUN_ALT_THOLD', -15.0),
             'STARTRAILS_MOONMODE_THOLD'      : self.indi_allsky_config.get('STARTRAILS_MOONMODE_THOLD', True),
             'STARTRAILS_MOON_ALT_THOLD'      : self.indi_allsky_config.get('STARTRAILS_MOON_ALT_THOLD', 91.0),
@@ -1196,6 +1224,8 @@ class ConfigView(FormView):
             'STARTRAILS_TIMELAPSE_MINFRAMES' : self.indi_allsky_config.get('STARTRAILS_TIMELAPSE_MINFRAMES', 250),
             'STARTRAILS_USE_DB_DATA'         : self.indi_allsky_config.get('STARTRAILS_USE_DB_DATA', True),
             'IMAGE_CALIBRATE_DARK'           : self.indi_allsky_config.get('IMAGE_CALIBRATE_DARK', True),
+            'IMAGE_CALIBRATE_CACHE_MB'       : self.indi_allsky_config.get('IMAGE_CALIBRATE_CACHE_MB', 256),
+            'IMAGE_CALIBRATE_CACHE_MMAP'     : self.indi_allsky_config.get('IMAGE_CALIBRATE_CACHE_MMAP', False),
             'IMAGE_SAVE_FITS_PRE_DARK'       : self.indi_allsky_config.get('IMAGE_SAVE_FITS_PRE_DARK', False),
             'IMAGE_EXIF_PRIVACY'             : self.indi_allsky_config.get('IMAGE_EXIF_PRIVACY', False),
             'IMAGE_FILE_TYPE'                : self.indi_allsky_config.get('IMAGE_FILE_TYPE', 'jpg'),
@@ -1247,7 +1277,11 @@ class ConfigView(FormView):
             'IMAGE_QUEUE_MAX'                : self.indi_allsky_config.get('IMAGE_QUEUE_MAX', 3),
             'IMAGE_QUEUE_MIN'                : self.indi_allsky_config.get('IMAGE_QUEUE_MIN', 1),
             'IMAGE_QUEUE_BACKOFF'            : self.indi_allsky_config.get('IMAGE_QUEUE_BACKOFF', 0.5),
+            'IMAGE_SHARED_MEMORY'            : self.indi_allsky_config.get('IMAGE_SHARED_MEMORY', True),
+            'IMAGE_WORKERS'                  : self.indi_allsky_config.get('IMAGE_WORKERS', 1),
+            'IMAGE_PIPELINE'                 : self.indi_allsky_config.get('IMAGE_PIPELINE', False),
             'THUMBNAILS__IMAGES_AUTO'        : self.indi_allsky_config.get('THUMBNAILS', {}).get('IMAGES_AUTO', True),
+            'THUMBNAILS__BACKGROUND'         : self.indi_allsky_config.get('THUMBNAILS', {}).get('BACKGROUND', False),
             'TIMELAPSE_EXPIRE_DAYS'          : self.indi_allsky_config.get('TIMELAPSE_EXPIRE_DAYS', 365),
             'FFMPEG_FRAMERATE'               : self.indi_allsky_config.get('FFMPEG_FRAMERATE', 25),
             'FFMPEG_BITRATE'                 : self.indi_allsky_config.get('FFMPEG_BITRATE', '5000k'),
@@ -1287,6 +1321,8 @@ class ConfigView(FormView):
             'ORB_PROPERTIES__AZ_OFFSET'      : self.indi_allsky_config.get('ORB_PROPERTIES', {}).get('AZ_OFFSET', 0.0),
             'ORB_PROPERTIES__RETROGRADE'     : self.indi_allsky_config.get('ORB_PROPERTIES', {}).get('RETROGRADE', False),
             'UPLOAD_WORKERS'                 : self.indi_allsky_config.get('UPLOAD_WORKERS', 2),
+            'UPLOAD_IDLE_TIMEOUT'            : self.indi_allsky_config.get('UPLOAD_IDLE_TIMEOUT', 300),
+            'UPLOAD_BATCH_MAX'               : self.indi_allsky_config.get('UPLOAD_BATCH_MAX', 10),
             'FILETRANSFER__CLASSNAME'        : self.indi_allsky_config.get('FILETRANSFER', {}).get('CLASSNAME', 'pycurl_sftp'),
             'FILETRANSFER__HOST'             : self.indi_allsky_config.get('FILETRANSFER', {}).get('HOST', ''),
             'FILETRANSFER__PORT'             : self.indi_allsky_config.get('FILETRANSFER', {}).get('PORT', 0),
@@ -1352,6 +1388,8 @@ class ConfigView(FormView):
             'MQTTPUBLISH__TLS'               : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('TLS', True),
             'MQTTPUBLISH__CERT_BYPASS'       : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('CERT_BYPASS', True),
             'MQTTPUBLISH__PUBLISH_IMAGE'     : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('PUBLISH_IMAGE', True),
+            'MQTTPUBLISH__IMAGE_PERIOD'      : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('IMAGE_PERIOD', 0),
+            'MQTTPUBLISH__DEADBAND'          : self.indi_allsky_config.get('MQTTPUBLISH', {}).get('DEADBAND', 0.0),
             'SYNCAPI__ENABLE'                : self.indi_allsky_config.get('SYNCAPI', {}).get('ENABLE', False),
             'SYNCAPI__BASEURL'               : self.indi_allsky_config.get('SYNCAPI', {}).get('BASEURL', 'https://example.com/indi-allsky'),
             'SYNCAPI__USERNAME'              : self.indi_allsky_config.get('SYNCAPI', {}).get('USERNAME', ''),
@@ -1359,6 +1397,7 @@ class ConfigView(FormView):
             'SYNCAPI__CERT_BYPASS'           : self.indi_allsky_config.get('SYNCAPI', {}).get('CERT_BYPASS', False),
             'SYNCAPI__POST_S3'               : self.indi_allsky_config.get('SYNCAPI', {}).get('POST_S3', False),
             'SYNCAPI__EMPTY_FILE'            : self.indi_allsky_config.get('SYNCAPI', {}).get('EMPTY_FILE', False),
+            'SYNCAPI__BATCH'                 : self.indi_allsky_config.get('SYNCAPI', {}).get('BATCH', False),
             'SYNCAPI__UPLOAD_IMAGE'          : self.indi_allsky_config.get('SYNCAPI', {}).get('UPLOAD_IMAGE', 1),
             'SYNCAPI__UPLOAD_PANORAMA'       : self.indi_allsky_config.get('SYNCAPI', {}).get('UPLOAD_PANORAMA', 1),
             'SYNCAPI__UPLOAD_VIDEO'          : True,  # cannot be changed
@@ -1380,6 +1419,7 @@ class ConfigView(FormView):
             'LIBCAMERA__AWB_ENABLE_DAY'      : self.indi_allsky_config.get('LIBCAMERA', {}).get('AWB_ENABLE_DAY', False),
             'LIBCAMERA__EXTRA_OPTIONS'       : self.indi_allsky_config.get('LIBCAMERA', {}).get('EXTRA_OPTIONS', ''),
             'LIBCAMERA__EXTRA_OPTIONS_DAY'   : self.indi_allsky_config.get('LIBCAMERA', {}).get('EXTRA_OPTIONS_DAY', ''),
+            'LIBCAMERA__PERSISTENT'          : self.indi_allsky_config.get('LIBCAMERA', {}).get('PERSISTENT', False),
             'PYCURL_CAMERA__URL'             : self.indi_allsky_config.get('PYCURL_CAMERA', {}).get('URL', ''),
             'PYCURL_CAMERA__USERNAME'        : self.indi_allsky_config.get('PYCURL_CAMERA', {}).get('USERNAME', ''),
             'PYCURL_CAMERA__PASSWORD'        : self.indi_allsky_config.get('PYCURL_CAMERA', {}).get('PASSWORD', ''),
@@ -1538,6 +1578,11 @@ class ConfigView(FormView):
         form_data['ORB_PROPERTIES__MOON_COLOR'] = ','.join(orb_properties__moon_color_str)
 
 
+        # Thumbnail sizes
+        thumbnails__sizes = self.indi_allsky_config.get('THUMBNAILS', {}).get('SIZES', [])
+        form_data['THUMBNAILS__SIZES_STR'] = ', '.join([str(x) for x in thumbnails__sizes])
+
+
         # Youtube
         youtube_tags = self.indi_allsky_config.get('YOUTUBE', {}).get('TAGS', [])
         form_data['YOUTUBE__TAGS_STR'] = ', '.join(youtube_tags)
@@ -1785,6 +1830,7 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['WBG_FACTOR']                           = float(request.json['WBG_FACTOR'])
         self.indi_allsky_config['WBB_FACTOR']                           = float(request.json['WBB_FACTOR'])
         self.indi_allsky_config['SATURATION_FACTOR']                    = float(request.json['SATURATION_FACTOR'])
+        self.indi_allsky_config['COLOR_TRANSFORM_FUSED']                = bool(request.json['COLOR_TRANSFORM_FUSED'])
         self.indi_allsky_config['CCD_COOLING']                          = bool(request.json['CCD_COOLING'])
         self.indi_allsky_config['CCD_TEMP']                             = float(request.json['CCD_TEMP'])
         self.indi_allsky_config['AUTO_WB']                              = bool(request.json['AUTO_WB'])
@@ -1801,6 +1847,7 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['DETECT_STARS']                         = bool(request.json['DETECT_STARS'])
         self.indi_allsky_config['DETECT_STARS_THOLD']                   = float(request.json['DETECT_STARS_THOLD'])
         self.indi_allsky_config['DETECT_METEORS']                       = bool(request.json['DETECT_METEORS'])
+        self.indi_allsky_config['DETECT_METEORS_PREPASS']               = bool(request.json['DETECT_METEORS_PREPASS'])
         self.indi_allsky_config['DETECT_MASK']                          = str(request.json['DETECT_MASK'])
         self.indi_allsky_config['DETECT_DRAW']                          = bool(request.json['DETECT_DRAW'])
         self.indi_allsky_config['LOGO_OVERLAY']                         = str(request.json['LOGO_OVERLAY'])
@@ -1810,6 +1857,7 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['LOCATION_LATITUDE']                    = float(request.json['LOCATION_LATITUDE'])
         self.indi_allsky_config['LOCATION_LONGITUDE']                   = float(request.json['LOCATION_LONGITUDE'])
         self.indi_allsky_config['LOCATION_ELEVATION']                   = int(request.json['LOCATION_ELEVATION'])
+        self.indi_allsky_config['ASTROMETRIC_PLANET_INTERVAL']          = int(request.json['ASTROMETRIC_PLANET_INTERVAL'])
         self.indi_allsky_config['TIMELAPSE_ENABLE']                     = bool(request.json['TIMELAPSE_ENABLE'])
         self.indi_allsky_config['TIMELAPSE_SKIP_FRAMES']                = int(request.json['TIMELAPSE_SKIP_FRAMES'])
         self.indi_allsky_config['DAYTIME_CAPTURE']                      = bool(request.json['DAYTIME_CAPTURE'])
@@ -1838,6 +1886,8 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['KEOGRAM_CROP_TOP']                     = int(request.json['KEOGRAM_CROP_TOP'])
         self.indi_allsky_config['KEOGRAM_CROP_BOTTOM']                  = int(request.json['KEOGRAM_CROP_BOTTOM'])
         self.indi_allsky_config['KEOGRAM_LABEL']                        = bool(request.json['KEOGRAM_LABEL'])
+        self.indi_allsky_config['KEOGRAM_MEMMAP']                       = bool(request.json['KEOGRAM_MEMMAP'])
+        self.indi_allsky_config['KEOGRAM_STARTRAILS_INCREMENTAL']       = bool(request.json['KEOGRAM_STARTRAILS_INCREMENTAL'])
         self.indi_allsky_config['STARTRAILS_SUN_ALT_THOLD']             = float(request.json['STARTRAILS_SUN_ALT_THOLD'])
         self.indi_allsky_config['STARTRAILS_MOONMODE_THOLD']            = bool(request.json['STARTRAILS_MOONMODE_THOLD'])
         self.indi_allsky_config['STARTRAILS_MOON_ALT_THOLD']            = float(request.json['STARTRAILS_MOON_ALT_THOLD'])
@@ -1850,6 +1900,8 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['STARTRAILS_TIMELAPSE_MINFRAMES']       = int(request.json['STARTRAILS_TIMELAPSE_MINFRAMES'])
         self.indi_allsky_config['STARTRAILS_USE_DB_DATA']               = bool(request.json['STARTRAILS_USE_DB_DATA'])
         self.indi_allsky_config['IMAGE_CALIBRATE_DARK']                 = bool(request.json['IMAGE_CALIBRATE_DARK'])
+        self.indi_allsky_config['IMAGE_CALIBRATE_CACHE_MB']             = int(request.json['IMAGE_CALIBRATE_CACHE_MB'])
+        self.indi_allsky_config['IMAGE_CALIBRATE_CACHE_MMAP']           = bool(request.json['IMAGE_CALIBRATE_CACHE_MMAP'])
         self.indi_allsky_config['IMAGE_SAVE_FITS_PRE_DARK']             = bool(request.json['IMAGE_SAVE_FITS_PRE_DARK'])
         self.indi_allsky_config['IMAGE_EXIF_PRIVACY']                   = bool(request.json['IMAGE_EXIF_PRIVACY'])
         self.indi_allsky_config['IMAGE_FILE_TYPE']                      = str(request.json['IMAGE_FILE_TYPE'])
@@ -1903,7 +1955,11 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['IMAGE_QUEUE_MAX']                      = int(request.json['IMAGE_QUEUE_MAX'])
         self.indi_allsky_config['IMAGE_QUEUE_MIN']                      = int(request.json['IMAGE_QUEUE_MIN'])
         self.indi_allsky_config['IMAGE_QUEUE_BACKOFF']                  = float(request.json['IMAGE_QUEUE_BACKOFF'])
+        self.indi_allsky_config['IMAGE_SHARED_MEMORY']                  = bool(request.json['IMAGE_SHARED_MEMORY'])
+        self.indi_allsky_config['IMAGE_WORKERS']                        = int(request.json['IMAGE_WORKERS'])
+        self.indi_allsky_config['IMAGE_PIPELINE']                       = bool(request.json['IMAGE_PIPELINE'])
         self.indi_allsky_config['THUMBNAILS']['IMAGES_AUTO']            = bool(request.json['THUMBNAILS__IMAGES_AUTO'])
+        self.indi_allsky_config['THUMBNAILS']['BACKGROUND']             = bool(request.json['THUMBNAILS__BACKGROUND'])
         self.indi_allsky_config['TIMELAPSE_EXPIRE_DAYS']                = int(request.json['TIMELAPSE_EXPIRE_DAYS'])
         self.indi_allsky_config['FFMPEG_FRAMERATE']                     = int(request.json['FFMPEG_FRAMERATE'])
         self.indi_allsky_config['FFMPEG_BITRATE']                       = str(request.json['FFMPEG_BITRATE'])
@@ -1943,6 +1999,8 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['ORB_PROPERTIES']['AZ_OFFSET']          = float(request.json['ORB_PROPERTIES__AZ_OFFSET'])
         self.indi_allsky_config['ORB_PROPERTIES']['RETROGRADE']         = bool(request.json['ORB_PROPERTIES__RETROGRADE'])
         self.indi_allsky_config['UPLOAD_WORKERS']                       = int(request.json['UPLOAD_WORKERS'])
+        self.indi_allsky_config['UPLOAD_IDLE_TIMEOUT']                  = int(request.json['UPLOAD_IDLE_TIMEOUT'])
+        self.indi_allsky_config['UPLOAD_BATCH_MAX']                     = int(request.json['UPLOAD_BATCH_MAX'])
         self.indi_allsky_config['FILETRANSFER']['CLASSNAME']            = str(request.json['FILETRANSFER__CLASSNAME'])
         self.indi_allsky_config['FILETRANSFER']['HOST']                 = str(request.json['FILETRANSFER__HOST'])
         self.indi_allsky_config['FILETRANSFER']['PORT']                 = int(request.json['FILETRANSFER__PORT'])
@@ -2008,6 +2066,8 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['MQTTPUBLISH']['TLS']                   = bool(request.json['MQTTPUBLISH__TLS'])
         self.indi_allsky_config['MQTTPUBLISH']['CERT_BYPASS']           = bool(request.json['MQTTPUBLISH__CERT_BYPASS'])
         self.indi_allsky_config['MQTTPUBLISH']['PUBLISH_IMAGE']         = bool(request.json['MQTTPUBLISH__PUBLISH_IMAGE'])
+        self.indi_allsky_config['MQTTPUBLISH']['IMAGE_PERIOD']          = int(request.json['MQTTPUBLISH__IMAGE_PERIOD'])
+        self.indi_allsky_config['MQTTPUBLISH']['DEADBAND']              = float(request.json['MQTTPUBLISH__DEADBAND'])
         self.indi_allsky_config['SYNCAPI']['ENABLE']                    = bool(request.json['SYNCAPI__ENABLE'])
         self.indi_allsky_config['SYNCAPI']['BASEURL']                   = str(request.json['SYNCAPI__BASEURL'])
         self.indi_allsky_config['SYNCAPI']['USERNAME']                  = str(request.json['SYNCAPI__USERNAME'])
@@ -2015,6 +2075,7 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['SYNCAPI']['CERT_BYPASS']               = bool(request.json['SYNCAPI__CERT_BYPASS'])
         self.indi_allsky_config['SYNCAPI']['POST_S3']                   = bool(request.json['SYNCAPI__POST_S3'])
         self.indi_allsky_config['SYNCAPI']['EMPTY_FILE']                = bool(request.json['SYNCAPI__EMPTY_FILE'])
+        self.indi_allsky_config['SYNCAPI']['BATCH']                     = bool(request.json['SYNCAPI__BATCH'])
         self.indi_allsky_config['SYNCAPI']['UPLOAD_IMAGE']              = int(request.json['SYNCAPI__UPLOAD_IMAGE'])
         self.indi_allsky_config['SYNCAPI']['UPLOAD_PANORAMA']           = int(request.json['SYNCAPI__UPLOAD_PANORAMA'])
         #self.indi_allsky_config['SYNCAPI']['UPLOAD_VIDEO']              = bool(request.json['SYNCAPI__UPLOAD_VIDEO'])  # cannot be changed
@@ -2046,6 +2107,7 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['LIBCAMERA']['AWB_ENABLE_DAY']          = bool(request.json['LIBCAMERA__AWB_ENABLE_DAY'])
         self.indi_allsky_config['LIBCAMERA']['EXTRA_OPTIONS']           = str(request.json['LIBCAMERA__EXTRA_OPTIONS'])
         self.indi_allsky_config['LIBCAMERA']['EXTRA_OPTIONS_DAY']       = str(request.json['LIBCAMERA__EXTRA_OPTIONS_DAY'])
+        self.indi_allsky_config['LIBCAMERA']['PERSISTENT']              = bool(request.json['LIBCAMERA__PERSISTENT'])
         self.indi_allsky_config['PYCURL_CAMERA']['URL']                 = str(request.json['PYCURL_CAMERA__URL'])
         self.indi_allsky_config['PYCURL_CAMERA']['USERNAME']            = str(request.json['PYCURL_CAMERA__USERNAME'])
         self.indi_allsky_config['PYCURL_CAMERA']['PASSWORD']            = str(request.json['PYCURL_CAMERA__PASSWORD'])
@@ -2164,6 +2226,18 @@ class AjaxConfigView(BaseView):
         self.indi_allsky_config['ORB_PROPERTIES']['MOON_COLOR'] = [int(moon_r), int(moon_g), int(moon_b)]
 
 
+        # Thumbnail sizes
+        thumbnails__sizes_str = str(request.json['THUMBNAILS__SIZES_STR'])
+        sizes_set = set()
+        for size in thumbnails__sizes_str.split(','):
+            size_s = size.strip()
+
+            if size_s:
+                sizes_set.add(int(size_s))
+
+        self.indi_allsky_config['THUMBNAILS']['SIZES'] = sorted(sizes_set)
+
+
         # Youtube tags
         youtube__tags_str = str(request.json['YOUTUBE__TAGS_STR'])
         tags_set = set()
@@ -2766,6 +2840,8 @@ class SystemInfoView(TemplateView):
 
         context['net_list'] = self.getNetworkIps()
 
+        context['upload_pool_list'] = self.getUploadPoolStats()
+
         context['indiserver_service_activestate'], context['indiserver_service_unitstate'] = self.getSystemdUnitStatus(app.config['INDISERVER_SERVICE_NAME'])
         context['indi_allsky_service_activestate'], context['indi_allsky_service_unitstate'] = self.getSystemdUnitStatus(app.config['ALLSKY_SERVICE_NAME'])
         context['indi_allsky_timer_activestate'], context['indi_allsky_timer_unitstate'] = self.getSystemdUnitStatus(app.config['ALLSKY_TIMER_NAME'])
@@ -3026,6 +3102,28 @@ class SystemInfoView(TemplateView):
         return net_list
 
 
+    def getUploadPoolStats(self):
+        pool_state_list = IndiAllSkyDbStateTable.query\
+            .filter(IndiAllSkyDbStateTable.key.like('UPLOAD_POOL_STATS_%'))\
+            .order_by(IndiAllSkyDbStateTable.key.asc())
+
+        upload_pool_list = list()
+        for pool_state in pool_state_list:
+            try:
+                stats = json.loads(pool_state.value)
+            except json.JSONDecodeError as e:
+                app.logger.error('Invalid upload pool stats: %s', str(e))
+                continue
+
+            stats['name'] = pool_state.key.replace('UPLOAD_POOL_STATS_', '')
+            stats['date'] = pool_state.createDate
+
+            upload_pool_list.append(stats)
+
+
+        return upload_pool_list
+
+
     def getSystemdUnitStatus(self, unit_name):
         try:
             session_bus = dbus.SessionBus()
@@ -3688,6 +3786,9 @@ class AjaxSystemInfoView(BaseView):
                 app.logger.error('Cannot remove file: %s', str(e))
                 continue
 
+            if isinstance(entry, IndiAllSkyDbImageTable):
+                IndiAllSkyDbImageCalendarTable.removeImage(entry)
+
             db.session.delete(entry)
             db.session.commit()
 
@@ -3930,7 +4031,9 @@ class AjaxSystemInfoView(BaseView):
 
         ### DELETE ###
         message_list.append('<p>Removed {0:d} missing image entries</p>'.format(len(image_notfound_list)))
-        [db.session.delete(i) for i in image_notfound_list]
+        for i in image_notfound_list:
+            IndiAllSkyDbImageCalendarTable.removeImage(i)
+            db.session.delete(i)
 
 
         message_list.append('<p>Removed {0:d} missing FITS image entries</p>'.format(len(fits_image_notfound_list)))
@@ -3980,6 +4083,11 @@ class AjaxSystemInfoView(BaseView):
         # finalize transaction
         db.session.commit()
 
+
+        if badpixelmap_notfound_list or darkframe_notfound_list:
+            # image processors need to reload calibration frames
+            self._miscDb.invalidateCalibrationCache()
+
         return message_list
 
 
@@ -4558,6 +4666,9 @@ class AjaxTimelapseGeneratorView(BaseView):
                 app.logger.error('Cannot remove file: %s', str(e))
                 continue
 
+            if isinstance(entry, IndiAllSkyDbImageTable):
+                IndiAllSkyDbImageCalendarTable.removeImage(entry)
+
             db.session.delete(entry)
             db.session.commit()
 
@@ -5037,19 +5148,13 @@ class JsonImageProcessingView(JsonView):
                 message_list.append('SCNR')
 
 
-            # white balance
-            image_processor.white_balance_manual_bgr()
+            # white balance and saturation
+            image_processor.color_transform()
 
             if p_config.get('AUTO_WB'):
-                image_processor.white_balance_auto_bgr()
-
                 message_list.append('Auto White Balance')
 
 
-            # saturation
-            image_processor.saturation_adjust()
-
-
             if p_config['NIGHT_CONTRAST_ENHANCE']:
                 if not p_config.get('CONTRAST_ENHANCE_16BIT'):
                     image_processor.contrast_clahe()
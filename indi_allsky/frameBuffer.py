@@ -0,0 +1,118 @@
+from multiprocessing import shared_memory
+from multiprocessing import resource_tracker
+import numpy
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyFrameBuffer(object):
+
+    ### Ring buffer in shared memory used to pass raw frames from the capture process to the image workers
+    # the first bytes of the buffer hold a state flag per slot, the image worker releases the slot after copying the frame
+
+    header_size = 64
+    max_slots = header_size
+
+    SLOT_FREE = 0
+    SLOT_BUSY = 1
+
+
+    def __init__(self, shm, slot_size, slots):
+        self._shm = shm
+        self._slot_size = int(slot_size)
+        self._slots = int(slots)
+
+        self._next_slot = 0
+
+
+    @classmethod
+    def create(cls, slot_size, slots):
+        slots = min(int(slots), cls.max_slots)
+
+        shm = shared_memory.SharedMemory(create=True, size=cls.header_size + (int(slot_size) * slots))
+        shm.buf[:cls.header_size] = bytes(cls.header_size)  # all slots free
+
+        logger.info('Created frame buffer %s: %d slots, %0.1f MB', shm.name, slots, shm.size / 1024 / 1024)
+
+        return cls(shm, slot_size, slots)
+
+
+    @classmethod
+    def attach(cls, name, slot_size, slots):
+        # exceptions are handled by the caller
+        shm = shared_memory.SharedMemory(name=name)
+
+        # the segment is registered with this process' resource tracker when attached
+        # the tracker would unlink it when the process exits, only the creator may unlink
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+        return cls(shm, slot_size, slots)
+
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    @name.setter
+    def name(self, *args):
+        pass  # read only
+
+
+    def put(self, data):
+        if data.nbytes > self._slot_size:
+            logger.warning('Frame (%d bytes) is larger than the frame buffer slot (%d bytes)', data.nbytes, self._slot_size)
+            return None
+
+
+        slot = self._next_slot
+        if self._shm.buf[slot] != self.SLOT_FREE:
+            logger.warning('Frame buffer is full')
+            return None
+
+
+        self._next_slot = (slot + 1) % self._slots
+
+
+        offset = self.header_size + (slot * self._slot_size)
+
+        slot_data = numpy.ndarray(data.shape, dtype=data.dtype, buffer=self._shm.buf, offset=offset)
+        slot_data[:] = data
+        del slot_data
+
+        self._shm.buf[slot] = self.SLOT_BUSY
+
+
+        return {
+            'name'      : self._shm.name,
+            'slot_size' : self._slot_size,
+            'slots'     : self._slots,
+            'slot'      : slot,
+            'shape'     : data.shape,
+            'dtype'     : data.dtype.str,
+        }
+
+
+    def get(self, frame):
+        slot = frame['slot']
+        offset = self.header_size + (slot * self._slot_size)
+
+        slot_data = numpy.ndarray(frame['shape'], dtype=numpy.dtype(frame['dtype']), buffer=self._shm.buf, offset=offset)
+
+        # copy the frame out so the slot can be reused immediately
+        data = slot_data.copy()
+        del slot_data
+
+        self._shm.buf[slot] = self.SLOT_FREE
+
+        return data
+
+
+    def close(self):
+        self._shm.close()
+
+
+    def unlink(self):
+        self._shm.close()
+        self._shm.unlink()
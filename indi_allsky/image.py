@@ -17,8 +17,10 @@ import traceback
 #from pprint import pformat
 
 from multiprocessing import Process
+from multiprocessing import Array
 #from threading import Thread
 import queue
+import uuid
 
 import cv2
 import numpy
@@ -31,7 +33,12 @@ from fractions import Fraction
 from . import constants
 
 from .processing import ImageProcessor
+from .accumulator import IndiAllskyAccumulator
 from .miscUpload import miscUpload
+from .thumbnailWorker import ThumbnailWorker
+from .frameBuffer import IndiAllskyFrameBuffer
+from .imageSequencer import IndiAllskyImageSequencer
+from .imagePipeline import ImagePipelineStage
 
 from .flask import create_app
 from .flask import db
@@ -62,6 +69,8 @@ class ImageWorker(Process):
     sqm_history_minutes = 30
     stars_history_minutes = 30
 
+    pipeline_queue_max = 2
+
 
     def __init__(
         self,
@@ -78,6 +87,9 @@ class ImageWorker(Process):
         sensors_user_av,
         night_v,
         moonmode_v,
+        sequencer=None,
+        pipeline_av=None,
+        mqtt_q=None,
     ):
         super(ImageWorker, self).__init__()
 
@@ -88,6 +100,7 @@ class ImageWorker(Process):
         self.error_q = error_q
         self.image_q = image_q
         self.upload_q = upload_q
+        self.mqtt_q = mqtt_q  # metadata is published without the task queue
 
         self.position_av = position_av  # lat, long, elev, ra, dec
 
@@ -145,6 +158,30 @@ class ImageWorker(Process):
         self.image_count = 0
         self.metadata_count = 0
 
+        self.idx = idx
+        self._thumbnail_worker = None  # started in the worker process
+
+
+        # the sequencer is shared when there are multiple image workers
+        if sequencer:
+            self._sequencer = sequencer
+        else:
+            self._sequencer = IndiAllskyImageSequencer()
+
+        self._seq = None
+        self._stage_done_list = list()
+
+
+        # pending frames, compute, write and persist latency
+        if pipeline_av:
+            self.pipeline_av = pipeline_av
+        else:
+            self.pipeline_av = Array('f', [0.0, 0.0, 0.0, 0.0])
+
+        self._write_stage = None  # started in the worker process
+        self._persist_stage = None
+        self._frame_buffer = None  # attached in the worker process
+
         self.image_processor = ImageProcessor(
             self.config,
             self.position_av,
@@ -158,7 +195,24 @@ class ImageWorker(Process):
         )
 
         self._miscDb = miscDb(self.config)
-        self._miscUpload = miscUpload(self.config, self.upload_q)
+        self._miscUpload = miscUpload(self.config, self.upload_q, mqtt_q=self.mqtt_q)
+
+
+        if self.config.get('KEOGRAM_STARTRAILS_INCREMENTAL'):
+            if self._sequencer.worker_count_v.value > 1:
+                # images are accumulated in frame order by all workers
+                accum_count_v = self._sequencer.accum_count_v
+            else:
+                accum_count_v = None
+
+            self._accumulator = IndiAllskyAccumulator(
+                self.config,
+                self.bin_v,
+                mask=self.image_processor.detection_mask,
+                shared_count_v=accum_count_v,
+            )
+        else:
+            self._accumulator = None
 
 
         self._libcamera_raw = False
@@ -235,23 +289,211 @@ class ImageWorker(Process):
 
         while True:
             try:
-                i_dict = self.image_q.get(timeout=23)  # prime number
+                i_dict, seq = self._sequencer.get(self.image_q, timeout=23)  # prime number
             except queue.Empty:
                 continue
 
 
             if i_dict.get('stop'):
+                self._stopPipeline()
+                self._checkpointAccumulator()
+                self._stopThumbnailWorker()
                 logger.warning('Goodbye')
                 return
 
             if self._shutdown:
+                self._sequencer.finish(seq, [])
+                self._stopPipeline()
+                self._checkpointAccumulator()
+                self._stopThumbnailWorker()
                 logger.warning('Goodbye')
                 return
 
 
+            self._seq = seq
+            self._stage_done_list = list()
+
             # new context for every task, reduces the effects of caching
             with app.app_context():
-                self.processImage(i_dict)
+                try:
+                    self.processImage(i_dict)
+                finally:
+                    # later frames cannot continue until all stages of this frame are complete
+                    self._sequencer.finish(self._seq, self._stage_done_list)
+
+
+    def _checkpointAccumulator(self):
+        if not self._accumulator:
+            return
+
+        # save progress before exiting
+        self._accumulator.checkpoint()
+
+
+    def _enterStage(self, stage, seq):
+        self._sequencer.wait(stage, seq)
+
+
+        # load the state of the previous frame
+        if stage == 'exposure':
+            self.target_adu_found = bool(self._sequencer.target_adu_found_v.value)
+            self.current_adu_target = self._sequencer.current_adu_target_v.value
+            self.hist_adu = list(self._sequencer.hist_adu_av[:self._sequencer.hist_adu_len_v.value])
+            self.generate_mask_base = bool(self._sequencer.generate_mask_base_v.value)
+        elif stage == 'commit':
+            self.metadata_count = self._sequencer.metadata_count_v.value
+
+
+    def _leaveStage(self, stage, seq, stage_done_list):
+        if stage == 'exposure':
+            hist_adu = self.hist_adu[(self._sequencer.hist_adu_max * -1):]
+
+            self._sequencer.target_adu_found_v.value = int(self.target_adu_found)
+            self._sequencer.current_adu_target_v.value = self.current_adu_target
+            self._sequencer.hist_adu_av[:len(hist_adu)] = hist_adu
+            self._sequencer.hist_adu_len_v.value = len(hist_adu)
+            self._sequencer.generate_mask_base_v.value = int(self.generate_mask_base)
+        elif stage == 'commit':
+            self._sequencer.metadata_count_v.value = self.metadata_count
+
+
+        stage_done_list.append(stage)
+        self._sequencer.done(stage, seq)
+
+
+    def _exchangeStackHistory(self, i_ref):
+        if self._sequencer.worker_count_v.value <= 1:
+            # the image list holds the previous frames
+            return
+
+        if self.image_processor.stack_count <= 1:
+            return
+
+        if self.image_processor.focus_mode:
+            return
+
+
+        stack_history = self._sequencer.stack_history
+        stack_count = self.image_processor.stack_count
+
+        # the previous frames were processed by other image workers
+        self._enterStage('stack', self._seq)
+
+        if self.night_v.value and not self.moonmode_v.value:
+            try:
+                stack_history.publish(self._seq, i_ref)
+            except OSError as e:
+                logger.error('Unable to save stacking history: %s', str(e))
+
+            history_list = stack_history.load(self._seq, stack_count)
+        else:
+            # stacking is disabled during daytime and moonmode
+            history_list = list()
+
+        stack_history.expire(self._seq, stack_count)
+
+        self._leaveStage('stack', self._seq, self._stage_done_list)
+
+
+        # new image is first in list
+        self.image_processor.image_list[1:] = history_list
+
+
+    def _getFrameBuffer(self, frame):
+        if self._frame_buffer and self._frame_buffer.name == frame['name']:
+            return self._frame_buffer
+
+
+        if self._frame_buffer:
+            # capture process was restarted
+            self._frame_buffer.close()
+            self._frame_buffer = None
+
+
+        self._frame_buffer = IndiAllskyFrameBuffer.attach(frame['name'], frame['slot_size'], frame['slots'])
+
+        return self._frame_buffer
+
+
+    def _getPipeline(self):
+        if self._write_stage and self._write_stage.is_alive():
+            return self._write_stage
+
+
+        self._persist_stage = ImagePipelineStage(
+            self.idx,
+            'Persist',
+            self._pipelinePersist,
+            self._pipelineError,
+            maxsize=self.pipeline_queue_max,
+        )
+
+        self._write_stage = ImagePipelineStage(
+            self.idx,
+            'Write',
+            self._writeImage,
+            self._pipelineError,
+            next_stage=self._persist_stage,
+            maxsize=self.pipeline_queue_max,
+        )
+
+        self._persist_stage.start()
+        self._write_stage.start()
+
+        return self._write_stage
+
+
+    def _stopPipeline(self):
+        if not self._write_stage:
+            return
+
+        # the stop is passed to the persist stage after pending images
+        self._write_stage.stop()
+        self._write_stage.join()
+        self._persist_stage.join()
+
+
+    def _pipelinePersist(self, c):
+        try:
+            self._persistImage(c)
+        finally:
+            with self.pipeline_av.get_lock():
+                self.pipeline_av[0] -= 1
+
+
+    def _pipelineError(self, c, e):
+        if 'write' not in c['stage_done_list']:
+            # failed before the persist stage
+            with self.pipeline_av.get_lock():
+                self.pipeline_av[0] -= 1
+
+        # later frames cannot continue until all stages of this frame are complete
+        self._sequencer.finish(c['seq'], c['stage_done_list'])
+
+
+    def _getThumbnailWorker(self):
+        if self._thumbnail_worker and self._thumbnail_worker.is_alive():
+            return self._thumbnail_worker
+
+
+        self._thumbnail_worker = ThumbnailWorker(
+            self.idx,
+            self.config,
+            self.error_q,
+            self.upload_q,
+        )
+        self._thumbnail_worker.start()
+
+        return self._thumbnail_worker
+
+
+    def _stopThumbnailWorker(self):
+        if not self._thumbnail_worker:
+            return
+
+        # finish pending thumbnails
+        self._thumbnail_worker.stop()
+        self._thumbnail_worker.join()
 
 
     def processImage(self, i_dict):
@@ -281,7 +523,7 @@ class ImageWorker(Process):
         #filename_t = task.data.get('filename_t')
         ###
 
-        filename_p = Path(i_dict['filename'])
+        frame = i_dict.get('frame')
         exposure = i_dict['exposure']
         exp_date = datetime.fromtimestamp(i_dict['exp_time'])
         exp_elapsed = i_dict['exp_elapsed']
@@ -298,16 +540,28 @@ class ImageWorker(Process):
             self.filename_t = filename_t
 
 
-        if not filename_p.exists():
-            logger.error('Frame not found: %s', filename_p)
-            #task.setFailed('Frame not found: {0:s}'.format(str(filename_p)))
-            return
+        if frame:
+            # raw frame in shared memory
+            filename_p = None
 
+            try:
+                frame['data'] = self._getFrameBuffer(frame).get(frame)
+            except FileNotFoundError:
+                logger.error('Frame buffer not found: %s', frame['name'])
+                return
+        else:
+            filename_p = Path(i_dict['filename'])
 
-        if filename_p.stat().st_size == 0:
-            logger.error('Frame is empty: %s', filename_p)
-            filename_p.unlink()
-            return
+            if not filename_p.exists():
+                logger.error('Frame not found: %s', filename_p)
+                #task.setFailed('Frame not found: {0:s}'.format(str(filename_p)))
+                return
+
+
+            if filename_p.stat().st_size == 0:
+                logger.error('Frame is empty: %s', filename_p)
+                filename_p.unlink()
+                return
 
 
         camera = IndiAllSkyDbCameraTable.query\
@@ -326,18 +580,23 @@ class ImageWorker(Process):
 
 
         try:
-            i_ref = self.image_processor.add(filename_p, exposure, exp_date, exp_elapsed, camera)
+            i_ref = self.image_processor.add(filename_p, exposure, exp_date, exp_elapsed, camera, frame=frame)
         except BadImage as e:
             logger.error('Bad Image: %s', str(e))
-            filename_p.unlink()
+
+            if filename_p:
+                filename_p.unlink()
+
             #task.setFailed('Bad Image: {0:s}'.format(str(filename_p)))
             return
 
 
-        filename_p.unlink()  # original file is no longer needed
+        if filename_p:
+            filename_p.unlink()  # original file is no longer needed
 
 
-        self.image_count += 1
+        # frame numbers are shared by all image workers
+        self.image_count = self._seq + 1
 
 
         if self.config.get('IMAGE_SAVE_FITS'):
@@ -359,6 +618,8 @@ class ImageWorker(Process):
 
         self.image_processor.calculateSqm()
 
+        self._exchangeStackHistory(i_ref)
+
         self.image_processor.stack()
 
         self.image_processor.debayer()
@@ -499,6 +760,9 @@ class ImageWorker(Process):
         #logger.info('Wrote Numpy data: /tmp/indi_allsky_numpy.npy')
 
 
+        # exposure feedback is applied in frame order
+        self._enterStage('exposure', self._seq)
+
         # adu calculate (before processing)
         adu, adu_average = self.calculate_exposure(adu, exposure)
 
@@ -509,6 +773,8 @@ class ImageWorker(Process):
             self.generate_mask_base = False
             self.write_mask_base_img(self.image_processor.image)
 
+        self._leaveStage('exposure', self._seq, self._stage_done_list)
+
 
         # line detection
         if self.night_v.value and self.config.get('DETECT_METEORS'):
@@ -553,15 +819,8 @@ class ImageWorker(Process):
             self.image_processor.scnr()
 
 
-        # white balance
-        self.image_processor.white_balance_manual_bgr()
-
-        if self.config.get('AUTO_WB'):
-            self.image_processor.white_balance_auto_bgr()
-
-
-        # saturation
-        self.image_processor.saturation_adjust()
+        # white balance and saturation
+        self.image_processor.color_transform()
 
 
         if not self.config.get('CONTRAST_ENHANCE_16BIT'):
@@ -576,10 +835,8 @@ class ImageWorker(Process):
         self.image_processor.colorize()
 
 
-        self.image_processor.apply_image_circle_mask()
-
-
-        self.image_processor.apply_logo_overlay()
+        # image circle mask and logo overlay
+        self.image_processor.apply_composite()
 
 
         if self.config['IMAGE_SCALE'] and self.config['IMAGE_SCALE'] != 100:
@@ -619,38 +876,115 @@ class ImageWorker(Process):
         processing_elapsed_s = time.time() - processing_start
         logger.info('Image processed in %0.4f s', processing_elapsed_s)
 
-
-        # need this after resizing and scaling
-        final_height, final_width = self.image_processor.image.shape[:2]
+        self.pipeline_av[1] = processing_elapsed_s
 
 
         #task.setSuccess('Image processed')
 
-        self.write_status_json(i_ref, adu, adu_average)  # write json status file
 
-        latest_file, new_filename = self.write_img(self.image_processor.image, i_ref, camera, jpeg_exif=jpeg_exif)
+        # the next frame may update these before this image is saved
+        i_ref['target_adu_found'] = self.target_adu_found
+        i_ref['current_adu_target'] = self.current_adu_target
+        i_ref['astrometric_data'] = copy.copy(self.astrometric_data)
+        i_ref['gain'] = self.gain_v.value
+        i_ref['binning'] = self.bin_v.value
+        i_ref['ccd_temp'] = self.sensors_temp_av[0]
+        i_ref['night'] = bool(self.night_v.value)
+        i_ref['moonmode'] = bool(self.moonmode_v.value)
+
+
+        commit_job = {
+            'seq'                  : self._seq,
+            'i_ref'                : i_ref,
+            'image'                : self.image_processor.image,
+            'camera_id'            : camera_id,
+            'jpeg_exif'            : jpeg_exif,
+            'adu'                  : adu,
+            'adu_average'          : adu_average,
+            'processing_elapsed_s' : processing_elapsed_s,
+        }
+
+
+        if self.config.get('IMAGE_PIPELINE'):
+            # the pipeline completes the write and commit stages
+            commit_job['stage_done_list'] = list(self._stage_done_list)
+            self._stage_done_list.extend(['write', 'commit'])
+
+            with self.pipeline_av.get_lock():
+                self.pipeline_av[0] += 1
+
+            # blocks when the pipeline is full
+            self._getPipeline().put(commit_job)
+            return
+
+
+        commit_job['stage_done_list'] = self._stage_done_list
+
+        self._writeImage(commit_job)
+        self._persistImage(commit_job)
+
+
+    def _writeImage(self, c):
+        # latest image files are written in frame order
+        self._enterStage('write', c['seq'])
+
+        write_start = time.time()
+
+        i_ref = c['i_ref']
+
+        camera = IndiAllSkyDbCameraTable.query\
+            .filter(IndiAllSkyDbCameraTable.id == c['camera_id'])\
+            .one()
+
+
+        self.write_status_json(i_ref, c['adu'], c['adu_average'])  # write json status file
+
+        c['latest_file'], c['new_filename'] = self.write_img(c['image'], i_ref, camera, jpeg_exif=c['jpeg_exif'])
+
+
+        write_elapsed_s = time.time() - write_start
+        self.pipeline_av[2] = write_elapsed_s
+
+        self._leaveStage('write', c['seq'], c['stage_done_list'])
+
+
+    def _persistImage(self, c):
+        # images are added to the DB and uploaded in frame order
+        self._enterStage('commit', c['seq'])
+
+        persist_start = time.time()
+
+        i_ref = c['i_ref']
 
-        if new_filename:
+        camera = IndiAllSkyDbCameraTable.query\
+            .filter(IndiAllSkyDbCameraTable.id == c['camera_id'])\
+            .one()
+
+
+        # need this after resizing and scaling
+        final_height, final_width = c['image'].shape[:2]
+
+        if c['new_filename']:
             image_metadata = {
                 'type'            : constants.IMAGE,
-                'createDate'      : exp_date.timestamp(),
-                'utc_offset'      : exp_date.astimezone().utcoffset().total_seconds(),
-                'exposure'        : exposure,
-                'exp_elapsed'     : exp_elapsed,
-                'gain'            : self.gain_v.value,
-                'binmode'         : self.bin_v.value,
-                'temp'            : self.sensors_temp_av[0],
-                'adu'             : adu,
-                'stable'          : self.target_adu_found,
-                'moonmode'        : bool(self.moonmode_v.value),
-                'moonphase'       : self.astrometric_data['moon_phase'],
-                'night'           : bool(self.night_v.value),
+                'createDate'      : i_ref['exp_date'].timestamp(),
+                'utc_offset'      : i_ref['exp_date'].astimezone().utcoffset().total_seconds(),
+                'exposure'        : i_ref['exposure'],
+                'exp_elapsed'     : i_ref['exp_elapsed'],
+                'gain'            : i_ref['gain'],
+                'binmode'         : i_ref['binning'],
+                'temp'            : i_ref['ccd_temp'],
+                'adu'             : c['adu'],
+                'stable'          : i_ref['target_adu_found'],
+                'moonmode'        : i_ref['moonmode'],
+                'moonphase'       : i_ref['astrometric_data']['moon_phase'],
+                'night'           : i_ref['night'],
                 'adu_roi'         : self.config['ADU_ROI'],
                 'calibrated'      : i_ref['calibrated'],
                 'sqm'             : i_ref['sqm_value'],
                 'stars'           : len(i_ref['stars']),
                 'detections'      : len(i_ref['lines']),
-                'process_elapsed' : processing_elapsed_s,
+                'process_elapsed' : c['processing_elapsed_s'],
                 'kpindex'         : i_ref['kpindex'],
                 'ovation_max'     : i_ref['ovation_max'],
                 'smoke_rating'    : i_ref['smoke_rating'],
@@ -661,29 +995,62 @@ class ImageWorker(Process):
 
             image_metadata['data'] = {}
 
+            # the chart view reads the histogram from the database
+            histogram = self.image_processor.calculate_histogram(image=c['image'])
+
             image_entry = self._miscDb.addImage(
-                new_filename.relative_to(self.image_dir),
-                camera_id,
+                c['new_filename'].relative_to(self.image_dir),
+                camera.id,
                 image_metadata,
+                histogram=histogram.astype('<u4').tobytes(),
             )
 
 
             image_thumbnail_metadata = {
                 'type'       : constants.THUMBNAIL,
                 'origin'     : constants.IMAGE,
-                'createDate' : exp_date.timestamp(),
-                'utc_offset' : exp_date.astimezone().utcoffset().total_seconds(),
-                'night'      : bool(self.night_v.value),
+                'createDate' : i_ref['exp_date'].timestamp(),
+                'utc_offset' : i_ref['exp_date'].astimezone().utcoffset().total_seconds(),
+                'night'      : i_ref['night'],
                 'camera_uuid': camera.uuid,
             }
 
-            image_thumbnail_entry = self._miscDb.addThumbnailImageAuto(
-                image_entry,
-                image_metadata,
-                camera.id,
-                image_thumbnail_metadata,
-                numpy_data=self.image_processor.image,
-            )
+            if self.config.get('THUMBNAILS', {}).get('BACKGROUND') and self.config.get('THUMBNAILS', {}).get('IMAGES_AUTO', True):
+                # the uuid is assigned now so the image metadata references the thumbnail
+                thumbnail_uuid_str = str(uuid.uuid4())
+                image_thumbnail_metadata['uuid'] = thumbnail_uuid_str
+                image_metadata['thumbnail_uuid'] = thumbnail_uuid_str
+
+                self._getThumbnailWorker().add(
+                    image_entry,
+                    copy.copy(image_metadata),
+                    camera.id,
+                    copy.copy(image_thumbnail_metadata),
+                    c['image'],
+                )
+
+                # thumbnail is uploaded by the thumbnail worker
+                image_thumbnail_entry = None
+            else:
+                image_thumbnail_entry = self._miscDb.addThumbnailImageAuto(
+                    image_entry,
+                    image_metadata,
+                    camera.id,
+                    image_thumbnail_metadata,
+                    numpy_data=c['image'],
+                )
+
+
+            if self._accumulator:
+                # keogram and star trails are built from the image in memory
+                self._accumulator.add(
+                    image_entry,
+                    c['new_filename'],
+                    c['image'],
+                    camera,
+                    adu=c['adu'],
+                    star_count=len(i_ref['stars']),
+                )
         else:
             # images not being saved
             image_entry = None
@@ -692,20 +1059,20 @@ class ImageWorker(Process):
             image_thumbnail_metadata = {}
 
 
-        if latest_file:
+        if c['latest_file']:
             # build mqtt data
             mq_topic_latest = 'latest'
 
             mqtt_data = {
-                'exposure' : round(exposure, 6),
-                'gain'     : self.gain_v.value,
-                'bin'      : self.bin_v.value,
-                'temp'     : round(self.sensors_temp_av[0], 1),
-                'sunalt'   : round(self.astrometric_data['sun_alt'], 1),
-                'moonalt'  : round(self.astrometric_data['moon_alt'], 1),
-                'moonphase': round(self.astrometric_data['moon_phase'], 1),
-                'moonmode' : bool(self.moonmode_v.value),
-                'night'    : bool(self.night_v.value),
+                'exposure' : round(i_ref['exposure'], 6),
+                'gain'     : i_ref['gain'],
+                'bin'      : i_ref['binning'],
+                'temp'     : round(i_ref['ccd_temp'], 1),
+                'sunalt'   : round(i_ref['astrometric_data']['sun_alt'], 1),
+                'moonalt'  : round(i_ref['astrometric_data']['moon_alt'], 1),
+                'moonphase': round(i_ref['astrometric_data']['moon_phase'], 1),
+                'moonmode' : i_ref['moonmode'],
+                'night'    : i_ref['night'],
                 'sqm'      : round(i_ref['sqm_value'], 1),
                 'stars'    : len(i_ref['stars']),
                 'latitude' : round(self.position_av[0], 3),
@@ -714,7 +1081,7 @@ class ImageWorker(Process):
                 'kpindex'  : round(i_ref['kpindex'], 2),
                 'ovation_max'  : int(i_ref['ovation_max']),
                 'smoke_rating' : constants.SMOKE_RATING_MAP_STR[i_ref['smoke_rating']],
-                'sidereal_time': self.astrometric_data['sidereal_time'],
+                'sidereal_time': i_ref['astrometric_data']['sidereal_time'],
             }
 
 
@@ -810,10 +1177,10 @@ class ImageWorker(Process):
                 mqtt_data[sensor_topic] = round(val, 1)
 
 
-            if new_filename:
-                upload_filename = new_filename
+            if c['new_filename']:
+                upload_filename = c['new_filename']
             else:
-                upload_filename = latest_file
+                upload_filename = c['latest_file']
 
 
             ### upload thumbnail first
@@ -827,7 +1194,13 @@ class ImageWorker(Process):
             self._miscUpload.mqtt_publish_image(upload_filename, mq_topic_latest, mqtt_data)
             self._miscUpload.upload_image(image_entry)
 
-            self.upload_metadata(i_ref, adu, adu_average)
+            self.upload_metadata(i_ref, c['adu'], c['adu_average'])
+
+
+        persist_elapsed_s = time.time() - persist_start
+        self.pipeline_av[3] = persist_elapsed_s
+
+        self._leaveStage('commit', c['seq'], c['stage_done_list'])
 
 
     def decdeg2dms(self, dd):
@@ -862,13 +1235,13 @@ class ImageWorker(Process):
         metadata = {
             'type'                : constants.METADATA,
             'device'              : i_ref['camera_name'],
-            'night'               : self.night_v.value,
-            'temp'                : self.sensors_temp_av[0],
-            'gain'                : self.gain_v.value,
+            'night'               : int(i_ref['night']),
+            'temp'                : i_ref['ccd_temp'],
+            'gain'                : i_ref['gain'],
             'exposure'            : i_ref['exposure'],
-            'stable_exposure'     : int(self.target_adu_found),
+            'stable_exposure'     : int(i_ref['target_adu_found']),
             'target_adu'          : i_ref['target_adu'],
-            'current_adu_target'  : self.current_adu_target,
+            'current_adu_target'  : i_ref['current_adu_target'],
             'current_adu'         : adu,
             'adu_average'         : adu_average,
             'sqm'                 : i_ref['sqm_value'],
@@ -881,7 +1254,7 @@ class ImageWorker(Process):
             'latitude'            : self.position_av[0],
             'longitude'           : self.position_av[1],
             'elevation'           : int(self.position_av[2]),
-            'sidereal_time'       : self.astrometric_data['sidereal_time'],
+            'sidereal_time'       : i_ref['astrometric_data']['sidereal_time'],
             'kpindex'             : i_ref['kpindex'],
             'ovation_max'         : i_ref['ovation_max'],
             'smoke_rating'        : constants.SMOKE_RATING_MAP_STR[i_ref['smoke_rating']],
@@ -1318,14 +1691,14 @@ class ImageWorker(Process):
 
 
         ### Do not write daytime image files if daytime timelapse is disabled
-        if not self.night_v.value and not self.config['DAYTIME_TIMELAPSE']:
+        if not i_ref['night'] and not self.config['DAYTIME_TIMELAPSE']:
             logger.info('Daytime timelapse is disabled')
             tmpfile_name.unlink()
             return latest_file, None
 
 
         ### Write the timelapse file
-        folder = self._getImageFolder(i_ref['exp_date'], camera, 'exposures')
+        folder = self._getImageFolder(i_ref['exp_date'], camera, 'exposures', night=i_ref['night'])
 
         date_str = i_ref['exp_date'].strftime('%Y%m%d_%H%M%S')
         filename = folder.joinpath(self.filename_t.format(i_ref['camera_id'], date_str, self.config['IMAGE_FILE_TYPE']))
@@ -1357,13 +1730,13 @@ class ImageWorker(Process):
             'name'                : 'indi_json',
             'class'               : 'ccd',
             'device'              : i_ref['camera_name'],
-            'night'               : self.night_v.value,
-            'temp'                : self.sensors_temp_av[0],
-            'gain'                : self.gain_v.value,
+            'night'               : int(i_ref['night']),
+            'temp'                : i_ref['ccd_temp'],
+            'gain'                : i_ref['gain'],
             'exposure'            : i_ref['exposure'],
-            'stable_exposure'     : int(self.target_adu_found),
+            'stable_exposure'     : int(i_ref['target_adu_found']),
             'target_adu'          : i_ref['target_adu'],
-            'current_adu_target'  : self.current_adu_target,
+            'current_adu_target'  : i_ref['current_adu_target'],
             'current_adu'         : adu,
             'adu_average'         : adu_average,
             'sqm'                 : i_ref['sqm_value'],
@@ -1385,8 +1758,12 @@ class ImageWorker(Process):
         indi_allsky_status_p.chmod(0o644)
 
 
-    def _getImageFolder(self, exp_date, camera, type_folder):
-        if self.night_v.value:
+    def _getImageFolder(self, exp_date, camera, type_folder, night=None):
+        if isinstance(night, type(None)):
+            night = bool(self.night_v.value)
+
+
+        if night:
             # images should be written to previous day's folder until noon
             day_ref = exp_date - timedelta(hours=12)
             timeofday_str = 'night'
@@ -0,0 +1,84 @@
+import traceback
+import logging
+
+from threading import Thread
+import queue
+
+from .flask import create_app
+
+
+app = create_app()
+
+logger = logging.getLogger('indi_allsky')
+
+
+
+class ImagePipelineStage(Thread):
+
+    ### One stage of the image worker pipeline
+    # the queue is bounded so a slow stage blocks the stage before it
+
+    def __init__(
+        self,
+        idx,
+        name,
+        stage_func,
+        error_func,
+        next_stage=None,
+        maxsize=2,
+    ):
+        super(ImagePipelineStage, self).__init__()
+
+        self.name = '{0:s}-{1:d}'.format(name, idx)
+
+        self.stage_func = stage_func
+        self.error_func = error_func
+        self.next_stage = next_stage
+
+        self.stage_q = queue.Queue(maxsize=maxsize)
+
+
+    @property
+    def depth(self):
+        return self.stage_q.qsize()
+
+    @depth.setter
+    def depth(self, *args):
+        pass  # read only
+
+
+    def put(self, job):
+        self.stage_q.put(job)
+
+
+    def stop(self):
+        self.stage_q.put({'stop': True})
+
+
+    def run(self):
+        while True:
+            job = self.stage_q.get()
+
+            if job.get('stop'):
+                if self.next_stage:
+                    self.next_stage.stop()
+
+                logger.warning('Goodbye')
+                return
+
+
+            try:
+                with app.app_context():
+                    self.stage_func(job)
+            except Exception as e:
+                # an image failure should not stop the pipeline
+                tb = traceback.format_exc()
+                for line in tb.split('\n'):
+                    logger.error('%s exception: %s', self.name, line)
+
+                self.error_func(job, e)
+                continue
+
+
+            if self.next_stage:
+                self.next_stage.put(job)
@@ -0,0 +1,104 @@
+import time
+from multiprocessing import Array
+from multiprocessing import Condition
+from multiprocessing import Lock
+from multiprocessing import Value
+import logging
+
+from .stackHistory import IndiAllskyStackHistory
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyImageSequencer(object):
+
+    ### Orders the serial parts of image processing when there are multiple image workers
+    # frames are numbered when they are taken from the image queue, each stage is entered in frame order
+
+    stage_list = ('stack', 'exposure', 'write', 'commit')
+
+    hist_adu_max = 32
+
+
+    def __init__(self, timeout=120):
+        self.timeout = timeout
+
+        self._get_lock = Lock()
+        self._condition = Condition()
+
+        self._next_seq_v = Value('L', 0, lock=False)  # protected by _get_lock
+
+        self._stage_dict = dict()
+        for stage in self.stage_list:
+            self._stage_dict[stage] = Value('L', 0, lock=False)  # protected by _condition
+
+
+        # exposure state shared between workers, only accessed inside the stages
+        self.target_adu_found_v = Value('i', 0, lock=False)
+        self.current_adu_target_v = Value('f', 0.0, lock=False)
+        self.hist_adu_av = Array('f', [0.0 for x in range(self.hist_adu_max)], lock=False)
+        self.hist_adu_len_v = Value('i', 0, lock=False)
+        self.generate_mask_base_v = Value('i', 1, lock=False)
+        self.metadata_count_v = Value('L', 0, lock=False)
+
+        # stacking history and keogram/star trail progress shared between workers
+        self.stack_history = IndiAllskyStackHistory()
+        self.accum_count_v = Value('L', 0, lock=False)
+
+        # set by the main process before the workers are started
+        self.worker_count_v = Value('i', 1, lock=False)
+
+
+    def get(self, image_q, timeout=None):
+        # the queue read and the numbering must be atomic so the numbers follow the queue order
+        with self._get_lock:
+            # exceptions are handled by the caller
+            i_dict = image_q.get(timeout=timeout)
+
+            if i_dict.get('stop'):
+                return i_dict, None
+
+            seq = self._next_seq_v.value
+            self._next_seq_v.value += 1
+
+
+        return i_dict, seq
+
+
+    def wait(self, stage, seq):
+        stage_v = self._stage_dict[stage]
+
+        wait_start = time.time()
+
+        with self._condition:
+            ready = self._condition.wait_for(lambda: stage_v.value >= seq, timeout=self.timeout)
+
+        wait_elapsed_s = time.time() - wait_start
+
+
+        if not ready:
+            # a worker may have been terminated while holding an earlier frame
+            logger.error('Timeout waiting for frame %d in %s stage, skipping ahead', seq, stage)
+        elif wait_elapsed_s > 0.1:
+            logger.info('Frame %d waited %0.4f s for %s stage', seq, wait_elapsed_s, stage)
+
+
+    def done(self, stage, seq):
+        stage_v = self._stage_dict[stage]
+
+        with self._condition:
+            if stage_v.value <= seq:
+                stage_v.value = seq + 1
+
+            self._condition.notify_all()
+
+
+    def finish(self, seq, stage_done_list):
+        # advance stages that were not reached, otherwise later frames would wait on this frame
+        for stage in self.stage_list:
+            if stage in stage_done_list:
+                continue
+
+            self.wait(stage, seq)
+            self.done(stage, seq)
@@ -1,12 +1,14 @@
+import io
+import json
 import cv2
 import numpy
 #import PIL
 from PIL import Image
-from PIL import ImageFont
-from PIL import ImageDraw
 import piexif
 import math
 import time
+import resource
+import tempfile
 #import copy
 from datetime import datetime
 from datetime import timezone
@@ -14,6 +16,8 @@ from pathlib import Path
 import logging
 from pprint import pformat
 
+from .textRenderer import IndiAllskyTextRenderer
+
 
 logger = logging.getLogger('indi_allsky')
 
@@ -24,6 +28,9 @@ class KeogramGenerator(object):
     line_thickness = 2
     line_length = 35
 
+    # columns added when the buffer is full
+    buffer_chunk = 500
+
 
     def __init__(self, config):
         self.config = config
@@ -41,7 +48,12 @@ class KeogramGenerator(object):
         self.rotated_width = None
         self.rotated_height = None
 
-        self.keogram_data = None
+        # keogram columns are written in place into a preallocated buffer
+        self._keogram_buffer = None
+        self._keogram_columns = 0
+        self._keogram_peak_bytes = 0
+        self._expected_frames = 0
+
         self.keogram_final = None  # will contain final resized keogram
 
         self.timestamps_list = list()
@@ -50,6 +62,14 @@ class KeogramGenerator(object):
         base_path  = Path(__file__).parent
         self.font_path  = base_path.joinpath('fonts')
 
+        self._text_renderer = IndiAllskyTextRenderer()
+
+
+        # disk backed buffer for very long nights
+        self._memmap = bool(self.config.get('KEOGRAM_MEMMAP', False))
+        self._memmap_tmpdir = None
+        self._memmap_count = 0
+
 
     @property
     def angle(self):
@@ -96,6 +116,27 @@ class KeogramGenerator(object):
         self._crop_bottom = int(new_crop)
 
 
+    @property
+    def expected_frames(self):
+        return self._expected_frames
+
+    @expected_frames.setter
+    def expected_frames(self, new_frames):
+        self._expected_frames = int(new_frames)
+
+
+    @property
+    def keogram_data(self):
+        if isinstance(self._keogram_buffer, type(None)):
+            return None
+
+        return self._keogram_buffer[:, :self._keogram_columns]
+
+    @keogram_data.setter
+    def keogram_data(self, *args):
+        pass  # read only
+
+
     @property
     def shape(self):
         return self.keogram_final.shape
@@ -165,7 +206,7 @@ class KeogramGenerator(object):
             new_dtype = rotated_center_line.dtype
             logger.info('New dtype: %s', new_dtype)
 
-            self.keogram_data = numpy.empty(new_shape, dtype=new_dtype)
+            self._allocateBuffer(new_shape, new_dtype, max(self.expected_frames, self.buffer_chunk))
 
 
         if height != self.original_height or width != self.original_width:
@@ -174,15 +215,135 @@ class KeogramGenerator(object):
             return
 
 
-        self.keogram_data = numpy.append(self.keogram_data, rotated_center_line, 1)
+        if self._keogram_columns >= self._keogram_buffer.shape[1]:
+            # more images than expected
+            self._growBuffer(self.buffer_chunk)
+
+
+        self._keogram_buffer[:, self._keogram_columns] = rotated_center_line[:, 0]
+        self._keogram_columns += 1
 
         self.image_processing_elapsed_s += time.time() - image_processing_start
 
 
+    def _allocateBuffer(self, column_shape, dtype, columns):
+        buffer_shape = (column_shape[0], columns) + tuple(column_shape[2:])
+
+        if self._memmap:
+            if isinstance(self._memmap_tmpdir, type(None)):
+                if self.config.get('IMAGE_FOLDER'):
+                    image_dir = Path(self.config['IMAGE_FOLDER']).absolute()
+                else:
+                    image_dir = Path(__file__).parent.parent.joinpath('html', 'images').absolute()
+
+                self._memmap_tmpdir = tempfile.TemporaryDirectory(dir=image_dir, suffix='_keogram')    # context manager automatically deletes files when finished
+
+
+            self._memmap_count += 1
+            memmap_p = Path(self._memmap_tmpdir.name).joinpath('keogram_{0:d}.npy'.format(self._memmap_count))
+
+            logger.info('Allocating memory mapped keogram buffer: %s', memmap_p)
+            new_buffer = numpy.lib.format.open_memmap(str(memmap_p), mode='w+', dtype=dtype, shape=buffer_shape)
+        else:
+            new_buffer = numpy.zeros(buffer_shape, dtype=dtype)
+
+
+        if not isinstance(self._keogram_buffer, type(None)):
+            # both buffers exist during the copy
+            self._keogram_peak_bytes = max(self._keogram_peak_bytes, self._keogram_buffer.nbytes + new_buffer.nbytes)
+
+            new_buffer[:, :self._keogram_columns] = self._keogram_buffer[:, :self._keogram_columns]
+
+            old_filename = getattr(self._keogram_buffer, 'filename', None)
+            self._keogram_buffer = None
+
+            if old_filename:
+                # remove previous memory mapped buffer
+                Path(old_filename).unlink()
+
+
+        self._keogram_buffer = new_buffer
+
+        logger.info('Keogram buffer: %d columns, %0.1f MB', columns, new_buffer.nbytes / 1024 / 1024)
+        self._keogram_peak_bytes = max(self._keogram_peak_bytes, new_buffer.nbytes)
+
+
+    def _growBuffer(self, columns):
+        logger.warning('Growing keogram buffer by %d columns', columns)
+
+        column_shape = (self._keogram_buffer.shape[0], 1) + tuple(self._keogram_buffer.shape[2:])
+        self._allocateBuffer(column_shape, self._keogram_buffer.dtype, self._keogram_buffer.shape[1] + columns)
+
+
+    def checkpoint(self, checkpoint_p):
+        if isinstance(self._keogram_buffer, type(None)):
+            # no images processed
+            return
+
+
+        numpy.save(str(checkpoint_p.joinpath('keogram.npy')), self.keogram_data)
+
+        keogram_state = {
+            'original_height' : self.original_height,
+            'original_width'  : self.original_width,
+            'rotated_height'  : self.rotated_height,
+            'rotated_width'   : self.rotated_width,
+            'timestamps_list' : self.timestamps_list,
+            'image_processing_elapsed_s' : self.image_processing_elapsed_s,
+        }
+
+        with io.open(str(checkpoint_p.joinpath('keogram.json')), 'w') as f_state:
+            json.dump(keogram_state, f_state)
+
+
+    def restore(self, checkpoint_p):
+        keogram_npy_p = checkpoint_p.joinpath('keogram.npy')
+        keogram_json_p = checkpoint_p.joinpath('keogram.json')
+
+        if not keogram_npy_p.exists() or not keogram_json_p.exists():
+            return
+
+
+        with io.open(str(keogram_json_p), 'r') as f_state:
+            keogram_state = json.load(f_state)
+
+
+        self.original_height = keogram_state['original_height']
+        self.original_width = keogram_state['original_width']
+        self.rotated_height = keogram_state['rotated_height']
+        self.rotated_width = keogram_state['rotated_width']
+        self.timestamps_list = keogram_state['timestamps_list']
+        self.image_processing_elapsed_s = keogram_state['image_processing_elapsed_s']
+
+
+        # buffer will grow when the next column is added
+        self._keogram_buffer = numpy.load(str(keogram_npy_p))
+        self._keogram_columns = self._keogram_buffer.shape[1]
+        self._keogram_peak_bytes = max(self._keogram_peak_bytes, self._keogram_buffer.nbytes)
+
+        logger.info('Restored keogram with %d columns', self._keogram_columns)
+
+
+    def cleanup(self):
+        self._keogram_buffer = None
+
+        if self._memmap_tmpdir:
+            self._memmap_tmpdir.cleanup()
+            self._memmap_tmpdir = None
+
+
     def finalize(self, outfile, camera):
         outfile_p = Path(outfile)
 
-        logger.info('Images processed for keogram in %0.1f s', self.image_processing_elapsed_s)
+        # ru_maxrss is reported in KB on linux
+        peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        logger.info(
+            'Images processed for keogram in %0.1f s, peak buffer %0.1f MB (%s), peak RSS %0.1f MB',
+            self.image_processing_elapsed_s,
+            self._keogram_peak_bytes / 1024 / 1024,
+            'memmap' if self._memmap else 'memory',
+            peak_rss_mb,
+        )
 
         # trim off the top and bottom bars
         keogram_trimmed = self.trimEdges(self.keogram_data)
@@ -481,8 +642,7 @@ class KeogramGenerator(object):
 
 
     def applyLabels_pillow(self, keogram):
-        img_rgb = Image.fromarray(cv2.cvtColor(keogram, cv2.COLOR_BGR2RGB))
-        width, height  = img_rgb.size  # backwards from opencv
+        height, width = keogram.shape[:2]
 
 
         if self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'] == 'custom':
@@ -493,10 +653,9 @@ class KeogramGenerator(object):
 
         pillow_font_size = self.config['TEXT_PROPERTIES']['PIL_FONT_SIZE']
 
-        font = ImageFont.truetype(str(pillow_font_file_p), pillow_font_size)
-        draw = ImageDraw.Draw(img_rgb)
-
         color_rgb = list(self.config['TEXT_PROPERTIES']['FONT_COLOR'])  # RGB for pillow
+        color_bgr = color_rgb.copy()
+        color_bgr.reverse()
 
 
         # starting point
@@ -527,28 +686,33 @@ class KeogramGenerator(object):
 
 
             if self.config['TEXT_PROPERTIES']['FONT_OUTLINE']:
-                draw.line(
-                    ((line_start[0] - 2), (line_start[1] - 2), line_end),
-                    fill=(0, 0, 0),
-                    width=self.line_thickness + 5,  # +4
+                cv2.line(
+                    img=keogram,
+                    pt1=(line_start[0] - 2, line_start[1] - 2),
+                    pt2=line_end,
+                    color=(0, 0, 0),
+                    thickness=self.line_thickness + 5,  # +4
                 )
-            draw.line(
-                (line_start, line_end),
-                fill=tuple(color_rgb),
-                width=self.line_thickness + 1,
+            cv2.line(
+                img=keogram,
+                pt1=line_start,
+                pt2=line_end,
+                color=tuple(color_bgr),
+                thickness=self.line_thickness + 1,
             )
 
 
-            draw.text(
-                (line_x + 5, height - (pillow_font_size + 3)),
+            # keogram is modified in place, the hour labels are cached
+            self._text_renderer.drawText(
+                keogram,
                 hour_str,
-                fill=tuple(color_rgb),
-                font=font,
+                pillow_font_file_p,
+                pillow_font_size,
+                (line_x + 5, height - (pillow_font_size + 3)),
+                color_rgb,
                 stroke_width=stroke_width,
-                stroke_fill=(0, 0, 0),
                 anchor='la',  # left-ascender
             )
 
 
-        # convert back to numpy array
-        return cv2.cvtColor(numpy.array(img_rgb), cv2.COLOR_RGB2BGR)
+        return keogram
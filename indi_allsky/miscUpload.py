@@ -19,10 +19,12 @@ class miscUpload(object):
         self,
         config,
         upload_q,
+        mqtt_q=None,
     ):
 
         self.config = config
         self.upload_q = upload_q
+        self.mqtt_q = mqtt_q
 
 
     def upload_image(self, image_entry):
@@ -447,6 +449,17 @@ class miscUpload(object):
             #logger.warning('MQ publishing disabled')
             return
 
+        if self.mqtt_q:
+            # the publisher keeps a connection open and only publishes changes
+            self.mqtt_q.put({
+                'local_file'  : str(upload_filename),
+                'image_topic' : image_topic,
+                'metadata'    : mq_data,
+            })
+
+            return
+
+
         # publish data to mq broker
         jobdata = {
             'action'      : constants.TRANSFER_MQTT,
@@ -0,0 +1,306 @@
+import time
+import io
+import ssl
+import socket
+from pathlib import Path
+from threading import Thread
+import queue
+import threading
+import traceback
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class MqttPublisher(Thread):
+
+    ### Single long lived MQTT connection for the image metadata and latest image
+    # only values that changed beyond the deadband are published, all values are retained by the broker
+
+    backoff_min = 5
+    backoff_max = 300
+
+
+    def __init__(
+        self,
+        idx,
+        config,
+        error_q,
+        mqtt_q,
+    ):
+        super(MqttPublisher, self).__init__()
+
+        self.name = 'Mqtt-{0:d}'.format(idx)
+
+        self.config = config
+
+        self.error_q = error_q
+        self.mqtt_q = mqtt_q
+
+        self._client = None
+        self._connected = False
+
+        self._backoff = self.backoff_min
+        self._next_connect_time = 0
+
+
+        # latest values waiting to be published
+        self._pending_data = dict()
+        self._pending_images = dict()  # topic: local file
+
+        # last values received by the broker
+        self._published_data = dict()
+        self._image_publish_time = dict()
+
+
+        self._stopper = threading.Event()
+
+
+    def stop(self):
+        self._stopper.set()
+
+
+    def stopped(self):
+        return self._stopper.is_set()
+
+
+    def run(self):
+        ### use this as a method to log uncaught exceptions
+        try:
+            self.saferun()
+        except Exception as e:
+            tb = traceback.format_exc()
+            self.error_q.put((str(e), tb))
+            raise e
+
+
+    def saferun(self):
+        while True:
+            if self.stopped():
+                self._disconnect()
+                logger.warning('Goodbye')
+                return
+
+
+            if not self._client and time.time() >= self._next_connect_time:
+                self._connect()
+
+
+            try:
+                m_dict = self.mqtt_q.get(timeout=1.0)
+            except queue.Empty:
+                m_dict = None
+
+
+            # only the latest values matter when there is a backlog
+            while m_dict:
+                self._queueMessage(m_dict)
+
+                try:
+                    m_dict = self.mqtt_q.get_nowait()
+                except queue.Empty:
+                    break
+
+
+            if not self._client:
+                continue
+
+
+            if self._connected:
+                self._publishPending()
+
+
+            # network traffic, keepalive and connection state
+            rc = self._client.loop(timeout=0.1)
+            while rc == 0 and self._client.want_write():
+                # finish sending large payloads
+                rc = self._client.loop(timeout=1.0)
+
+
+            if rc != 0:
+                logger.error('MQTT connection lost: %s', self._errorString(rc))
+                self._reconnectLater()
+
+
+    def _queueMessage(self, m_dict):
+        for k, v in m_dict['metadata'].items():
+            self._pending_data[k] = v
+
+
+        if m_dict.get('image_topic') and m_dict.get('local_file'):
+            if self.config['MQTTPUBLISH'].get('PUBLISH_IMAGE', True):
+                self._pending_images[m_dict['image_topic']] = m_dict['local_file']
+
+
+    def _publishPending(self):
+        base_topic = self.config['MQTTPUBLISH']['BASE_TOPIC']
+        qos = self.config['MQTTPUBLISH']['QOS']
+
+        publish_start = time.time()
+
+
+        publish_count = 0
+        for k, v in self._pending_data.items():
+            if not self._changed(k, v):
+                continue
+
+            self._client.publish('/'.join((base_topic, k)), payload=v, qos=qos, retain=True)
+            self._published_data[k] = v
+            publish_count += 1
+
+        self._pending_data.clear()
+
+
+        image_period = self.config['MQTTPUBLISH'].get('IMAGE_PERIOD', 0)
+
+        now = time.time()
+        for image_topic in list(self._pending_images.keys()):
+            if now - self._image_publish_time.get(image_topic, 0) < image_period:
+                # keep the latest image until the period has elapsed
+                continue
+
+            local_file_p = Path(self._pending_images.pop(image_topic))
+
+            try:
+                with io.open(local_file_p, 'rb') as f_localfile:
+                    payload = f_localfile.read()
+            except FileNotFoundError:
+                logger.error('Image not found for MQTT: %s', local_file_p)
+                continue
+
+            self._client.publish('/'.join((base_topic, image_topic)), payload=payload, qos=qos, retain=True)
+            self._image_publish_time[image_topic] = now
+            publish_count += 1
+
+
+        if publish_count:
+            publish_elapsed_s = time.time() - publish_start
+            logger.info('Published %d MQTT topics in %0.4f s', publish_count, publish_elapsed_s)
+
+
+    def _changed(self, topic, value):
+        try:
+            last_value = self._published_data[topic]
+        except KeyError:
+            return True
+
+
+        if isinstance(value, bool) or isinstance(last_value, bool):
+            return value != last_value
+
+        if isinstance(value, (int, float)) and isinstance(last_value, (int, float)):
+            deadband = float(self.config['MQTTPUBLISH'].get('DEADBAND', 0.0))
+
+            if deadband:
+                return abs(value - last_value) > deadband
+
+
+        return value != last_value
+
+
+    def _connect(self):
+        import paho.mqtt.client as mqtt
+
+        mq_config = self.config['MQTTPUBLISH']
+
+        client = mqtt.Client(
+            mqtt.CallbackAPIVersion.VERSION2,
+            client_id='',
+            transport=mq_config['TRANSPORT'],
+        )
+
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+
+
+        if mq_config['USERNAME']:
+            client.username_pw_set(mq_config['USERNAME'], password=mq_config['PASSWORD'] if mq_config['PASSWORD'] else None)
+
+
+        if mq_config['TLS']:
+            if mq_config.get('CERT_BYPASS', True):
+                client.tls_set(ca_certs='/etc/ssl/certs/ca-certificates.crt', cert_reqs=ssl.CERT_NONE)
+                client.tls_insecure_set(True)
+            else:
+                client.tls_set(ca_certs='/etc/ssl/certs/ca-certificates.crt', cert_reqs=ssl.CERT_REQUIRED)
+
+
+        if mq_config['PORT']:
+            port = mq_config['PORT']
+        else:
+            port = 1883
+
+
+        logger.info('Connecting to MQTT broker %s:%d', mq_config['HOST'], port)
+
+        try:
+            client.connect(mq_config['HOST'], port=port, keepalive=60)
+        except socket.gaierror as e:
+            logger.error('MQTT connection failure: %s', str(e))
+            self._reconnectLater()
+            return
+        except socket.timeout as e:
+            logger.error('MQTT connection failure: %s', str(e))
+            self._reconnectLater()
+            return
+        except ssl.SSLError as e:
+            logger.error('MQTT connection failure: %s', str(e))
+            self._reconnectLater()
+            return
+        except OSError as e:
+            # ConnectionRefusedError, etc
+            logger.error('MQTT connection failure: %s', str(e))
+            self._reconnectLater()
+            return
+
+
+        # the connection is ready when the broker responds
+        self._client = client
+
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logger.error('MQTT broker refused connection: %s', str(reason_code))
+            return
+
+
+        logger.info('Connected to MQTT broker')
+        self._connected = True
+        self._backoff = self.backoff_min
+
+        # the broker may have lost the retained values
+        self._published_data.clear()
+        self._image_publish_time.clear()
+
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties):
+        self._connected = False
+
+
+    def _reconnectLater(self):
+        self._disconnect()
+
+        logger.warning('Reconnecting to MQTT broker in %d s', self._backoff)
+        self._next_connect_time = time.time() + self._backoff
+
+        self._backoff = min(self._backoff * 2, self.backoff_max)
+
+
+    def _disconnect(self):
+        if not self._client:
+            return
+
+        try:
+            self._client.disconnect()
+        except OSError:
+            pass
+
+        self._client = None
+        self._connected = False
+
+
+    def _errorString(self, rc):
+        import paho.mqtt.client as mqtt
+
+        return mqtt.error_string(rc)
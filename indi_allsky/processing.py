@@ -7,12 +7,11 @@ from datetime import timezone
 import math
 import time
 import signal
+from multiprocessing import Value
 import numpy
 import cv2
 import PIL
 from PIL import Image
-from PIL import ImageFont
-from PIL import ImageDraw
 from fractions import Fraction
 import logging
 
@@ -27,12 +26,19 @@ from .stars import IndiAllSkyStars
 from .detectLines import IndiAllskyDetectLines
 from .draw import IndiAllSkyDraw
 from .scnr import IndiAllskyScnr
+from .colorTransform import IndiAllskyColorTransform
+from .composite import IndiAllskyComposite
+from .textRenderer import IndiAllskyTextRenderer
 from .stack import IndiAllskyStacker
+from .stack import IndiAllskyRollingStack
 from .cardinalDirsLabel import IndiAllskyCardinalDirsLabel
+from .calibrationCache import IndiAllskyCalibrationCache
+from .ephemerisCache import IndiAllskyEphemerisCache
+from .fish2panoMap import IndiAllskyFish2PanoMap
+from .maskProcessing import MaskProcessor
 
 from .flask.models import IndiAllSkyDbBadPixelMapTable
 from .flask.models import IndiAllSkyDbDarkFrameTable
-from .flask.models import IndiAllSkyDbTleDataTable
 
 from sqlalchemy.sql.expression import true as sa_true
 
@@ -117,10 +123,10 @@ class ImageProcessor(object):
         self._detection_mask = self._load_detection_mask()
         self._adu_mask = self._detection_mask  # reuse detection mask for ADU mask (if defined)
 
-        self._image_circle_alpha_mask = None
+        self._histogram_mask = None
 
-        self._overlay = None
-        self._alpha_mask = None
+        # image circle mask and logo overlay
+        self._composite = IndiAllskyComposite()
 
         self.focus_mode = self.config.get('FOCUS_MODE', False)
 
@@ -149,7 +155,9 @@ class ImageProcessor(object):
         self._lineDetect = IndiAllskyDetectLines(self.config, self.bin_v, mask=self._detection_mask)
         self._draw = IndiAllSkyDraw(self.config, self.bin_v, mask=self._detection_mask)
         self._scnr = IndiAllskyScnr(self.config)
+        self._color_transform = IndiAllskyColorTransform(self.config)
         self._cardinal_dirs_label = IndiAllskyCardinalDirsLabel(self.config)
+        self._text_renderer = IndiAllskyTextRenderer()
 
         self._orb = IndiAllskyOrbGenerator(self.config)
         self._orb.sun_alt_deg = self.config['NIGHT_SUN_ALT_DEG']
@@ -158,11 +166,19 @@ class ImageProcessor(object):
         self._orb.sun_color_rgb = self.config['ORB_PROPERTIES']['SUN_COLOR']
         self._orb.moon_color_rgb = self.config['ORB_PROPERTIES']['MOON_COLOR']
 
+        self._calibration_cache = IndiAllskyCalibrationCache(self.config)
+
+        self._ephemeris_cache = IndiAllskyEphemerisCache(self.config)
+
+        self._fish2pano_map = IndiAllskyFish2PanoMap(self.config)
+
         self._stacker = IndiAllskyStacker(self.config, self.bin_v, mask=self._detection_mask)
         self._stacker.detection_sigma = self.config.get('IMAGE_ALIGN_DETECTSIGMA', 5)
         self._stacker.max_control_points = self.config.get('IMAGE_ALIGN_POINTS', 50)
         self._stacker.min_area = self.config.get('IMAGE_ALIGN_SOURCEMINAREA', 10)
 
+        self._rolling_stack = IndiAllskyRollingStack(self.stack_method)
+
         base_path  = Path(__file__).parent
         self.font_path  = base_path.joinpath('fonts')
 
@@ -195,6 +211,15 @@ class ImageProcessor(object):
         pass  # read only
 
 
+    @property
+    def detection_mask(self):
+        return self._detection_mask
+
+    @detection_mask.setter
+    def detection_mask(self, *args):
+        pass  # read only
+
+
     @property
     def max_bit_depth(self):
         return self._max_bit_depth
@@ -296,10 +321,14 @@ class ImageProcessor(object):
         self._text_font_height = int(new_height)
 
 
-    def add(self, filename, exposure, exp_date, exp_elapsed, camera):
+    def add(self, filename, exposure, exp_date, exp_elapsed, camera, frame=None):
         from astropy.io import fits
 
-        filename_p = Path(filename)
+        if frame:
+            # frame was passed in shared memory, there is no file
+            filename_p = None
+        else:
+            filename_p = Path(filename)
 
 
         # clear old data as soon as possible
@@ -317,7 +346,24 @@ class ImageProcessor(object):
 
 
         ### Open file
-        if filename_p.suffix in ['.fit']:
+        if frame:
+            try:
+                header = fits.Header.fromstring(frame['header'])
+            except ValueError as e:
+                raise BadImage(str(e)) from e
+
+            hdu = fits.PrimaryHDU(frame['data'], header=header)
+            hdulist = fits.HDUList([hdu])
+
+            image_bitpix = hdulist[0].header['BITPIX']
+            image_bayerpat = hdulist[0].header.get('BAYERPAT')
+
+            # older versions of indi (<= 2.0.6) do not allow focal lengths lower than 10mm
+            # so we are just going to set this manually
+            aperture = camera.lensFocalLength / camera.lensFocalRatio
+            hdulist[0].header['FOCALLEN'] = round(camera.lensFocalLength, 2)
+            hdulist[0].header['APTDIA'] = round(aperture, 2)
+        elif filename_p.suffix in ['.fit']:
             try:
                 hdulist = fits.open(filename_p)
             except OSError as e:
@@ -682,8 +728,6 @@ class ImageProcessor(object):
 
 
     def _apply_calibration(self, data, exposure, camera_id, image_bitpix):
-        from astropy.io import fits
-
         # pick a bad pixel map that is closest to the exposure and temperature
         logger.info('Searching for bad pixel map: gain %d, exposure >= %0.1f, temp >= %0.1fc', self.gain_v.value, exposure, self.sensors_temp_av[0])
         bpm_entry = IndiAllSkyDbBadPixelMapTable.query\
@@ -784,6 +828,40 @@ class ImageProcessor(object):
                 raise CalibrationNotFound('Dark not found')
 
 
+        if bpm_entry:
+            bpm_id = bpm_entry.id
+            bpm_filename = bpm_entry.filename
+        else:
+            bpm_id = None
+            bpm_filename = None
+
+
+        # the merged master dark only changes when the matched frames change
+        cache_key = (camera_id, image_bitpix, self.gain_v.value, self.bin_v.value, dark_frame_entry.id, bpm_id)
+        cache_filenames = (dark_frame_entry.filename, bpm_filename)
+
+        master_dark = self._calibration_cache.get(cache_key, cache_filenames)
+
+        if isinstance(master_dark, type(None)):
+            master_dark = self._load_master_dark(dark_frame_entry, bpm_entry)
+            master_dark = self._calibration_cache.put(cache_key, master_dark, cache_filenames)
+        else:
+            logger.info('Matched dark (cached): %s', dark_frame_entry.filename)
+
+
+        if master_dark.shape != data.shape:
+            logger.error('Dark frame calibration dimensions mismatch')
+            raise CalibrationNotFound('Dark frame calibration dimension mismatch')
+
+
+        data_calibrated = cv2.subtract(data, master_dark)
+
+        return data_calibrated
+
+
+    def _load_master_dark(self, dark_frame_entry, bpm_entry):
+        from astropy.io import fits
+
         if bpm_entry:
             p_bpm = Path(bpm_entry.getFilesystemPath())
             if p_bpm.exists():
@@ -816,14 +894,7 @@ class ImageProcessor(object):
             master_dark = dark
 
 
-        if master_dark.shape != data.shape:
-            logger.error('Dark frame calibration dimensions mismatch')
-            raise CalibrationNotFound('Dark frame calibration dimension mismatch')
-
-
-        data_calibrated = cv2.subtract(data, master_dark)
-
-        return data_calibrated
+        return master_dark
 
 
     def calculate_8bit_adu(self):
@@ -925,6 +996,8 @@ class ImageProcessor(object):
             raise Exception('Unknown bits per pixel')
 
 
+        rolling = False
+
         if self.config.get('IMAGE_STACK_ALIGN') and i_ref['exposure'] > self.registration_exposure_thresh:
             # only perform registration once the exposure exceeds 5 seconds
 
@@ -947,17 +1020,24 @@ class ImageProcessor(object):
             # stack unaligned images
             stack_data_list = [x['opencv_data'] for x in stack_i_ref_list]
 
+            # unaligned frames do not change, only the new frame and the evicted frame need to be stacked
+            rolling = self.stack_method in self._rolling_stack.method_list
+
 
         stack_start = time.time()
 
 
-        try:
-            stacker_method = getattr(self._stacker, self.stack_method)
-            self.image = stacker_method(stack_data_list, numpy_type)
-        except AttributeError:
-            logger.error('Unknown stacking method: %s', self.stack_method)
-            self.image = i_ref['opencv_data']
-            return
+        if rolling:
+            key_data_list = [(x['exp_date'], x['opencv_data']) for x in stack_i_ref_list]
+            self.image = self._rolling_stack.update(key_data_list, numpy_type, self.stack_count)
+        else:
+            try:
+                stacker_method = getattr(self._stacker, self.stack_method)
+                self.image = stacker_method(stack_data_list, numpy_type)
+            except AttributeError:
+                logger.error('Unknown stacking method: %s', self.stack_method)
+                self.image = i_ref['opencv_data']
+                return
 
 
         if self.config.get('IMAGE_STACK_SPLIT'):
@@ -1200,6 +1280,32 @@ class ImageProcessor(object):
             logger.error('Unknown SCNR algorithm: %s', algo)
 
 
+    def color_transform(self):
+        if self.focus_mode:
+            # disable processing in focus mode
+            return
+
+
+        if len(self.image.shape) == 2:
+            # mono
+            return
+
+
+        if not self.config.get('COLOR_TRANSFORM_FUSED', True):
+            # reference mode, each step is a separate pass
+            self.white_balance_manual_bgr()
+
+            if self.config.get('AUTO_WB'):
+                self.white_balance_auto_bgr()
+
+            self.saturation_adjust()
+
+            return
+
+
+        self.image = self._color_transform.apply(self.image)
+
+
     def white_balance_manual_bgr(self):
         if self.focus_mode:
             # disable processing in focus mode
@@ -1433,62 +1539,56 @@ class ImageProcessor(object):
         self.image = cv2.cvtColor(self.image, cv2.COLOR_GRAY2BGR)
 
 
-    def apply_image_circle_mask(self):
-        if not self.config.get('IMAGE_CIRCLE_MASK', {}).get('ENABLE'):
-            return
-
-        if isinstance(self._image_circle_alpha_mask, type(None)):
-            self._image_circle_alpha_mask = self._generate_image_circle_mask(self.image)
-
-
-        alpha_start = time.time()
+    def apply_composite(self):
+        ### image circle mask and logo overlay
+        circle_enable = self.config.get('IMAGE_CIRCLE_MASK', {}).get('ENABLE')
+        logo_overlay = self.config.get('LOGO_OVERLAY', '')
 
-        self.image = (self.image * self._image_circle_alpha_mask).astype(numpy.uint8)
+        if not circle_enable and not logo_overlay:
+            return
 
 
-        if self.config.get('IMAGE_CIRCLE_MASK', {}).get('OUTLINE'):
-            image_height, image_width = self.image.shape[:2]
+        if self._composite.shape != self.image.shape:
+            self._build_composite(circle_enable, logo_overlay)
 
-            center_x = int(image_width / 2) + self.config['IMAGE_CIRCLE_MASK']['OFFSET_X']
-            center_y = int(image_height / 2) - self.config['IMAGE_CIRCLE_MASK']['OFFSET_Y']  # minus
-            radius = int(self.config['IMAGE_CIRCLE_MASK']['DIAMETER'] / 2)
 
-            cv2.circle(
-                img=self.image,
-                center=(center_x, center_y),
-                radius=radius,
-                color=(64, 64, 64),
-                thickness=3,
-            )
+        composite_start = time.time()
 
+        self.image = self._composite.apply(self.image)
 
-        alpha_elapsed_s = time.time() - alpha_start
-        logger.info('Image circle mask in %0.4f s', alpha_elapsed_s)
+        composite_elapsed_s = time.time() - composite_start
+        logger.info('Image composite in %0.4f s', composite_elapsed_s)
 
 
-    def apply_logo_overlay(self):
-        logo_overlay = self.config.get('LOGO_OVERLAY', '')
-        if not logo_overlay:
-            return
+    def _build_composite(self, circle_enable, logo_overlay):
+        circle_mask = None
+        outline_mask = None
 
+        if circle_enable:
+            circle_mask = self._generate_image_circle_mask(self.image)
 
-        if isinstance(self._overlay, type(None)):
-            self._overlay, self._alpha_mask = self._load_logo_overlay(self.image)
+            if self.config['IMAGE_CIRCLE_MASK'].get('OUTLINE'):
+                outline_mask = self._generate_image_circle_outline(self.image)
 
-            if isinstance(self._overlay, bool):
-                return
 
-        elif isinstance(self._overlay, bool):
-            logger.error('Logo overlay failed to load')
-            return
+        overlay = None
+        overlay_alpha = None
 
+        if logo_overlay:
+            overlay, overlay_alpha = self._load_logo_overlay(self.image)
 
-        alpha_start = time.time()
+            if isinstance(overlay, (bool, type(None))):
+                logger.error('Logo overlay failed to load')
+                overlay = None
 
-        self.image = (self.image * (1 - self._alpha_mask) + self._overlay * self._alpha_mask).astype(numpy.uint8)
 
-        alpha_elapsed_s = time.time() - alpha_start
-        logger.info('Alpha transparency in %0.4f s', alpha_elapsed_s)
+        self._composite.build(
+            self.image.shape,
+            circle_mask=circle_mask,
+            outline_mask=outline_mask,
+            overlay=overlay,
+            overlay_alpha=overlay_alpha,
+        )
 
 
     #def equalizeHistogram(self, data):
@@ -1588,6 +1688,117 @@ class ImageProcessor(object):
         return numpy.maximum(masked_left, masked_right)
 
 
+    def calculate_histogram(self, image=None):
+        histogram_start = time.time()
+
+        if isinstance(image, type(None)):
+            image = self.image
+
+        image_height, image_width = image.shape[:2]
+
+        mask = self._getHistogramMask(image_height, image_width)
+
+
+        # one row of 256 counts per channel, BGR or gray
+        if len(image.shape) == 2:
+            # mono
+            channel_list = [0]
+        else:
+            # color
+            channel_list = [0, 1, 2]
+
+        histogram = numpy.zeros((len(channel_list), 256), dtype=numpy.uint32)
+        for i in channel_list:
+            h_numpy = cv2.calcHist([image], [i], mask, [256], [0, 256])
+            histogram[i] = h_numpy.flatten()
+
+
+        histogram_elapsed_s = time.time() - histogram_start
+        logger.info('Histogram calculated in %0.4f s', histogram_elapsed_s)
+
+        return histogram
+
+
+    def _getHistogramMask(self, image_height, image_width):
+        if not isinstance(self._histogram_mask, type(None)):
+            if self._histogram_mask.shape[:2] == (image_height, image_width):
+                return self._histogram_mask
+
+
+        mask = None
+
+        if not isinstance(self._detection_mask, type(None)):
+            bin_v = Value('i', 1)  # always assume bin 1
+            mask_processor = MaskProcessor(
+                self.config,
+                bin_v,
+            )
+
+
+            # masks need to be rotated, flipped, cropped for post-processed images
+            mask_processor.image = self._detection_mask
+
+
+            if self.config.get('IMAGE_ROTATE'):
+                mask_processor.rotate_90()
+
+
+            # rotation
+            if self.config.get('IMAGE_ROTATE_ANGLE'):
+                mask_processor.rotate_angle()
+
+
+            # verticle flip
+            if self.config.get('IMAGE_FLIP_V'):
+                mask_processor.flip_v()
+
+
+            # horizontal flip
+            if self.config.get('IMAGE_FLIP_H'):
+                mask_processor.flip_h()
+
+
+            # crop
+            if self.config.get('IMAGE_CROP_ROI'):
+                mask_processor.crop_image()
+
+
+            # scale
+            if self.config['IMAGE_SCALE'] and self.config['IMAGE_SCALE'] != 100:
+                mask_processor.scale_image()
+
+
+            if mask_processor.image.shape[:2] == (image_height, image_width):
+                # non-zero values are included
+                mask = numpy.where(mask_processor.image > 0, 255, 0).astype(numpy.uint8)
+            else:
+                logger.warning('Detection mask does not match image size, using SQM RoI for histogram')
+
+
+        if isinstance(mask, type(None)):
+            sqm_roi = self.config.get('SQM_ROI', [])
+
+            try:
+                x1 = sqm_roi[0]  # these values may be invalid due to binning
+                y1 = sqm_roi[1]
+                x2 = sqm_roi[2]
+                y2 = sqm_roi[3]
+            except IndexError:
+                sqm_fov_div = self.config.get('SQM_FOV_DIV', 4)
+                x1 = int((image_width / 2) - (image_width / sqm_fov_div))
+                y1 = int((image_height / 2) - (image_height / sqm_fov_div))
+                x2 = int((image_width / 2) + (image_width / sqm_fov_div))
+                y2 = int((image_height / 2) + (image_height / sqm_fov_div))
+
+            mask = numpy.zeros((image_height, image_width), dtype=numpy.uint8)
+            mask[y1:y2, x1:x2] = 255
+
+
+        self._histogram_mask = mask
+
+        return self._histogram_mask
+
+
     def get_astrometric_data(self):
         utcnow = datetime.now(tz=timezone.utc)  # ephem expects UTC dates
         #utcnow = datetime.now(tz=timezone.utc) - timedelta(hours=13)  # testing
@@ -1603,6 +1814,12 @@ class ImageProcessor(object):
         self.astrometric_data['sidereal_time'] = str(obs.sidereal_time())
 
 
+        astrometric_start = time.time()
+
+        self._ephemeris_cache.resetStats()
+        self._ephemeris_cache.checkPosition(obs)
+
+
         sun = ephem.Sun()
         sun.compute(obs)
         self.astrometric_data['sun_alt'] = math.degrees(sun.alt)
@@ -1620,9 +1837,11 @@ class ImageProcessor(object):
             self.astrometric_data['moon_up'] = 'No'
 
 
-        mercury = ephem.Mercury()
-        mercury.compute(obs)
-        mercury_alt = math.degrees(mercury.alt)
+        # planets are interpolated between samples
+        planet_data = self._ephemeris_cache.getPlanets(obs)
+
+
+        mercury_alt = planet_data['mercury_alt']
         self.astrometric_data['mercury_alt'] = mercury_alt
 
         if mercury_alt >= 0:
@@ -1631,11 +1850,9 @@ class ImageProcessor(object):
             self.astrometric_data['mercury_up'] = 'No'
 
 
-        venus = ephem.Venus()
-        venus.compute(obs)
-        venus_alt = math.degrees(venus.alt)
+        venus_alt = planet_data['venus_alt']
         self.astrometric_data['venus_alt'] = venus_alt
-        self.astrometric_data['venus_phase'] = venus.phase
+        self.astrometric_data['venus_phase'] = planet_data['venus_phase']
 
         if venus_alt >= 0:
             self.astrometric_data['venus_up'] = 'Yes'
@@ -1643,9 +1860,7 @@ class ImageProcessor(object):
             self.astrometric_data['venus_up'] = 'No'
 
 
-        mars = ephem.Mars()
-        mars.compute(obs)
-        mars_alt = math.degrees(mars.alt)
+        mars_alt = planet_data['mars_alt']
         self.astrometric_data['mars_alt'] = mars_alt
 
         if mars_alt >= 0:
@@ -1654,9 +1869,7 @@ class ImageProcessor(object):
             self.astrometric_data['mars_up'] = 'No'
 
 
-        jupiter = ephem.Jupiter()
-        jupiter.compute(obs)
-        jupiter_alt = math.degrees(jupiter.alt)
+        jupiter_alt = planet_data['jupiter_alt']
         self.astrometric_data['jupiter_alt'] = jupiter_alt
 
         if jupiter_alt >= 0:
@@ -1665,9 +1878,7 @@ class ImageProcessor(object):
             self.astrometric_data['jupiter_up'] = 'No'
 
 
-        saturn = ephem.Saturn()
-        saturn.compute(obs)
-        saturn_alt = math.degrees(saturn.alt)
+        saturn_alt = planet_data['saturn_alt']
         self.astrometric_data['saturn_alt'] = saturn_alt
 
         if saturn_alt >= 0:
@@ -1696,7 +1907,7 @@ class ImageProcessor(object):
                 self.astrometric_data['iss_up'] = 'No'
 
             try:
-                iss_next_pass = obs.next_pass(iss)
+                iss_next_pass = self._ephemeris_cache.nextPass('iss', iss, obs)
                 self.astrometric_data['iss_next_h'] = (iss_next_pass[0].datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
                 self.astrometric_data['iss_next_alt'] = math.degrees(iss_next_pass[3])
             except ValueError as e:
@@ -1718,7 +1929,7 @@ class ImageProcessor(object):
                 self.astrometric_data['hst_up'] = 'No'
 
             try:
-                hst_next_pass = obs.next_pass(hst)
+                hst_next_pass = self._ephemeris_cache.nextPass('hst', hst, obs)
                 self.astrometric_data['hst_next_h'] = (hst_next_pass[0].datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
                 self.astrometric_data['hst_next_alt'] = math.degrees(hst_next_pass[3])
             except ValueError as e:
@@ -1740,7 +1951,7 @@ class ImageProcessor(object):
                 self.astrometric_data['tiangong_up'] = 'No'
 
             try:
-                tiangong_next_pass = obs.next_pass(tiangong)
+                tiangong_next_pass = self._ephemeris_cache.nextPass('tiangong', tiangong, obs)
                 self.astrometric_data['tiangong_next_h'] = (tiangong_next_pass[0].datetime() - utcnow.replace(tzinfo=None)).total_seconds() / 3600
                 self.astrometric_data['tiangong_next_alt'] = math.degrees(tiangong_next_pass[3])
             except ValueError as e:
@@ -1749,33 +1960,19 @@ class ImageProcessor(object):
                 self.astrometric_data['tiangong_next_alt'] = 0.0
 
 
-    def populateSatelliteData(self):
-        satellite_data = dict()
-
-        for sat_key, sat_data in self.satellite_dict.items():
-            # there may be multiple satellites of the same name, usually pieces of the same rocket
-            sat_entry = IndiAllSkyDbTleDataTable.query\
-                .filter(IndiAllSkyDbTleDataTable.group == sat_data['group'])\
-                .filter(IndiAllSkyDbTleDataTable.title == sat_data['title'])\
-                .order_by(IndiAllSkyDbTleDataTable.id.desc())\
-                .first()
-
-
-            if not sat_entry:
-                logger.warning('Satellite data not found: %s', sat_data['title'])
-                continue
-
-            #logger.info('Found satellite data: %s', sat_name)
-
-            try:
-                sat = ephem.readtle(sat_entry.title, sat_entry.line1, sat_entry.line2)
-            except ValueError as e:
-                logger.error('Satellite TLE data error: %s', str(e))
-                continue
+        astrometric_elapsed_s = time.time() - astrometric_start
+        logger.info(
+            'Astrometric data in %0.4f s (ephemeris cache %d hits, %d misses, %0.4f s saved)',
+            astrometric_elapsed_s,
+            self._ephemeris_cache.hits,
+            self._ephemeris_cache.misses,
+            self._ephemeris_cache.saved_s,
+        )
 
-            satellite_data[sat_key] = sat
 
-        return satellite_data
+    def populateSatelliteData(self):
+        # parsed TLE data is kept until the satellite data is updated
+        return self._ephemeris_cache.getSatellites(self.satellite_dict)
 
 
     def get_image_label(self, i_ref):
@@ -2112,8 +2309,7 @@ class ImageProcessor(object):
 
 
     def _label_image_pillow(self, i_ref):
-        img_rgb = Image.fromarray(cv2.cvtColor(self.image, cv2.COLOR_BGR2RGB))
-        image_width, image_height  = img_rgb.size  # backwards from opencv
+        image_height, image_width = self.image.shape[:2]
 
 
         if self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'] == 'custom':
@@ -2122,16 +2318,13 @@ class ImageProcessor(object):
             pillow_font_file_p = self.font_path.joinpath(self.config['TEXT_PROPERTIES']['PIL_FONT_FILE'])
 
 
-        draw = ImageDraw.Draw(img_rgb)
-
-
         # Disabled when focus mode is enabled
         if self.config.get('FOCUS_MODE', False):
             logger.warning('Focus mode enabled, labels disabled')
 
             # indicate focus mode is enabled in indi-allsky
             self.drawText_pillow(
-                draw,
+                self.image,
                 'Focus Mode',
                 pillow_font_file_p,
                 self.text_size_pillow,
@@ -2142,7 +2335,7 @@ class ImageProcessor(object):
 
             self.text_xy = [image_width - 300, image_height - (self.text_font_height * 2)]
             self.drawText_pillow(
-                draw,
+                self.image,
                 i_ref['exp_date'].strftime('%H:%M:%S'),
                 pillow_font_file_p,
                 self.text_size_pillow,
@@ -2151,9 +2344,6 @@ class ImageProcessor(object):
                 anchor=self.text_anchor_pillow,
             )
 
-            # convert back to numpy array
-            self.image = cv2.cvtColor(numpy.array(img_rgb), cv2.COLOR_RGB2BGR)
-
             return
 
 
@@ -2167,7 +2357,7 @@ class ImageProcessor(object):
 
 
             self.drawText_pillow(
-                draw,
+                self.image,
                 line,
                 pillow_font_file_p,
                 self.text_size_pillow,
@@ -2179,26 +2369,22 @@ class ImageProcessor(object):
             self._text_next_line()
 
 
-        # convert back to numpy array
-        self.image = cv2.cvtColor(numpy.array(img_rgb), cv2.COLOR_RGB2BGR)
-
-
-    def drawText_pillow(self, draw, text, font_file, font_size, pt, color_rgb, anchor='la'):
-        font = ImageFont.truetype(str(font_file), font_size)
-
+    def drawText_pillow(self, image, text, font_file, font_size, pt, color_rgb, anchor='la'):
         if self.config['TEXT_PROPERTIES']['FONT_OUTLINE']:
             # black outline
             stroke_width = 4
         else:
             stroke_width = 0
 
-        draw.text(
-            pt,
+        # image is modified in place
+        self._text_renderer.drawText(
+            image,
             text,
-            fill=color_rgb,
-            font=font,
+            font_file,
+            font_size,
+            pt,
+            color_rgb,
             stroke_width=stroke_width,
-            stroke_fill=(0, 0, 0),
             anchor=anchor,
         )
 
@@ -2445,8 +2631,21 @@ class ImageProcessor(object):
         return img_pano
 
 
+    def fish2pano_remap(self):
+        fish2pano_start = time.time()
+
+        # rotation and cropping are included in the maps
+        img_pano = self._fish2pano_map.remap(self.image)
+
+        fish2pano_elapsed_s = time.time() - fish2pano_start
+        logger.info('Panorama in %0.4f s', fish2pano_elapsed_s)
+
+        # original image not replaced
+        return img_pano
+
+
     def fish2pano(self):
-        return self.fish2pano_module()
+        return self.fish2pano_remap()
 
 
     def fish2pano_cardinal_dirs_label(self, pano_data):
@@ -2540,13 +2739,10 @@ class ImageProcessor(object):
 
 
         overlay_rgb = overlay_img[:, :, :3]
-        overlay_alpha = (overlay_img[:, :, 3] / 255).astype(numpy.float32)
+        overlay_alpha = overlay_img[:, :, 3]
 
 
-        alpha_mask = numpy.dstack((overlay_alpha, overlay_alpha, overlay_alpha))
-
-
-        return overlay_rgb, alpha_mask
+        return overlay_rgb, overlay_alpha
 
 
     def _generateAduMask(self, img):
@@ -2624,10 +2820,26 @@ class ImageProcessor(object):
             )
 
 
-        channel_alpha = (channel_mask / 255).astype(numpy.float32)
+        return channel_mask
+
 
-        alpha_mask = numpy.dstack((channel_alpha, channel_alpha, channel_alpha))
+    def _generate_image_circle_outline(self, image):
+        image_height, image_width = image.shape[:2]
+
+        outline_mask = numpy.zeros([image_height, image_width], dtype=numpy.uint8)
+
+        center_x = int(image_width / 2) + self.config['IMAGE_CIRCLE_MASK']['OFFSET_X']
+        center_y = int(image_height / 2) - self.config['IMAGE_CIRCLE_MASK']['OFFSET_Y']  # minus
+        radius = int(self.config['IMAGE_CIRCLE_MASK']['DIAMETER'] / 2)
+
+        cv2.circle(
+            img=outline_mask,
+            center=(center_x, center_y),
+            radius=radius,
+            color=(255),
+            thickness=3,
+        )
 
-        return alpha_mask
+        return outline_mask
 
 
@@ -68,6 +68,9 @@ class IndiAllskyUpdateSatelliteData(object):
             self.import_entries(group, tle_data)
 
 
+        # image processors reload the TLE data
+        self._miscDb.invalidateSatelliteCache()
+
 
         # remove old entries
         #now_minus_30d = datetime.now() - timedelta(days=30)
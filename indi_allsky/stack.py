@@ -1,12 +1,26 @@
 import time
+from collections import deque
 import numpy
 import cv2
 import astroalign
+import sep
 import logging
 
 logger = logging.getLogger('indi_allsky')
 
 
+def sumType(numpy_type, count):
+    # smallest integer accumulator that cannot overflow
+    max_sum = int(numpy.iinfo(numpy_type).max) * count
+
+    if max_sum <= numpy.iinfo(numpy.uint16).max:
+        return numpy.uint16
+    elif max_sum <= numpy.iinfo(numpy.uint32).max:
+        return numpy.uint32
+
+    return numpy.uint64
+
+
 class IndiAllskyStacker(object):
 
     def __init__(self, config, bin_v, mask=None):
@@ -23,6 +37,13 @@ class IndiAllskyStacker(object):
         self._rotation_dev = 3  # rotation may not exceed this deviation
         self._history_min_vals = 15
 
+        # control points and transforms to the reference, keys are exposure dates
+        self._reg_cache = dict()
+        self._reg_reference_key = None
+
+        # composed transforms accumulate error, frames are matched to the reference again after this many reference changes
+        self._max_transform_hops = 5
+
 
     @property
     def detection_sigma(self):
@@ -88,25 +109,38 @@ class IndiAllskyStacker(object):
 
 
     def average(self, stack_data_list, numpy_type):
-        mean_image = numpy.mean(stack_data_list, axis=0)
-        return numpy.floor(mean_image).astype(numpy_type)  # no floats
+        for data in stack_data_list:
+            if not numpy.issubdtype(data.dtype, numpy.integer):
+                # registered images are floats
+                mean_image = numpy.mean(stack_data_list, axis=0)
+                return numpy.floor(mean_image).astype(numpy_type)  # no floats
+
+
+        sum_type = sumType(numpy_type, len(stack_data_list))
+
+        image_sum = stack_data_list[0].astype(sum_type)
+        for i in stack_data_list[1:]:
+            numpy.add(image_sum, i, out=image_sum, casting='unsafe')
+
+        # integer division is the same as the floor of the mean
+        return (image_sum // len(stack_data_list)).astype(numpy_type)
 
 
     def maximum(self, stack_data_list, numpy_type):
-        image_max = stack_data_list[0]  # start with first image
+        image_max = stack_data_list[0].copy()  # start with first image
 
         # compare with remaining images
         for i in stack_data_list[1:]:
-            image_max = numpy.maximum(image_max, i)
+            numpy.maximum(image_max, i, out=image_max)
 
         return image_max
 
     def minimum(self, stack_data_list, numpy_type):
-        image_min = stack_data_list[0]  # start with first image
+        image_min = stack_data_list[0].copy()  # start with first image
 
         # compare with remaining images
         for i in stack_data_list[1:]:
-            image_min = numpy.minimum(image_min, i)
+            numpy.minimum(image_min, i, out=image_min)
 
         return image_min
 
@@ -123,35 +157,25 @@ class IndiAllskyStacker(object):
 
         reg_data_list = [reference_i_ref['hdulist'][0].data]  # add target to final list
 
-        #reference_masked = self._crop(reference_i_ref['hdulist'][0].data)
-        reference_masked = cv2.bitwise_and(reference_i_ref['hdulist'][0].data, reference_i_ref['hdulist'][0].data, mask=self._sqm_mask)
-
         reg_start = time.time()
 
 
-        last_rotation = 0
+        # only new frames need source detection
+        self._cacheControlPoints(stack_i_ref_list)
 
-        for i_ref in stack_i_ref_list[1:]:
-            #i_masked = self._crop(i_ref['hdulist'][0].data)
-            i_masked = cv2.bitwise_and(i_ref['hdulist'][0].data, i_ref['hdulist'][0].data, mask=self._sqm_mask)
+        # cached transforms are moved to the new reference
+        self._setReference(reference_i_ref)
 
-            # detection_sigma default = 5
-            # max_control_points default = 50
-            # min_area default = 5
 
+        last_rotation = 0
+
+        for i_ref in stack_i_ref_list[1:]:
             try:
-                ### Find transform using a crop of the image
-                transform, (source_list, target_list) = astroalign.find_transform(
-                    i_masked,
-                    reference_masked,
-                    detection_sigma=self.detection_sigma,
-                    max_control_points=self.max_control_points,
-                    min_area=self.min_area,
-                )
+                transform, match_count = self._findTransform(i_ref)
 
                 logger.info(
                     'Registration Matches: %d, Rotation: %0.6f, Translation: (%0.6f, %0.6f), Scale: %0.6f',
-                    len(target_list),
+                    match_count,
                     transform.rotation,
                     transform.translation[0], transform.translation[1],
                     transform.scale,
@@ -217,6 +241,146 @@ class IndiAllskyStacker(object):
         return reg_data_list
 
 
+    def _cacheControlPoints(self, stack_i_ref_list):
+        key_list = [x['exp_date'] for x in stack_i_ref_list]
+
+        for key in list(self._reg_cache.keys()):
+            if key not in key_list:
+                del self._reg_cache[key]
+
+
+        for i_ref in stack_i_ref_list:
+            if i_ref['exp_date'] in self._reg_cache:
+                continue
+
+
+            #i_masked = self._crop(i_ref['hdulist'][0].data)
+            i_masked = cv2.bitwise_and(i_ref['hdulist'][0].data, i_ref['hdulist'][0].data, mask=self._sqm_mask)
+
+            # detection_sigma default = 5
+            # max_control_points default = 50
+            # min_area default = 5
+
+            control_points = self._findSources(i_masked)[:self.max_control_points]
+
+
+            self._reg_cache[i_ref['exp_date']] = {
+                'control_points' : control_points,
+                'transform'      : None,  # transform to the reference
+                'matches'        : 0,
+                'hops'           : 0,  # reference changes composed onto the transform
+            }
+
+
+    def _findSources(self, image):
+        # same source detection as astroalign.find_transform() (astroalign 2.6.2 _find_sources)
+        # the private function is not used since it may change between releases
+        image = image.astype(numpy.float32)
+
+        bkg = sep.Background(image)
+        thresh = self.detection_sigma * bkg.globalrms
+
+        sources = sep.extract(image - bkg.back(), thresh, minarea=self.min_area)
+        sources.sort(order='flux')
+
+        # brightest first
+        return numpy.array([[x['x'], x['y']] for x in sources[::-1]])
+
+
+    def _setReference(self, reference_i_ref):
+        reference_key = reference_i_ref['exp_date']
+
+        if reference_key == self._reg_reference_key:
+            return
+
+
+        old_reference_key = self._reg_reference_key
+        self._reg_reference_key = reference_key
+
+
+        old_reference_entry = self._reg_cache.get(old_reference_key)
+        if not old_reference_entry:
+            self._clearTransforms()
+            return
+
+
+        # one match from the old reference to the new reference
+        try:
+            self._checkControlPoints(old_reference_entry)
+            self._checkControlPoints(self._reg_cache[reference_key])
+
+            reference_transform, (source_list, target_list) = astroalign.find_transform(
+                old_reference_entry['control_points'],
+                self._reg_cache[reference_key]['control_points'],
+                max_control_points=self.max_control_points,
+            )
+        except astroalign.MaxIterError as e:
+            logger.error('Reference registration failure: %s', str(e))
+            self._clearTransforms()
+            return
+        except ValueError as e:
+            logger.error('Reference registration failure: %s', str(e))
+            self._clearTransforms()
+            return
+
+
+        for key, reg_entry in self._reg_cache.items():
+            if key == reference_key:
+                reg_entry['transform'] = None
+                reg_entry['hops'] = 0
+            elif key == old_reference_key:
+                reg_entry['transform'] = reference_transform
+                reg_entry['matches'] = len(target_list)
+                reg_entry['hops'] = 1
+            elif not isinstance(reg_entry['transform'], type(None)):
+                if reg_entry['hops'] >= self._max_transform_hops:
+                    # matched directly against the new reference
+                    reg_entry['transform'] = None
+                    reg_entry['hops'] = 0
+                    continue
+
+                # apply the transform to the old reference, then the old reference to the new reference
+                reg_entry['transform'] = reg_entry['transform'] + reference_transform
+                reg_entry['matches'] = min(reg_entry['matches'], len(target_list))
+                reg_entry['hops'] += 1
+
+
+    def _clearTransforms(self):
+        for reg_entry in self._reg_cache.values():
+            reg_entry['transform'] = None
+            reg_entry['hops'] = 0
+
+
+    def _checkControlPoints(self, reg_entry):
+        # find_transform does not accept an empty list
+        if len(reg_entry['control_points']) < 3:
+            raise ValueError('Fewer than 3 control points found')
+
+
+    def _findTransform(self, i_ref):
+        reg_entry = self._reg_cache[i_ref['exp_date']]
+
+        if not isinstance(reg_entry['transform'], type(None)):
+            return reg_entry['transform'], reg_entry['matches']
+
+
+        self._checkControlPoints(reg_entry)
+        self._checkControlPoints(self._reg_cache[self._reg_reference_key])
+
+        # exceptions are handled by the caller
+        transform, (source_list, target_list) = astroalign.find_transform(
+            reg_entry['control_points'],
+            self._reg_cache[self._reg_reference_key]['control_points'],
+            max_control_points=self.max_control_points,
+        )
+
+        reg_entry['transform'] = transform
+        reg_entry['matches'] = len(target_list)
+        reg_entry['hops'] = 0
+
+        return transform, len(target_list)
+
+
     def _crop(self, image):
         image_height, image_width = image.shape[:2]
 
@@ -267,3 +431,162 @@ class IndiAllskyStacker(object):
         self._sqm_mask = mask
 
 
+
+
+class IndiAllskyRollingStack(object):
+
+    ### Stacks a sliding window of frames without visiting every frame in the window
+    # average keeps a running sum, the new frame is added and the evicted frame is subtracted
+    # maximum and minimum use a two stack queue, the back stack is reduced as frames arrive,
+    # the front stack holds reductions toward the oldest frame and is rebuilt once per window
+
+    method_list = ('average', 'mean', 'maximum', 'minimum')
+
+    # rebuild from the frames periodically as a safety net
+    rebuild_interval = 500
+
+
+    def __init__(self, method):
+        self.method = method
+
+        if method in ('maximum',):
+            self._ufunc = numpy.maximum
+        elif method in ('minimum',):
+            self._ufunc = numpy.minimum
+        else:
+            self._ufunc = None
+
+        self._reset()
+
+
+    def _reset(self):
+        self._key_list = deque()  # oldest to newest
+        self._data_list = deque()
+        self._shape = None
+        self._dtype = None
+        self._updates = 0
+
+        # average
+        self._sum = None
+        self._sum_type = None
+
+        # maximum/minimum
+        self._front_list = list()  # last element is the reduction of the oldest frame through the end of the front
+        self._back_data_list = list()
+        self._back_agg = None
+
+
+    def update(self, key_data_list, numpy_type, max_count):
+        # key_data_list is newest to oldest, the same as the image list
+        new_key_list = [x[0] for x in reversed(key_data_list)]
+        new_data_list = [x[1] for x in reversed(key_data_list)]
+
+        data_0 = new_data_list[0]
+
+
+        rebuild = False
+        if data_0.shape != self._shape or data_0.dtype != self._dtype:
+            rebuild = True
+        elif self._updates >= self.rebuild_interval:
+            rebuild = True
+        elif self.method in ('average', 'mean') and self._sum_type != sumType(numpy_type, max_count):
+            rebuild = True
+
+
+        if not rebuild:
+            # find how many of the oldest frames were evicted
+            try:
+                evict_count = list(self._key_list).index(new_key_list[0])
+            except ValueError:
+                evict_count = len(self._key_list)
+
+
+            keep_count = len(self._key_list) - evict_count
+            if list(self._key_list)[evict_count:] != new_key_list[:keep_count]:
+                # the window did not slide
+                rebuild = True
+
+
+        if rebuild:
+            self._reset()
+            self._shape = data_0.shape
+            self._dtype = data_0.dtype
+
+            if self.method in ('average', 'mean'):
+                self._sum_type = sumType(numpy_type, max_count)
+
+            evict_count = 0
+            keep_count = 0
+
+
+        for x in range(evict_count):
+            self._pop()
+
+        for key, data in zip(new_key_list[keep_count:], new_data_list[keep_count:]):
+            self._push(key, data)
+
+
+        self._updates += 1
+
+
+        if self.method in ('average', 'mean'):
+            # integer division is the same as the floor of the mean
+            return (self._sum // len(self._data_list)).astype(numpy_type)
+
+
+        if self._front_list and not isinstance(self._back_agg, type(None)):
+            return self._ufunc(self._front_list[-1], self._back_agg)
+        elif self._front_list:
+            return self._front_list[-1].copy()
+
+        return self._back_agg.copy()
+
+
+    def _push(self, key, data):
+        self._key_list.append(key)
+        self._data_list.append(data)
+
+
+        if self.method in ('average', 'mean'):
+            if isinstance(self._sum, type(None)):
+                self._sum = data.astype(self._sum_type)
+            else:
+                numpy.add(self._sum, data, out=self._sum, casting='unsafe')
+
+            return
+
+
+        self._back_data_list.append(data)
+
+        if isinstance(self._back_agg, type(None)):
+            self._back_agg = data.copy()
+        else:
+            self._ufunc(self._back_agg, data, out=self._back_agg)
+
+
+    def _pop(self):
+        self._key_list.popleft()
+        data = self._data_list.popleft()
+
+
+        if self.method in ('average', 'mean'):
+            numpy.subtract(self._sum, data, out=self._sum, casting='unsafe')
+            return
+
+
+        if not self._front_list:
+            # move the back stack to the front, newest to oldest
+            agg = None
+            for back_data in reversed(self._back_data_list):
+                if isinstance(agg, type(None)):
+                    agg = back_data.copy()
+                else:
+                    agg = self._ufunc(agg, back_data)
+
+                self._front_list.append(agg)
+
+            self._back_data_list = list()
+            self._back_agg = None
+
+
+        self._front_list.pop()
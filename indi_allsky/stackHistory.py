@@ -0,0 +1,120 @@
+import io
+import os
+import tempfile
+import shutil
+from datetime import datetime
+from pathlib import Path
+import numpy
+import logging
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyStackHistory(object):
+
+    ### Calibrated frames shared between image workers for stacking
+    # frames are published and loaded in the stack stage, each frame is a numpy archive named by the frame number
+    # the folder is on tmpfs when available
+
+    def __init__(self):
+        shm_p = Path('/dev/shm')
+        if shm_p.is_dir():
+            base_p = shm_p
+        else:
+            base_p = Path(tempfile.gettempdir())
+
+        # created by the first image worker that publishes a frame
+        self.history_dir = base_p.joinpath('indi_allsky_stack_{0:d}'.format(os.getpid()))
+
+
+    def publish(self, seq, i_ref):
+        if not self.history_dir.exists():
+            self.history_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+
+        frame_data = {
+            'fits'         : i_ref['hdulist'][0].data,
+            'exposure'     : i_ref['exposure'],
+            'exp_date'     : i_ref['exp_date'].isoformat(),
+            'image_bitpix' : i_ref['image_bitpix'],
+        }
+
+        if i_ref['opencv_data'] is not i_ref['hdulist'][0].data:
+            # color data is reordered for opencv
+            frame_data['opencv'] = i_ref['opencv_data']
+
+
+        frame_p = self.history_dir.joinpath('{0:d}.npz'.format(seq))
+        frame_tmp_p = self.history_dir.joinpath('{0:d}.tmp'.format(seq))
+
+        # an interrupted write must not be loaded
+        with io.open(str(frame_tmp_p), 'wb') as f_frame:
+            numpy.savez(f_frame, **frame_data)
+
+        frame_tmp_p.rename(frame_p)
+
+
+    def load(self, seq, count):
+        from astropy.io import fits
+
+        i_ref_list = list()
+
+        # newest to oldest, the same as the image list
+        for s in range(seq - 1, max(seq - count, -1), -1):
+            frame_p = self.history_dir.joinpath('{0:d}.npz'.format(s))
+
+            try:
+                with numpy.load(str(frame_p)) as frame_data:
+                    fits_data = frame_data['fits']
+
+                    if 'opencv' in frame_data.files:
+                        opencv_data = frame_data['opencv']
+                    else:
+                        opencv_data = fits_data
+
+                    i_ref = {
+                        'hdulist'      : fits.HDUList([fits.PrimaryHDU(fits_data)]),
+                        'opencv_data'  : opencv_data,
+                        'calibrated'   : True,
+                        'exposure'     : float(frame_data['exposure']),
+                        'exp_date'     : datetime.fromisoformat(str(frame_data['exp_date'])),
+                        'image_bitpix' : int(frame_data['image_bitpix']),
+                    }
+            except FileNotFoundError:
+                # frame was not stacked or failed before the stack stage
+                continue
+
+
+            i_ref_list.append(i_ref)
+
+
+        return i_ref_list
+
+
+    def expire(self, seq, count):
+        if not self.history_dir.exists():
+            return
+
+
+        # frames before the window are no longer needed by later frames
+        for f in self.history_dir.iterdir():
+            try:
+                frame_seq = int(f.name.split('.')[0])
+            except ValueError:
+                continue
+
+            if frame_seq > seq - count:
+                continue
+
+            try:
+                f.unlink()
+            except FileNotFoundError:
+                pass
+
+
+    def cleanup(self):
+        if not self.history_dir.exists():
+            return
+
+        shutil.rmtree(str(self.history_dir), ignore_errors=True)
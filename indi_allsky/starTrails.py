@@ -1,4 +1,6 @@
 import os
+import io
+import json
 import cv2
 from fractions import Fraction
 import math
@@ -23,7 +25,7 @@ logger = logging.getLogger('indi_allsky')
 
 class StarTrailGenerator(object):
 
-    def __init__(self, config, bin_v, mask=None):
+    def __init__(self, config, bin_v, mask=None, timelapse_dir=None):
         self.config = config
         self.bin_v = bin_v
 
@@ -77,8 +79,13 @@ class StarTrailGenerator(object):
             self.image_dir = Path(__file__).parent.parent.joinpath('html', 'images').absolute()
 
 
-        self.timelapse_tmpdir = tempfile.TemporaryDirectory(dir=self.image_dir, suffix='_startrail_timelapse')    # context manager automatically deletes files when finished
-        self.timelapse_tmpdir_p = Path(self.timelapse_tmpdir.name)
+        if timelapse_dir:
+            # persistent folder for incremental star trails
+            self.timelapse_tmpdir = None
+            self.timelapse_tmpdir_p = Path(timelapse_dir)
+        else:
+            self.timelapse_tmpdir = tempfile.TemporaryDirectory(dir=self.image_dir, suffix='_startrail_timelapse')    # context manager automatically deletes files when finished
+            self.timelapse_tmpdir_p = Path(self.timelapse_tmpdir.name)
 
 
 
@@ -495,9 +502,72 @@ class StarTrailGenerator(object):
         return degrees, minutes, seconds
 
 
+    def checkpoint(self, checkpoint_p):
+        if isinstance(self.trail_image, type(None)):
+            # no images processed
+            return
+
+
+        numpy.save(str(checkpoint_p.joinpath('startrail.npy')), self.trail_image)
+
+        if not isinstance(self.placeholder_image, type(None)):
+            numpy.save(str(checkpoint_p.joinpath('startrail_placeholder.npy')), self.placeholder_image)
+
+
+        startrail_state = {
+            'original_height' : self.original_height,
+            'original_width'  : self.original_width,
+            'pixels_cutoff'   : self.pixels_cutoff,
+            'trail_count'     : self.trail_count,
+            'excluded_images' : self.excluded_images,
+            'placeholder_adu' : self.placeholder_adu,
+            'timelapse_frame_list' : [str(x) for x in self._timelapse_frame_list],
+            'image_processing_elapsed_s' : self.image_processing_elapsed_s,
+        }
+
+        with io.open(str(checkpoint_p.joinpath('startrail.json')), 'w') as f_state:
+            json.dump(startrail_state, f_state)
+
+
+    def restore(self, checkpoint_p):
+        startrail_npy_p = checkpoint_p.joinpath('startrail.npy')
+        placeholder_npy_p = checkpoint_p.joinpath('startrail_placeholder.npy')
+        startrail_json_p = checkpoint_p.joinpath('startrail.json')
+
+        if not startrail_npy_p.exists() or not startrail_json_p.exists():
+            return
+
+
+        with io.open(str(startrail_json_p), 'r') as f_state:
+            startrail_state = json.load(f_state)
+
+
+        self.original_height = startrail_state['original_height']
+        self.original_width = startrail_state['original_width']
+        self.pixels_cutoff = startrail_state['pixels_cutoff']
+        self.trail_count = startrail_state['trail_count']
+        self.excluded_images = startrail_state['excluded_images']
+        self.placeholder_adu = startrail_state['placeholder_adu']
+        self.image_processing_elapsed_s = startrail_state['image_processing_elapsed_s']
+
+
+        # frames written after the checkpoint are ignored
+        self._timelapse_frame_list = [Path(x) for x in startrail_state['timelapse_frame_list'] if Path(x).exists()]
+        self._timelapse_frame_count = len(self._timelapse_frame_list)
+
+
+        self.trail_image = numpy.load(str(startrail_npy_p))
+
+        if placeholder_npy_p.exists():
+            self.placeholder_image = numpy.load(str(placeholder_npy_p))
+
+        logger.info('Restored star trail with %d images', self.trail_count)
+
+
     def cleanup(self):
         # cleanup the folder
-        self.timelapse_tmpdir.cleanup()
+        if self.timelapse_tmpdir:
+            self.timelapse_tmpdir.cleanup()
 
 
     def _generateSqmMask(self, img):
@@ -69,15 +69,7 @@ class IndiAllSkyStars(object):
         result = cv2.matchTemplate(grey_img, self.star_template, cv2.TM_CCOEFF_NORMED)
         result_filter = numpy.where(result >= self._detectionThreshold)
 
-        blobs = list()
-        for pt in zip(*result_filter[::-1]):
-            for blob in blobs:
-                if (abs(pt[0] - blob[0]) < self._distanceThreshold) and (abs(pt[1] - blob[1]) < self._distanceThreshold):
-                    break
-
-            else:
-                # if none of the points are under the distance threshold, then add it
-                blobs.append(pt)
+        blobs = self.suppressPoints(result_filter, result.shape[1])
 
 
         sep_elapsed_s = time.time() - sep_start
@@ -90,6 +82,43 @@ class IndiAllSkyStars(object):
         return blobs
 
 
+    def suppressPoints(self, result_filter, width):
+        ### Keeps the first point of every group of points within the distance threshold
+        # points are visited in row order, the same as a loop comparing each point with all previous blobs,
+        # earlier rows are checked with a per-column array, only the remaining points in a row are looped over
+
+        y_array, x_array = result_filter
+
+        blobs = list()
+
+        if not len(y_array):
+            return blobs
+
+
+        # the first row where each column is no longer covered by a blob
+        block_until = numpy.zeros(width, dtype=numpy.int64)
+
+        row_list, row_start_list = numpy.unique(y_array, return_index=True)
+        row_end_list = numpy.append(row_start_list[1:], len(y_array))
+
+        for y, row_start, row_end in zip(row_list.tolist(), row_start_list.tolist(), row_end_list.tolist()):
+            x_row = x_array[row_start:row_end]
+            x_row = x_row[block_until[x_row] <= y]
+
+            last_x = None
+            for x in x_row.tolist():
+                if not isinstance(last_x, type(None)) and x - last_x < self._distanceThreshold:
+                    continue
+
+                blobs.append((x, y))
+                last_x = x
+
+                block_until[max(0, x - self._distanceThreshold + 1):x + self._distanceThreshold] = y + self._distanceThreshold
+
+
+        return blobs
+
+
     def _generateSqmMask(self, img):
         logger.info('Generating mask based on SQM_ROI')
 
@@ -0,0 +1,168 @@
+import cv2
+import numpy
+from PIL import Image
+from PIL import ImageFont
+from PIL import ImageDraw
+import logging
+
+from .composite import IndiAllskyComposite
+
+
+logger = logging.getLogger('indi_allsky')
+
+
+class IndiAllskyTextRenderer(object):
+
+    ### Pillow text rendered into small tiles which are blended directly into the BGR numpy image
+    # the image is not converted to a Pillow image, rendered tiles are cached by their text
+
+    tile_cache_max = 200
+
+    # fonts are shared by all renderers in the process, keys are (file, size)
+    _font_cache = dict()
+
+
+    def __init__(self):
+        # keys are in least recently used order
+        self._tile_cache = dict()
+
+        self._hits = 0
+        self._misses = 0
+
+
+    @property
+    def hits(self):
+        return self._hits
+
+    @hits.setter
+    def hits(self, *args):
+        pass  # read only
+
+
+    @property
+    def misses(self):
+        return self._misses
+
+    @misses.setter
+    def misses(self, *args):
+        pass  # read only
+
+
+    def getFont(self, font_file, font_size):
+        font_key = (str(font_file), int(font_size))
+
+        font = self._font_cache.get(font_key)
+        if not font:
+            # not catching OSError
+            font = ImageFont.truetype(str(font_file), int(font_size))
+            self._font_cache[font_key] = font
+
+        return font
+
+
+    def drawText(self, image, text, font_file, font_size, pt, color_rgb, stroke_width=0, anchor='la'):
+        ### image is modified in place
+        color_rgb = tuple(int(x) for x in color_rgb)
+
+        tile_key = (text, str(font_file), int(font_size), color_rgb, int(stroke_width), anchor)
+
+        try:
+            tile = self._tile_cache.pop(tile_key)
+            self._hits += 1
+        except KeyError:
+            tile = self._renderTile(text, font_file, font_size, color_rgb, stroke_width, anchor)
+            self._misses += 1
+
+        self._tile_cache[tile_key] = tile  # most recently used
+
+        if len(self._tile_cache) > self.tile_cache_max:
+            del self._tile_cache[next(iter(self._tile_cache))]
+
+
+        if isinstance(tile, type(None)):
+            # nothing to draw
+            return image
+
+
+        left, top, tile_keep, tile_premult = tile
+        tile_height, tile_width = tile_keep.shape[:2]
+        image_height, image_width = image.shape[:2]
+
+        x1 = int(pt[0]) + left
+        y1 = int(pt[1]) + top
+
+        # clip the tile to the image
+        cx1 = max(x1, 0)
+        cy1 = max(y1, 0)
+        cx2 = min(x1 + tile_width, image_width)
+        cy2 = min(y1 + tile_height, image_height)
+
+        if cx1 >= cx2 or cy1 >= cy2:
+            # outside of the image
+            return image
+
+
+        tile_keep = tile_keep[cy1 - y1:cy2 - y1, cx1 - x1:cx2 - x1]
+        tile_premult = tile_premult[cy1 - y1:cy2 - y1, cx1 - x1:cx2 - x1]
+
+        if len(image.shape) == 2:
+            tile_premult = cv2.cvtColor(tile_premult, cv2.COLOR_BGR2GRAY)
+
+
+        IndiAllskyComposite.blend(image[cy1:cy2, cx1:cx2], tile_keep, tile_premult)
+
+        return image
+
+
+    def _renderTile(self, text, font_file, font_size, color_rgb, stroke_width, anchor):
+        font = self.getFont(font_file, font_size)
+
+        # bounding box is relative to the anchor
+        left, top, right, bottom = font.getbbox(text, stroke_width=stroke_width, anchor=anchor)
+
+        tile_width = right - left
+        tile_height = bottom - top
+
+        if tile_width <= 0 or tile_height <= 0:
+            return None
+
+
+        # coverage of the text including the outline
+        outer_img = Image.new('L', (tile_width, tile_height), 0)
+        ImageDraw.Draw(outer_img).text(
+            (-left, -top),
+            text,
+            fill=255,
+            font=font,
+            stroke_width=stroke_width,
+            stroke_fill=255,
+            anchor=anchor,
+        )
+        outer = numpy.array(outer_img).astype(numpy.float32) / 255
+
+
+        if stroke_width:
+            # coverage of the text without the outline
+            fill_img = Image.new('L', (tile_width, tile_height), 0)
+            ImageDraw.Draw(fill_img).text(
+                (-left, -top),
+                text,
+                fill=255,
+                font=font,
+                anchor=anchor,
+            )
+            fill = numpy.array(fill_img).astype(numpy.float32) / 255
+
+            # the black outline is drawn first, then the text
+            tile_keep = numpy.round((1 - outer) * (1 - fill) * 255).astype(numpy.uint8)
+        else:
+            fill = outer
+
+            # text only
+            tile_keep = numpy.round((1 - fill) * 255).astype(numpy.uint8)
+
+        color_bgr = numpy.array(color_rgb[::-1], dtype=numpy.float32)
+        tile_premult = numpy.round(fill[:, :, numpy.newaxis] * color_bgr).astype(numpy.uint8)
+
+
+        return left, top, tile_keep, tile_premult
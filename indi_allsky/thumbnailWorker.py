@@ -0,0 +1,116 @@
+import time
+import traceback
+import logging
+
+from threading import Thread
+import queue
+
+from .flask import create_app
+from .flask.miscDb import miscDb
+from .miscUpload import miscUpload
+
+from .flask import models
+
+
+app = create_app()
+
+logger = logging.getLogger('indi_allsky')
+
+
+
+class ThumbnailWorker(Thread):
+    def __init__(
+        self,
+        idx,
+        config,
+        error_q,
+        upload_q,
+    ):
+        super(ThumbnailWorker, self).__init__()
+
+        self.name = 'Thumbnail-{0:d}'.format(idx)
+
+        self.config = config
+
+        self.error_q = error_q
+        self.upload_q = upload_q
+
+        self.thumbnail_q = queue.Queue()
+
+        self._miscDb = miscDb(self.config)
+        self._miscUpload = miscUpload(self.config, self.upload_q)
+
+
+    def stop(self):
+        self.thumbnail_q.put({'stop': True})
+
+
+    def add(self, entry, entry_metadata, camera_id, thumbnail_metadata, numpy_data):
+        # numpy_data is not modified in place by the image processor, a reference is safe
+        self.thumbnail_q.put({
+            'model'              : entry.__class__.__name__,
+            'id'                 : entry.id,
+            'entry_metadata'     : entry_metadata,
+            'camera_id'          : camera_id,
+            'thumbnail_metadata' : thumbnail_metadata,
+            'numpy_data'         : numpy_data,
+        })
+
+
+    def run(self):
+        ### use this as a method to log uncaught exceptions
+        try:
+            self.saferun()
+        except Exception as e:
+            tb = traceback.format_exc()
+            self.error_q.put((str(e), tb))
+            raise e
+
+
+    def saferun(self):
+        while True:
+            t_dict = self.thumbnail_q.get()
+
+            if t_dict.get('stop'):
+                logger.warning('Goodbye')
+                return
+
+
+            with app.app_context():
+                self.processThumbnail(t_dict)
+
+
+    def processThumbnail(self, t_dict):
+        thumbnail_start = time.time()
+
+        entry_model = getattr(models, t_dict['model'])
+
+        entry = entry_model.query\
+            .filter(entry_model.id == t_dict['id'])\
+            .first()
+
+        if not entry:
+            logger.error('%s ID %d not found', t_dict['model'], t_dict['id'])
+            return
+
+
+        thumbnail_metadata = t_dict['thumbnail_metadata']
+
+        thumbnail_entry = self._miscDb.addThumbnailImageAuto(
+            entry,
+            t_dict['entry_metadata'],
+            t_dict['camera_id'],
+            thumbnail_metadata,
+            numpy_data=t_dict['numpy_data'],
+        )
+
+        if not thumbnail_entry:
+            return
+
+
+        self._miscUpload.syncapi_thumbnail(thumbnail_entry, thumbnail_metadata)  # syncapi before s3
+        self._miscUpload.s3_upload_thumbnail(thumbnail_entry, thumbnail_metadata)
+
+
+        thumbnail_elapsed_s = time.time() - thumbnail_start
+        logger.info('Background thumbnail completed in %0.4f s', thumbnail_elapsed_s)
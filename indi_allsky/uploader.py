@@ -1,4 +1,5 @@
 import time
+import json
 from datetime import timedelta
 from pathlib import Path
 #import signal
@@ -19,8 +20,10 @@ from .flask.miscDb import miscDb
 from .flask import models
 
 from . import filetransfer
+from .filetransfer.pool import FileTransferPool
 
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.exc import SQLAlchemyError
 
 #from .exceptions import TimeOutException
 
@@ -51,6 +54,11 @@ class FileUploader(Thread):
         self.upload_q = upload_q
 
 
+        # connections are kept open between uploads
+        self._pool = FileTransferPool(idle_timeout=self.config.get('UPLOAD_IDLE_TIMEOUT', 300))
+        self._pool_stats_time = time.time()
+
+
         self._stopper = threading.Event()
         #self._shutdown = False
 
@@ -117,12 +125,20 @@ class FileUploader(Thread):
 
         while True:
             if self.stopped():
+                self._pool.closeAll()
                 logger.warning('Goodbye')
                 return
 
+
+            if time.time() - self._pool_stats_time > 60:
+                with app.app_context():
+                    self._updatePoolStats()
+
+
             try:
                 u_dict = self.upload_q.get(timeout=11)  # prime number
             except queue.Empty:
+                self._pool.expire()
                 continue
 
             #if u_dict.get('stop'):
@@ -134,30 +150,131 @@ class FileUploader(Thread):
             #    return
 
 
-            # new context for every task, reduces the effects of caching
+            # claim more tasks when there is a backlog
+            u_dict_list = [u_dict]
+
+            batch_size = self._getBatchSize()
+            while len(u_dict_list) < batch_size:
+                try:
+                    u_dict_list.append(self.upload_q.get_nowait())
+                except queue.Empty:
+                    break
+
+
+            # new context for every batch, reduces the effects of caching
             with app.app_context():
-                self.processUpload(u_dict)
+                self.processUploadBatch(u_dict_list)
 
 
-    def processUpload(self, u_dict):
-        task_id = u_dict['task_id']
+    def _getBatchSize(self):
+        batch_max = self.config.get('UPLOAD_BATCH_MAX', 10)
+        if batch_max <= 1:
+            return 1
 
 
         try:
-            task = models.IndiAllSkyDbTaskQueueTable.query\
-                .filter(models.IndiAllSkyDbTaskQueueTable.id == task_id)\
-                .filter(models.IndiAllSkyDbTaskQueueTable.state == models.TaskQueueState.QUEUED)\
-                .filter(models.IndiAllSkyDbTaskQueueTable.queue == models.TaskQueueQueue.UPLOAD)\
-                .one()
-
-        except NoResultFound:
-            logger.error('Task ID %d not found', task_id)
-            return
+            queue_depth = self.upload_q.qsize()
+        except NotImplementedError:
+            # not supported on macOS
+            return 1
+
+
+        # share the backlog with the other workers
+        worker_count = max(self.config.get('UPLOAD_WORKERS', 1), 1)
+
+        return min(int(queue_depth / worker_count) + 1, batch_max)
+
+
+    def processUploadBatch(self, u_dict_list):
+        batch_start = time.time()
+
+        task_id_list = [u_dict['task_id'] for u_dict in u_dict_list]
+
+
+        # claim all tasks in a single transaction
+        task_query = models.IndiAllSkyDbTaskQueueTable.query\
+            .filter(models.IndiAllSkyDbTaskQueueTable.id.in_(task_id_list))\
+            .filter(models.IndiAllSkyDbTaskQueueTable.state == models.TaskQueueState.QUEUED)\
+            .filter(models.IndiAllSkyDbTaskQueueTable.queue == models.TaskQueueQueue.UPLOAD)
+
+        task_dict = {task.id: task for task in task_query}
+
+
+        task_list = list()
+        for task_id in task_id_list:
+            task = task_dict.get(task_id)
+
+            if not task:
+                logger.error('Task ID %d not found', task_id)
+                continue
+
+            task.setRunning(commit=False)
+            task_list.append(task)
+
+        db.session.commit()
+
+
+        claimed_task_list = list(task_list)
+
+        if self.config.get('SYNCAPI', {}).get('BATCH'):
+            task_list, sync_batch_list = self._groupSyncTasks(task_list)
+        else:
+            sync_batch_list = list()
+
+
+        try:
+            for task in task_list:
+                try:
+                    self.processUpload(task)
+                except Exception as e:
+                    # one bad task must not leave the rest of the batch running
+                    self._failTasks([task], e)
+
+            # camera entries are synced by the single tasks before the assets
+            for sync_task_list in sync_batch_list:
+                try:
+                    self.processSyncBatch(sync_task_list)
+                except Exception as e:
+                    self._failTasks(sync_task_list, e)
+        finally:
+            # tasks are only left running when their results were rolled back
+            requeue_task_list = [task for task in claimed_task_list if task.state == models.TaskQueueState.RUNNING]
+            for task in requeue_task_list:
+                task.state = models.TaskQueueState.QUEUED
+
+            # task states and entry updates are written once per batch
+            db.session.commit()
+
+            for task in requeue_task_list:
+                logger.warning('Requeuing task %d', task.id)
+                self.upload_q.put({'task_id' : task.id})
+
+
+        if len(task_list) > 1:
+            batch_elapsed_s = time.time() - batch_start
+            logger.info('Upload batch of %d tasks completed in %0.4f s', len(task_list), batch_elapsed_s)
+
+
+    def _failTasks(self, task_list, e):
+        tb = traceback.format_exc()
+        for line in tb.split('\n'):
+            logger.error('Upload exception: %s', line)
 
 
-        task.setRunning()
+        if isinstance(e, SQLAlchemyError):
+            # the results of the earlier tasks in the batch are lost, they are queued again
+            db.session.rollback()
 
 
+        for task in task_list:
+            if task.state != models.TaskQueueState.RUNNING:
+                # already finished
+                continue
+
+            task.setFailed('Upload failed: {0:s}'.format(str(e)), commit=False)
+
+
+    def processUpload(self, task):
         action = task.data['action']
 
         local_file = task.data.get('local_file')
@@ -181,7 +298,7 @@ class FileUploader(Thread):
                 _model = getattr(models, entry_model)
             except AttributeError:
                 logger.error('Model not found: %s', entry_model)
-                task.setFailed('Model not found: {0:s}'.format(entry_model))
+                task.setFailed('Model not found: {0:s}'.format(entry_model), commit=False)
                 return
 
             try:
@@ -190,7 +307,7 @@ class FileUploader(Thread):
                     .one()
             except NoResultFound:
                 logger.error('ID %d not found in %s', entry_id, entry_model)
-                task.setFailed('ID {0:d} not found in {1:s}'.format(entry_id, entry_model))
+                task.setFailed('ID {0:d} not found in {1:s}'.format(entry_id, entry_model), commit=False)
                 return
 
             local_file_p = Path(entry.getFilesystemPath())
@@ -205,7 +322,7 @@ class FileUploader(Thread):
             entry = None
         else:
             logger.error('Entry model or filename not defined')
-            task.setFailed('Entry model or filename not defined')
+            task.setFailed('Entry model or filename not defined', commit=False)
             return
 
 
@@ -229,7 +346,7 @@ class FileUploader(Thread):
                 client_class = getattr(filetransfer, self.config['FILETRANSFER']['CLASSNAME'])
             except AttributeError:
                 logger.error('Unknown filetransfer class: %s', self.config['FILETRANSFER']['CLASSNAME'])
-                task.setFailed('Unknown filetransfer class: {0:s}'.format(self.config['FILETRANSFER']['CLASSNAME']))
+                task.setFailed('Unknown filetransfer class: {0:s}'.format(self.config['FILETRANSFER']['CLASSNAME']), commit=False)
                 return
 
             client = client_class(self.config)
@@ -267,7 +384,7 @@ class FileUploader(Thread):
                 client_class = getattr(filetransfer, self.config['S3UPLOAD']['CLASSNAME'])
             except AttributeError:
                 logger.error('Unknown filetransfer class: %s', self.config['S3UPLOAD']['CLASSNAME'])
-                task.setFailed('Unknown filetransfer class: {0:s}'.format(self.config['S3UPLOAD']['CLASSNAME']))
+                task.setFailed('Unknown filetransfer class: {0:s}'.format(self.config['S3UPLOAD']['CLASSNAME']), commit=False)
                 return
 
 
@@ -303,7 +420,7 @@ class FileUploader(Thread):
                 client_class = getattr(filetransfer, self.config['S3UPLOAD']['CLASSNAME'])
             except AttributeError:
                 logger.error('Unknown filetransfer class: %s', self.config['S3UPLOAD']['CLASSNAME'])
-                task.setFailed('Unknown filetransfer class: {0:s}'.format(self.config['S3UPLOAD']['CLASSNAME']))
+                task.setFailed('Unknown filetransfer class: {0:s}'.format(self.config['S3UPLOAD']['CLASSNAME']), commit=False)
                 return
 
 
@@ -339,7 +456,7 @@ class FileUploader(Thread):
                 client_class = getattr(filetransfer, 'paho_mqtt')
             except AttributeError:
                 logger.error('Unknown filetransfer class: %s', 'paho_mqtt')
-                task.setFailed('Unknown filetransfer class: {0:s}'.format('paho_mqtt'))
+                task.setFailed('Unknown filetransfer class: {0:s}'.format('paho_mqtt'), commit=False)
                 return
 
             client = client_class(self.config)
@@ -367,7 +484,7 @@ class FileUploader(Thread):
                 client_class = getattr(filetransfer, 'requests_syncapi_v1')
             except AttributeError:
                 logger.error('Unknown filetransfer class: %s', 'requests_syncapi_v1')
-                task.setFailed('Unknown filetransfer class: {0:s}'.format('requests_syncapi_v1'))
+                task.setFailed('Unknown filetransfer class: {0:s}'.format('requests_syncapi_v1'), commit=False)
                 return
 
             client = client_class(self.config)
@@ -377,7 +494,7 @@ class FileUploader(Thread):
             try:
                 credentials_json = self._miscDb.getState('YOUTUBE_CREDENTIALS')
             except NoResultFound:
-                task.setFailed('Youtube authorization credentials not found')
+                task.setFailed('Youtube authorization credentials not found', commit=False)
                 raise Exception('Youtube authorization credentials not found')
 
 
@@ -396,23 +513,23 @@ class FileUploader(Thread):
                 client_class = getattr(filetransfer, 'youtube_oauth2')
             except AttributeError:
                 logger.error('Unknown filetransfer class: %s', 'youtube_oauth2')
-                task.setFailed('Unknown filetransfer class: {0:s}'.format('youtube_oauth2'))
+                task.setFailed('Unknown filetransfer class: {0:s}'.format('youtube_oauth2'), commit=False)
                 return
 
             client = client_class(self.config)
         else:
-            task.setFailed('Invalid transfer action')
+            task.setFailed('Invalid transfer action', commit=False)
             raise Exception('Invalid transfer action')
 
 
         start = time.time()
 
         try:
-            client.connect(**connect_kwargs)
+            client = self._pool.connect(client, connect_kwargs)
         except filetransfer.exceptions.ConnectionFailure as e:
             logger.error('Connection failure: %s', e)
-            client.close()
-            task.setFailed('Connection failure')
+            self._pool.discard(client)
+            task.setFailed('Connection failure', commit=False)
 
             self._miscDb.addNotification(
                 models.NotificationCategory.UPLOAD,
@@ -424,8 +541,8 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.AuthenticationFailure as e:
             logger.error('Authentication failure: %s', e)
-            client.close()
-            task.setFailed('Authentication failure')
+            self._pool.discard(client)
+            task.setFailed('Authentication failure', commit=False)
 
             self._miscDb.addNotification(
                 models.NotificationCategory.UPLOAD,
@@ -437,8 +554,8 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.CertificateValidationFailure as e:
             logger.error('Certificate validation failure: %s', e)
-            client.close()
-            task.setFailed('Certificate validation failure')
+            self._pool.discard(client)
+            task.setFailed('Certificate validation failure', commit=False)
 
             self._miscDb.addNotification(
                 models.NotificationCategory.UPLOAD,
@@ -454,8 +571,8 @@ class FileUploader(Thread):
             response = client.put(**put_kwargs)
         except filetransfer.exceptions.ConnectionFailure as e:
             logger.error('Connection failure: %s', e)
-            client.close()
-            task.setFailed('Connection failure')
+            self._pool.discard(client)
+            task.setFailed('Connection failure', commit=False)
 
             self._miscDb.addNotification(
                 models.NotificationCategory.UPLOAD,
@@ -467,8 +584,8 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.AuthenticationFailure as e:
             logger.error('Authentication failure: %s', e)
-            client.close()
-            task.setFailed('Authentication failure')
+            self._pool.discard(client)
+            task.setFailed('Authentication failure', commit=False)
 
             self._miscDb.addNotification(
                 models.NotificationCategory.UPLOAD,
@@ -480,8 +597,8 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.CertificateValidationFailure as e:
             logger.error('Certificate validation failure: %s', e)
-            client.close()
-            task.setFailed('Certificate validation failure')
+            self._pool.discard(client)
+            task.setFailed('Certificate validation failure', commit=False)
 
             self._miscDb.addNotification(
                 models.NotificationCategory.UPLOAD,
@@ -493,8 +610,8 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.TransferFailure as e:
             logger.error('Tranfer failure: %s', e)
-            client.close()
-            task.setFailed('Tranfer failure')
+            self._pool.discard(client)
+            task.setFailed('Tranfer failure', commit=False)
 
             self._miscDb.addNotification(
                 models.NotificationCategory.UPLOAD,
@@ -506,8 +623,8 @@ class FileUploader(Thread):
             return
         except filetransfer.exceptions.PermissionFailure as e:
             logger.error('Permission failure: %s', e)
-            client.close()
-            task.setFailed('Permission failure')
+            self._pool.discard(client)
+            task.setFailed('Permission failure', commit=False)
 
             self._miscDb.addNotification(
                 models.NotificationCategory.UPLOAD,
@@ -519,24 +636,25 @@ class FileUploader(Thread):
             return
 
 
-        # close file transfer client
-        client.close()
+        # return file transfer client to the pool
+        self._pool.release(client)
 
         upload_elapsed_s = time.time() - start
         logger.info('Upload transaction completed in %0.4f s', upload_elapsed_s)
 
 
-        task.setSuccess('File uploaded')
+        task.setSuccess('File uploaded', commit=False)
 
 
         if entry and action == constants.TRANSFER_UPLOAD:
             entry.uploaded = True
-            db.session.commit()
 
 
         if entry and action == constants.TRANSFER_S3:
+            if isinstance(entry, models.IndiAllSkyDbImageTable) and not (entry.remote_url or entry.s3_key):
+                models.IndiAllSkyDbImageCalendarTable.addRemote(entry)
+
             entry.s3_key = str(s3_key)
-            db.session.commit()
 
             # perform syncapi after s3 (if enabled)
             metadata['s3_key'] = str(s3_key)
@@ -545,7 +663,6 @@ class FileUploader(Thread):
 
         if entry and action == constants.TRANSFER_SYNC_V1:
             entry.sync_id = response['id']
-            db.session.commit()
 
 
         if entry and action == constants.TRANSFER_YOUTUBE:
@@ -557,8 +674,6 @@ class FileUploader(Thread):
             data_dict['youtube_id'] = response['id']
             entry.data = data_dict
 
-            db.session.commit()
-
 
         if remove_local:
             try:
@@ -574,6 +689,155 @@ class FileUploader(Thread):
         #raise Exception('Testing uncaught exception')
 
 
+    def _groupSyncTasks(self, task_list):
+        ### syncapi assets for the same camera are uploaded in a single request
+        single_task_list = list()
+        sync_task_dict = dict()
+
+        for task in task_list:
+            if task.data['action'] != constants.TRANSFER_SYNC_V1:
+                single_task_list.append(task)
+                continue
+
+            metadata = task.data.get('metadata')
+            if not task.data.get('model') or metadata['type'] == constants.CAMERA:
+                single_task_list.append(task)
+                continue
+
+            sync_task_dict.setdefault(metadata['camera_uuid'], []).append(task)
+
+
+        sync_batch_list = list()
+        for sync_task_list in sync_task_dict.values():
+            if len(sync_task_list) == 1:
+                single_task_list.extend(sync_task_list)
+                continue
+
+            sync_batch_list.append(sync_task_list)
+
+
+        return single_task_list, sync_batch_list
+
+
+    def processSyncBatch(self, task_list):
+        asset_list = list()
+        task_entry_list = list()
+
+        for task in task_list:
+            entry_model = task.data['model']
+            entry_id = task.data['id']
+
+            try:
+                _model = getattr(models, entry_model)
+            except AttributeError:
+                logger.error('Model not found: %s', entry_model)
+                task.setFailed('Model not found: {0:s}'.format(entry_model), commit=False)
+                continue
+
+            try:
+                entry = _model.query\
+                    .filter(_model.id == entry_id)\
+                    .one()
+            except NoResultFound:
+                logger.error('ID %d not found in %s', entry_id, entry_model)
+                task.setFailed('ID {0:d} not found in {1:s}'.format(entry_id, entry_model), commit=False)
+                continue
+
+
+            asset_list.append({
+                'metadata'   : task.data['metadata'],
+                'local_file' : Path(entry.getFilesystemPath()),
+            })
+            task_entry_list.append((task, entry))
+
+
+        if not asset_list:
+            return
+
+
+        connect_kwargs = {
+            'hostname'     : '{0:s}/{1:s}'.format(self.config['SYNCAPI']['BASEURL'], constants.ENDPOINT_V1_BATCH),
+            'username'     : self.config['SYNCAPI']['USERNAME'],
+            'apikey'       : self.config['SYNCAPI']['APIKEY'],
+            'cert_bypass'  : self.config['SYNCAPI']['CERT_BYPASS'],
+        }
+
+        put_kwargs = {
+            'metadata'      : {
+                'camera_uuid' : asset_list[0]['metadata']['camera_uuid'],
+                'utc_offset'  : asset_list[0]['metadata']['utc_offset'],
+            },
+            'asset_list'    : asset_list,
+            'empty_file'    : self.config.get('SYNCAPI', {}).get('EMPTY_FILE'),
+        }
+
+
+        client = filetransfer.requests_syncapi_v1(self.config)
+        client.connect_timeout = self.config.get('SYNCAPI', {}).get('CONNECT_TIMEOUT', 10.0)
+        client.timeout = self.config.get('SYNCAPI', {}).get('TIMEOUT', 60.0)
+
+
+        start = time.time()
+
+        try:
+            client = self._pool.connect(client, connect_kwargs)
+            response = client.put_batch(**put_kwargs)
+        except (
+            filetransfer.exceptions.ConnectionFailure,
+            filetransfer.exceptions.AuthenticationFailure,
+            filetransfer.exceptions.CertificateValidationFailure,
+            filetransfer.exceptions.TransferFailure,
+        ) as e:
+            logger.error('Sync batch failure: %s', e)
+            self._pool.discard(client)
+
+            for task, entry in task_entry_list:
+                task.setFailed('Sync batch failure', commit=False)
+
+            self._miscDb.addNotification(
+                models.NotificationCategory.UPLOAD,
+                'syncapi_batch',
+                'SyncAPI batch transfer failed: {0:s}'.format(str(e)),
+                expire=timedelta(hours=1),
+            )
+
+            return
+
+
+        # return file transfer client to the pool
+        self._pool.release(client)
+
+        upload_elapsed_s = time.time() - start
+        logger.info('Sync batch of %d assets completed in %0.4f s', len(response['assets']), upload_elapsed_s)
+
+
+        # assets are returned in the order they were sent, assets that could not be read were not sent
+        response_iter = iter(response['assets'])
+
+        for (task, entry), asset in zip(task_entry_list, asset_list):
+            if asset.get('error'):
+                task.setFailed('Unable to read file: {0:s}'.format(asset['error']), commit=False)
+                continue
+
+
+            asset_response = next(response_iter)
+
+            if asset_response.get('error'):
+                logger.error('Sync failure for %s %d: %s', task.data['model'], task.data['id'], asset_response['error'])
+                task.setFailed('Sync failure: {0:s}'.format(asset_response['error']), commit=False)
+                continue
+
+
+            task.setSuccess('File uploaded', commit=False)
+            entry.sync_id = asset_response['id']
+
+
+    def _updatePoolStats(self):
+        self._pool_stats_time = time.time()
+
+        self._miscDb.setState('UPLOAD_POOL_STATS_{0:s}'.format(self.name), json.dumps(self._pool.stats))
+
+
     def _syncapi(self, asset_entry, metadata):
         ### sync camera
         if not self.config.get('SYNCAPI', {}).get('ENABLE'):
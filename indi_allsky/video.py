@@ -22,8 +22,7 @@ import ephem
 from . import constants
 
 from .timelapse import TimelapseGenerator
-from .keogram import KeogramGenerator
-from .starTrails import StarTrailGenerator
+from .accumulator import IndiAllskyAccumulator
 from .miscUpload import miscUpload
 from .aurora import IndiAllskyAuroraUpdate
 from .smoke import IndiAllskySmokeUpdate
@@ -40,6 +39,7 @@ from .flask.models import NotificationCategory
 
 from .flask.models import IndiAllSkyDbCameraTable
 from .flask.models import IndiAllSkyDbImageTable
+from .flask.models import IndiAllSkyDbImageCalendarTable
 from .flask.models import IndiAllSkyDbVideoTable
 from .flask.models import IndiAllSkyDbKeogramTable
 from .flask.models import IndiAllSkyDbStarTrailsTable
@@ -792,166 +792,181 @@ class VideoWorker(Process):
 
         processing_start = time.time()
 
-        kg = KeogramGenerator(
-            self.config,
-        )
-        kg.angle = self.config['KEOGRAM_ANGLE']
-        kg.h_scale_factor = self.config['KEOGRAM_H_SCALE']
-        kg.v_scale_factor = self.config['KEOGRAM_V_SCALE']
-        kg.crop_top = self.config.get('KEOGRAM_CROP_TOP', 0)
-        kg.crop_bottom = self.config.get('KEOGRAM_CROP_BOTTOM', 0)
+        accumulator = IndiAllskyAccumulator(self.config, self.bin_v, mask=self._detection_mask)
 
+        kg = accumulator.buildKeogramGenerator()
+        kg.expected_frames = image_count  # preallocate keogram buffer
 
-        keogram_metadata = {
-            'type'       : constants.KEOGRAM,
-            'createDate' : now.timestamp(),
-            'utc_offset' : now.astimezone().utcoffset().total_seconds(),
-            'dayDate'    : d_dayDate.strftime('%Y%m%d'),
-            'night'      : night,
-            'camera_uuid': camera.uuid,
-            #'height'  # added later
-            #'width'   # added later
-        }
-
-        keogram_metadata['data'] = {
-            'max_kpindex'       : max_kpindex,
-            'max_ovation_max'   : max_ovation_max,
-            'max_smoke_rating'  : max_smoke_rating,
-            'avg_stars'         : avg_stars,
-            'max_moonphase'     : max_moonphase,
-            'avg_sqm'           : avg_sqm,
-        }
 
+        try:
+            keogram_metadata = {
+                'type'       : constants.KEOGRAM,
+                'createDate' : now.timestamp(),
+                'utc_offset' : now.astimezone().utcoffset().total_seconds(),
+                'dayDate'    : d_dayDate.strftime('%Y%m%d'),
+                'night'      : night,
+                'camera_uuid': camera.uuid,
+                #'height'  # added later
+                #'width'   # added later
+            }
 
-        startrail_metadata = {
-            'type'       : constants.STARTRAIL,
-            'createDate' : now.timestamp(),
-            'utc_offset' : now.astimezone().utcoffset().total_seconds(),
-            'dayDate'    : d_dayDate.strftime('%Y%m%d'),
-            'night'      : night,
-            'camera_uuid': camera.uuid,
-            #'height'  # added later
-            #'width'   # added later
-        }
+            keogram_metadata['data'] = {
+                'max_kpindex'       : max_kpindex,
+                'max_ovation_max'   : max_ovation_max,
+                'max_smoke_rating'  : max_smoke_rating,
+                'avg_stars'         : avg_stars,
+                'max_moonphase'     : max_moonphase,
+                'avg_sqm'           : avg_sqm,
+            }
 
-        startrail_metadata['data'] = {
-            'max_kpindex'       : max_kpindex,
-            'max_ovation_max'   : max_ovation_max,
-            'max_smoke_rating'  : max_smoke_rating,
-            'avg_stars'         : avg_stars,
-            'max_moonphase'     : max_moonphase,
-            'avg_sqm'           : avg_sqm,
-        }
 
+            startrail_metadata = {
+                'type'       : constants.STARTRAIL,
+                'createDate' : now.timestamp(),
+                'utc_offset' : now.astimezone().utcoffset().total_seconds(),
+                'dayDate'    : d_dayDate.strftime('%Y%m%d'),
+                'night'      : night,
+                'camera_uuid': camera.uuid,
+                #'height'  # added later
+                #'width'   # added later
+            }
 
-        startrail_video_metadata = {
-            'type'       : constants.STARTRAIL_VIDEO,
-            'createDate' : now.timestamp(),
-            'utc_offset' : now.astimezone().utcoffset().total_seconds(),
-            'dayDate'    : d_dayDate.strftime('%Y%m%d'),
-            'night'      : night,
-            'camera_uuid': camera.uuid,
-        }
+            startrail_metadata['data'] = {
+                'max_kpindex'       : max_kpindex,
+                'max_ovation_max'   : max_ovation_max,
+                'max_smoke_rating'  : max_smoke_rating,
+                'avg_stars'         : avg_stars,
+                'max_moonphase'     : max_moonphase,
+                'avg_sqm'           : avg_sqm,
+            }
 
-        startrail_video_metadata['data'] = {
-            'max_kpindex'       : max_kpindex,
-            'max_ovation_max'   : max_ovation_max,
-            'max_smoke_rating'  : max_smoke_rating,
-            'max_stars'         : avg_stars,
-            'max_moonphase'     : max_moonphase,
-            'max_sqm'           : avg_sqm,
-        }
 
+            startrail_video_metadata = {
+                'type'       : constants.STARTRAIL_VIDEO,
+                'createDate' : now.timestamp(),
+                'utc_offset' : now.astimezone().utcoffset().total_seconds(),
+                'dayDate'    : d_dayDate.strftime('%Y%m%d'),
+                'night'      : night,
+                'camera_uuid': camera.uuid,
+            }
 
-        # Add DB entries before creating files
-        keogram_entry = self._miscDb.addKeogram(
-            keogram_file.relative_to(self.image_dir),
-            camera.id,
-            keogram_metadata,
-        )
+            startrail_video_metadata['data'] = {
+                'max_kpindex'       : max_kpindex,
+                'max_ovation_max'   : max_ovation_max,
+                'max_smoke_rating'  : max_smoke_rating,
+                'max_stars'         : avg_stars,
+                'max_moonphase'     : max_moonphase,
+                'max_sqm'           : avg_sqm,
+            }
 
 
-        if night:
-            startrail_entry = self._miscDb.addStarTrail(
-                startrail_file.relative_to(self.image_dir),
+            # Add DB entries before creating files
+            keogram_entry = self._miscDb.addKeogram(
+                keogram_file.relative_to(self.image_dir),
                 camera.id,
-                startrail_metadata,
+                keogram_metadata,
             )
-        else:
-            startrail_entry = None
-            startrail_video_entry = None
 
 
-        stg = StarTrailGenerator(
-            self.config,
-            self.bin_v,
-            mask=self._detection_mask,
-        )
-        stg.max_adu = self.config['STARTRAILS_MAX_ADU']
-        stg.mask_threshold = self.config['STARTRAILS_MASK_THOLD']
-        stg.pixel_cutoff_threshold = self.config['STARTRAILS_PIXEL_THOLD']
-        stg.min_stars = self.config.get('STARTRAILS_MIN_STARS', 0)
-        stg.latitude = camera.latitude
-        stg.longitude = camera.longitude
-        stg.sun_alt_threshold = self.config['STARTRAILS_SUN_ALT_THOLD']
-
-        if self.config['STARTRAILS_MOONMODE_THOLD']:
-            stg.moonmode_alt = self.config['NIGHT_MOONMODE_ALT_DEG']
-            stg.moonmode_phase = self.config['NIGHT_MOONMODE_PHASE']
-        else:
-            stg.moon_alt_threshold = self.config['STARTRAILS_MOON_ALT_THOLD']
-            stg.moon_phase_threshold = self.config['STARTRAILS_MOON_PHASE_THOLD']
+            if night:
+                startrail_entry = self._miscDb.addStarTrail(
+                    startrail_file.relative_to(self.image_dir),
+                    camera.id,
+                    startrail_metadata,
+                )
+            else:
+                startrail_entry = None
+                startrail_video_entry = None
 
-        if self.config.get('STARTRAILS_USE_DB_DATA', True):
-            logger.warning('Re-using image data for ADU and Star counts')
-        else:
-            logger.warning('Recalculating values for ADU and Star counts')
 
-        # Files are presorted from the DB
-        for i, entry in enumerate(files_entries):
-            if i % 100 == 0:
-                logger.info('Processed %d of %d images', i, image_count)
+            # use the incremental checkpoint from the image worker if it is usable
+            accum_image_id_list = None
+            if self.config.get('KEOGRAM_STARTRAILS_INCREMENTAL'):
+                accum_image_id_list = accumulator.getImageIds(camera.id, d_dayDate, night)
 
-            image_file_p = Path(entry.getFilesystemPath())
+                if accum_image_id_list:
+                    entry_id_list = [x.id for x in files_entries.with_entities(IndiAllSkyDbImageTable.id)]
 
-            if not image_file_p.exists():
-                logger.error('File not found: %s', image_file_p)
-                continue
+                    if entry_id_list[:len(accum_image_id_list)] != accum_image_id_list:
+                        # images were excluded or missed after a restart
+                        logger.warning('Keogram/star trail checkpoint does not match images, processing all images')
+                        accum_image_id_list = None
+                else:
+                    logger.warning('No keogram/star trail checkpoint found, processing all images')
 
-            if image_file_p.stat().st_size == 0:
-                continue
 
+            if accum_image_id_list:
+                if night:
+                    stg = accumulator.buildStarTrailGenerator(camera, timelapse_dir=accumulator.getTimelapseFolder(camera.id, d_dayDate, night))
+                    accumulator.restore(camera.id, d_dayDate, night, kg, stg)
+                else:
+                    stg = accumulator.buildStarTrailGenerator(camera)
+                    accumulator.restore(camera.id, d_dayDate, night, kg, None)
 
-            #logger.info('Reading file: %s', p_entry)
-            if image_file_p.suffix in ('.png',):
-                # opencv is faster than Pillow with PNG
-                image_data = cv2.imread(str(image_file_p), cv2.IMREAD_COLOR)
+                accum_image_id_set = set(accum_image_id_list)
+                logger.warning('Using keogram/star trail checkpoint with %d of %d images', len(accum_image_id_set), image_count)
+            else:
+                stg = accumulator.buildStarTrailGenerator(camera)
+                accum_image_id_set = set()
 
-                if isinstance(image_data, type(None)):
-                    logger.error('Unable to read %s', image_file_p)
-                    continue
+
+            if self.config.get('STARTRAILS_USE_DB_DATA', True):
+                logger.warning('Re-using image data for ADU and Star counts')
             else:
-                try:
-                    with Image.open(str(image_file_p)) as img:
-                        image_data = cv2.cvtColor(numpy.array(img), cv2.COLOR_RGB2BGR)
-                except PIL.UnidentifiedImageError:
-                    logger.error('Unable to read %s', image_file_p)
+                logger.warning('Recalculating values for ADU and Star counts')
+
+            # Files are presorted from the DB
+            for i, entry in enumerate(files_entries):
+                if i % 100 == 0:
+                    logger.info('Processed %d of %d images', i, image_count)
+
+                if entry.id in accum_image_id_set:
+                    # already included in the checkpoint
                     continue
 
+                image_file_p = Path(entry.getFilesystemPath())
 
-            kg.processImage(image_file_p, image_data)
+                if not image_file_p.exists():
+                    logger.error('File not found: %s', image_file_p)
+                    continue
 
-            if night:
-                if self.config.get('STARTRAILS_USE_DB_DATA', True):
-                    adu = entry.adu
-                    star_count = entry.stars  # can be None
+                if image_file_p.stat().st_size == 0:
+                    continue
+
+
+                #logger.info('Reading file: %s', p_entry)
+                if image_file_p.suffix in ('.png',):
+                    # opencv is faster than Pillow with PNG
+                    image_data = cv2.imread(str(image_file_p), cv2.IMREAD_COLOR)
+
+                    if isinstance(image_data, type(None)):
+                        logger.error('Unable to read %s', image_file_p)
+                        continue
                 else:
-                    adu, star_count = None, None
+                    try:
+                        with Image.open(str(image_file_p)) as img:
+                            image_data = cv2.cvtColor(numpy.array(img), cv2.COLOR_RGB2BGR)
+                    except PIL.UnidentifiedImageError:
+                        logger.error('Unable to read %s', image_file_p)
+                        continue
+
+
+                kg.processImage(image_file_p, image_data)
 
-                stg.processImage(image_file_p, image_data, adu=adu, star_count=star_count)
+                if night:
+                    if self.config.get('STARTRAILS_USE_DB_DATA', True):
+                        adu = entry.adu
+                        star_count = entry.stars  # can be None
+                    else:
+                        adu, star_count = None, None
 
+                    stg.processImage(image_file_p, image_data, adu=adu, star_count=star_count)
 
-        kg.finalize(keogram_file, camera)
+
+            kg.finalize(keogram_file, camera)
+        finally:
+            # remove the memmap buffer even when generation fails
+            kg.cleanup()
 
 
         # add height and width
@@ -1421,6 +1436,9 @@ class VideoWorker(Process):
                 logger.error('Cannot remove file: %s', str(e))
                 continue
 
+            if isinstance(entry, IndiAllSkyDbImageTable):
+                IndiAllSkyDbImageCalendarTable.removeImage(entry)
+
             db.session.delete(entry)
             db.session.commit()
 
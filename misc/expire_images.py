@@ -16,6 +16,7 @@ sys.path.append(str(Path(__file__).parent.absolute().parent))
 
 
 from indi_allsky.flask.models import IndiAllSkyDbImageTable
+from indi_allsky.flask.models import IndiAllSkyDbImageCalendarTable
 from indi_allsky.flask.models import IndiAllSkyDbVideoTable
 from indi_allsky.flask.models import IndiAllSkyDbKeogramTable
 from indi_allsky.flask.models import IndiAllSkyDbStarTrailsTable
@@ -253,6 +254,9 @@ class ExpireImages(object):
                 logger.error('Cannot remove file: %s', str(e))
                 continue
 
+            if isinstance(entry, IndiAllSkyDbImageTable):
+                IndiAllSkyDbImageCalendarTable.removeImage(entry)
+
             db.session.delete(entry)
             db.session.commit()
 
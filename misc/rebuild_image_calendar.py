@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+###
+### Rebuild the image calendar table used for the image viewer and gallery date pickers
+###
+### The calendar is maintained when images are added and removed, this only needs to be run
+### once to backfill existing images, or if the counts become inaccurate
+###
+
+import sys
+import argparse
+import time
+from pathlib import Path
+import logging
+
+from sqlalchemy import extract
+from sqlalchemy import func
+from sqlalchemy import case
+from sqlalchemy import and_
+from sqlalchemy import or_
+from sqlalchemy.sql.expression import null as sa_null
+
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+
+from indi_allsky.flask.models import IndiAllSkyDbImageTable
+from indi_allsky.flask.models import IndiAllSkyDbImageCalendarTable
+
+from indi_allsky.flask import db
+from indi_allsky.flask import create_app
+
+
+logger = logging.getLogger('indi_allsky')
+logger.setLevel(logging.INFO)
+
+
+# setup flask context for db access
+app = create_app()
+app.app_context().push()
+
+
+LOG_FORMATTER_STREAM = logging.Formatter('[%(levelname)s]: %(message)s')
+
+LOG_HANDLER_STREAM = logging.StreamHandler()
+LOG_HANDLER_STREAM.setFormatter(LOG_FORMATTER_STREAM)
+
+logger.handlers.clear()  # remove syslog
+logger.addHandler(LOG_HANDLER_STREAM)
+
+
+
+class RebuildImageCalendar(object):
+
+    def __init__(self):
+        self._missing = False
+
+
+    @property
+    def missing(self):
+        return self._missing
+
+    @missing.setter
+    def missing(self, new_missing):
+        self._missing = bool(new_missing)
+
+
+    def main(self):
+        calendar_count = IndiAllSkyDbImageCalendarTable.query.count()
+
+        if self.missing:
+            # images added before the calendar existed, or by an older version, are not counted
+            image_total = IndiAllSkyDbImageTable.query.count()
+
+            calendar_total = db.session.query(
+                func.sum(IndiAllSkyDbImageCalendarTable.image_count),
+            )\
+                .scalar()
+
+            if int(calendar_total or 0) == image_total:
+                logger.info('Image calendar covers all %d images', image_total)
+                return
+
+            logger.warning('Image calendar covers %d of %d images', int(calendar_total or 0), image_total)
+
+
+        start = time.time()
+
+        createDate_year = extract('year', IndiAllSkyDbImageTable.createDate).label('createDate_year')
+        createDate_month = extract('month', IndiAllSkyDbImageTable.createDate).label('createDate_month')
+        createDate_day = extract('day', IndiAllSkyDbImageTable.createDate).label('createDate_day')
+        createDate_hour = extract('hour', IndiAllSkyDbImageTable.createDate).label('createDate_hour')
+
+        remote = or_(
+            IndiAllSkyDbImageTable.remote_url != sa_null(),
+            IndiAllSkyDbImageTable.s3_key != sa_null(),
+        )
+        detection = IndiAllSkyDbImageTable.detections > 0
+
+        hours_query = db.session.query(
+            IndiAllSkyDbImageTable.camera_id,
+            createDate_year,
+            createDate_month,
+            createDate_day,
+            createDate_hour,
+            func.count(IndiAllSkyDbImageTable.id).label('image_count'),
+            func.sum(case((detection, 1), else_=0)).label('detection_count'),
+            func.sum(case((remote, 1), else_=0)).label('remote_count'),
+            func.sum(case((and_(remote, detection), 1), else_=0)).label('remote_detection_count'),
+        )\
+            .group_by(
+                IndiAllSkyDbImageTable.camera_id,
+                createDate_year,
+                createDate_month,
+                createDate_day,
+                createDate_hour,
+            )
+
+
+        logger.warning('Removing %d image calendar entries', calendar_count)
+        IndiAllSkyDbImageCalendarTable.query.delete()
+
+
+        hour_count = 0
+        image_count = 0
+        for h in hours_query:
+            calendar = IndiAllSkyDbImageCalendarTable(
+                camera_id=h.camera_id,
+                year=int(h.createDate_year),
+                month=int(h.createDate_month),
+                day=int(h.createDate_day),
+                hour=int(h.createDate_hour),
+                image_count=int(h.image_count),
+                detection_count=int(h.detection_count),
+                remote_count=int(h.remote_count),
+                remote_detection_count=int(h.remote_detection_count),
+            )
+
+            db.session.add(calendar)
+
+            hour_count += 1
+            image_count += int(h.image_count)
+
+
+        # single transaction, the pickers never see a partial calendar
+        db.session.commit()
+
+
+        elapsed_s = time.time() - start
+        logger.info('Indexed %d images in %d hours in %0.4f s', image_count, hour_count, elapsed_s)
+
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        '--missing',
+        help='only rebuild the calendar if images are not covered by it',
+        dest='missing',
+        action='store_true',
+    )
+    argparser.set_defaults(missing=False)
+
+
+    args = argparser.parse_args()
+
+
+    ric = RebuildImageCalendar()
+    ric.missing = args.missing
+
+    ric.main()
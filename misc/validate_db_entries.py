@@ -19,6 +19,7 @@ app.app_context().push()
 
 from indi_allsky.flask import db
 from indi_allsky.flask.models import IndiAllSkyDbImageTable
+from indi_allsky.flask.models import IndiAllSkyDbImageCalendarTable
 from indi_allsky.flask.models import IndiAllSkyDbRawImageTable
 from indi_allsky.flask.models import IndiAllSkyDbFitsImageTable
 from indi_allsky.flask.models import IndiAllSkyDbBadPixelMapTable
@@ -261,6 +262,7 @@ class ValidateDatabaseEntries(object):
         ### DELETE ###
         if len(image_notfound_list):
             logger.warning('Removing %d missing image entries', len(image_notfound_list))
+            [IndiAllSkyDbImageCalendarTable.removeImage(i) for i in image_notfound_list]
             [db.session.delete(i) for i in image_notfound_list]
 
 
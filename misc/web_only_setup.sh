@@ -923,6 +923,9 @@ fi
 flask db revision --autogenerate
 flask db upgrade head
 
+# backfill the image calendar for existing images
+"${ALLSKY_DIRECTORY}/misc/rebuild_image_calendar.py" --missing
+
 
 sudo chmod 664 "${DB_FILE}"
 sudo chown "$USER":"$PGRP" "${DB_FILE}"
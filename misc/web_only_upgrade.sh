@@ -238,6 +238,9 @@ pip3 install -r "${ALLSKY_DIRECTORY}/${VIRTUALENV_REQ}"
 flask db revision --autogenerate
 flask db upgrade head
 
+# backfill the image calendar for existing images
+"${ALLSKY_DIRECTORY}/misc/rebuild_image_calendar.py" --missing
+
 
 # dump config for processing
 TMP_CONFIG_DUMP=$(mktemp --suffix=.json)
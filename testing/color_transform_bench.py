@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+### Compare the per-step white balance and saturation with the fused color transform
+
+import sys
+import time
+from pathlib import Path
+import cv2
+import numpy
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.colorTransform import IndiAllskyColorTransform
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class ColorTransformBench(object):
+    rounds = 20
+
+    resolution_list = [
+        (1920, 1080),  # 1080p
+        (3840, 2160),  # 4k
+    ]
+
+    config_list = [
+        {
+            'WBB_FACTOR' : 1.1,
+            'WBG_FACTOR' : 0.9,
+            'WBR_FACTOR' : 1.2,
+            'AUTO_WB'    : False,
+            'SATURATION_FACTOR' : 1.0,
+        },
+        {
+            'WBB_FACTOR' : 1.1,
+            'WBG_FACTOR' : 0.9,
+            'WBR_FACTOR' : 1.2,
+            'AUTO_WB'    : True,
+            'SATURATION_FACTOR' : 1.0,
+        },
+        {
+            'WBB_FACTOR' : 1.1,
+            'WBG_FACTOR' : 0.9,
+            'WBR_FACTOR' : 1.2,
+            'AUTO_WB'    : True,
+            'SATURATION_FACTOR' : 1.3,
+        },
+    ]
+
+
+    def main(self):
+        logging.getLogger('indi_allsky').setLevel(logging.WARNING)
+
+        for width, height in self.resolution_list:
+            image = numpy.random.randint(255, size=(height, width, 3), dtype=numpy.uint8)
+
+            for config in self.config_list:
+                color_transform = IndiAllskyColorTransform(config)
+
+                step_start = time.time()
+                for x in range(self.rounds):
+                    step_image = self.perStep(config, image)
+                step_elapsed_s = (time.time() - step_start) / self.rounds
+
+
+                fused_start = time.time()
+                for x in range(self.rounds):
+                    fused_image = color_transform.apply(image)
+                fused_elapsed_s = (time.time() - fused_start) / self.rounds
+
+
+                diff = cv2.absdiff(step_image, fused_image)
+
+                logger.info(
+                    '%dx%d auto wb: %s, saturation: %0.1f - per-step: %0.4f s, fused: %0.4f s (%0.1fx), mean diff: %0.2f, max diff: %d',
+                    width,
+                    height,
+                    str(config['AUTO_WB']),
+                    config['SATURATION_FACTOR'],
+                    step_elapsed_s,
+                    fused_elapsed_s,
+                    step_elapsed_s / fused_elapsed_s,
+                    cv2.mean(diff)[0],
+                    int(diff.max()),
+                )
+
+
+    def perStep(self, config, image):
+        ### same as the ImageProcessor reference methods
+        b, g, r = cv2.split(image)
+        b = cv2.multiply(b, config['WBB_FACTOR'])
+        g = cv2.multiply(g, config['WBG_FACTOR'])
+        r = cv2.multiply(r, config['WBR_FACTOR'])
+        image = cv2.merge([b, g, r])
+
+
+        if config['AUTO_WB']:
+            b, g, r = cv2.split(image)
+            b_avg = cv2.mean(b)[0]
+            g_avg = cv2.mean(g)[0]
+            r_avg = cv2.mean(r)[0]
+
+            k = (b_avg + g_avg + r_avg) / 3
+
+            b = cv2.addWeighted(src1=b, alpha=k / b_avg, src2=0, beta=0, gamma=0)
+            g = cv2.addWeighted(src1=g, alpha=k / g_avg, src2=0, beta=0, gamma=0)
+            r = cv2.addWeighted(src1=r, alpha=k / r_avg, src2=0, beta=0, gamma=0)
+
+            image = cv2.merge([b, g, r])
+
+
+        if config['SATURATION_FACTOR'] != 1.0:
+            image_hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            image_hsv[:, :, 1] = cv2.multiply(image_hsv[:, :, 1], config['SATURATION_FACTOR'])
+            image = cv2.cvtColor(image_hsv, cv2.COLOR_HSV2BGR)
+
+
+        return image
+
+
+if __name__ == "__main__":
+    ColorTransformBench().main()
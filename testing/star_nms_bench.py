@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+### Compare the star detection point suppression with the original nested loop
+
+import sys
+import time
+from pathlib import Path
+import cv2
+import numpy
+import logging
+
+sys.path.append(str(Path(__file__).parent.absolute().parent))
+
+from indi_allsky.stars import IndiAllSkyStars
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging
+
+
+class StarNmsBench(object):
+    rounds = 5
+
+    width = 3000
+    height = 2000
+
+    star_count_list = [100, 1000, 5000]
+
+
+    def __init__(self):
+        self.config = {
+            'IMAGE_FOLDER' : '/tmp',
+            'DETECT_STARS_THOLD' : 0.6,
+        }
+
+        self.stars = IndiAllSkyStars(self.config, None, mask=None)
+
+
+    def main(self):
+        for star_count in self.star_count_list:
+            image = self.starField(star_count)
+
+            result = cv2.matchTemplate(image, self.stars.star_template, cv2.TM_CCOEFF_NORMED)
+            result_filter = numpy.where(result >= self.config['DETECT_STARS_THOLD'])
+
+            logger.info('Stars: %d, Candidate points: %d', star_count, len(result_filter[0]))
+
+
+            loop_start = time.time()
+            for x in range(self.rounds):
+                loop_blobs = self.nestedLoop(result_filter)
+            loop_elapsed_s = (time.time() - loop_start) / self.rounds
+
+            logger.info('Nested loop: %0.4f s, %d blobs', loop_elapsed_s, len(loop_blobs))
+
+
+            grid_start = time.time()
+            for x in range(self.rounds):
+                grid_blobs = self.stars.suppressPoints(result_filter, result.shape[1])
+            grid_elapsed_s = (time.time() - grid_start) / self.rounds
+
+            logger.info('Row sweep: %0.4f s, %d blobs', grid_elapsed_s, len(grid_blobs))
+
+
+            loop_blobs = [(int(x), int(y)) for x, y in loop_blobs]
+            if loop_blobs != grid_blobs:
+                logger.error('Blob coordinates do not match')
+
+
+    def starField(self, star_count):
+        image = numpy.random.randint(20, size=(self.height, self.width), dtype=numpy.uint8)
+
+        x_array = numpy.random.randint(10, self.width - 10, size=star_count)
+        y_array = numpy.random.randint(10, self.height - 10, size=star_count)
+        radius_array = numpy.random.randint(1, 5, size=star_count)
+
+        for x, y, radius in zip(x_array, y_array, radius_array):
+            cv2.circle(
+                img=image,
+                center=(int(x), int(y)),
+                radius=int(radius),
+                color=(255),
+                thickness=cv2.FILLED,
+            )
+
+        return cv2.blur(src=image, ksize=(2, 2))
+
+
+    def nestedLoop(self, result_filter):
+        # original implementation
+        blobs = list()
+        for pt in zip(*result_filter[::-1]):
+            for blob in blobs:
+                if (abs(pt[0] - blob[0]) < self.stars._distanceThreshold) and (abs(pt[1] - blob[1]) < self.stars._distanceThreshold):
+                    break
+
+            else:
+                # if none of the points are under the distance threshold, then add it
+                blobs.append(pt)
+
+        return blobs
+
+
+if __name__ == "__main__":
+    b = StarNmsBench()
+    b.main()